@@ -0,0 +1,175 @@
+# Contains the quantized impact index that the BM25 model scores queries on.
+import numpy as np
+
+from catalog import StatisticsCatalog, term_frequencies
+
+# BM25 parameters.
+K1 = 1.2
+B = 0.75
+# Impacts are quantized to the integers 1 ... IMPACT_LEVELS (8 bits).
+IMPACT_LEVELS = 255
+# Relative change of the document count or the average document length after which all impacts are recomputed.
+# Below it, added documents are quantized with the statistics of the last build.
+REBUILD_DRIFT = 0.1
+
+
+class ImpactIndex(object):
+    """
+    Inverted index of precomputed, quantized BM25 impacts for score-at-a-time evaluation (see
+    ranking.score_at_a_time()). The BM25 score of every posting is computed from the statistics catalog of a term view
+    and linearly quantized to 8 bits with one scale for the whole index, so impacts of different terms can be compared
+    and added. The postings of a term are stored in impact order, as segments of rows that share one impact. The index
+    is built with the other indexes of the collection and stored next to them.
+    """
+
+    def __init__(self, statistics: StatisticsCatalog, build: bool = True):
+        """
+        Builds the index.
+        :param statistics: Catalog of the term view to index
+        :param build: Controls, whether the impacts are computed; load() fills them in from a file instead
+        """
+        self.statistics = statistics
+        self.segments = {}  # Maps term IDs to lists of (impact, rows) tuples, sorted by descending impact.
+        self.document_ids = statistics.document_ids  # Document of every row the impacts were computed for.
+        if build:
+            self.rebuild()
+
+    def bm25(self, terms: np.ndarray, tfs: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        Computes the BM25 scores of postings with the statistics of the last build, so that all impacts of the index
+        stay comparable. Terms that are new since then use their current document frequencies.
+        :param terms: Term IDs of the postings
+        :param tfs: Term frequencies of the postings
+        :param lengths: Lengths of the postings' documents
+        """
+        document_frequencies = self.statistics.document_frequencies[terms]
+        known = terms < len(self.document_frequencies)
+        document_frequencies[known] = self.document_frequencies[terms[known]]
+        idf = np.log((self.document_count - document_frequencies + 0.5) / (document_frequencies + 0.5) + 1)
+        normalization = K1 * (1 - B + B * lengths / max(self.average_length, 1.0))
+        return idf * tfs * (K1 + 1) / (tfs + normalization)
+
+    def quantize(self, scores: np.ndarray) -> np.ndarray:
+        return np.clip(np.ceil(scores * self.scale), 1, IMPACT_LEVELS).astype(np.int64)
+
+    def rebuild(self):
+        """
+        Recomputes and quantizes the impacts of all postings.
+        """
+        self.document_ids = self.statistics.document_ids
+        self.document_count = self.statistics.document_count
+        self.average_length = self.statistics.average_length
+        self.document_frequencies = self.statistics.document_frequencies.copy()
+        terms, rows, tfs = self.statistics.entries()
+        scores = self.bm25(terms, tfs, self.statistics.document_lengths[rows])
+        self.scale = IMPACT_LEVELS / scores.max() if len(scores) and scores.max() > 0 else 1.0
+        impacts = self.quantize(scores)
+
+        self.segments = {}
+        order = np.lexsort((rows, -impacts, terms))
+        terms, rows, impacts = terms[order], rows[order], impacts[order]
+        # Boundaries of runs of equal (term, impact).
+        starts = np.flatnonzero(np.r_[len(terms) > 0, (terms[1:] != terms[:-1]) | (impacts[1:] != impacts[:-1])])
+        ends = np.r_[starts[1:], len(terms)]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            self.segments.setdefault(int(terms[start]), []).append((int(impacts[start]), rows[start:end]))
+
+    def save(self, file_path: str):
+        """
+        Stores the impacts and the statistics they were computed with in a NumPy .npz file.
+        :param file_path: Path of the file
+        """
+        segments = [(term, impact, rows) for term, term_segments in self.segments.items()
+                    for impact, rows in term_segments]
+        with open(file_path, 'wb') as impact_file:
+            np.savez(impact_file, document_ids=self.document_ids,
+                     statistics=np.array([self.document_count, self.average_length, self.scale]),
+                     document_frequencies=self.document_frequencies,
+                     terms=np.array([term for term, _, _ in segments], dtype=np.int64),
+                     impacts=np.array([impact for _, impact, _ in segments], dtype=np.int64),
+                     ends=np.cumsum([len(rows) for _, _, rows in segments], dtype=np.int64),
+                     rows=np.concatenate([rows for _, _, rows in segments] or [np.zeros(0, dtype=np.int64)]))
+
+    @classmethod
+    def load(cls, file_path: str, statistics: StatisticsCatalog):
+        """
+        Loads an impact index that was stored with save().
+        :param file_path: Path of the file
+        :param statistics: Catalog of the term view
+        :return: The impact index
+        """
+        index = cls(statistics, build=False)
+        with np.load(file_path) as stored:
+            index.document_ids = stored['document_ids']
+            document_count, index.average_length, index.scale = stored['statistics'].tolist()
+            index.document_count = int(document_count)
+            index.document_frequencies = stored['document_frequencies']
+            rows, ends = stored['rows'], stored['ends'].tolist()
+            for term, impact, start, end in zip(stored['terms'].tolist(), stored['impacts'].tolist(), [0] + ends,
+                                                ends):
+                index.segments.setdefault(term, []).append((impact, rows[start:end]))
+        return index
+
+    def is_index_of_catalog(self) -> bool:
+        """
+        Checks whether the impacts were computed for the rows of the catalog.
+        """
+        return np.array_equal(self.document_ids, self.statistics.document_ids)
+
+    def drifted(self) -> bool:
+        """
+        Checks whether the collection changed too much since the last build to keep the quantized impacts.
+        """
+        return (abs(self.statistics.document_count - self.document_count) > REBUILD_DRIFT * self.document_count or
+                abs(self.statistics.average_length - self.average_length) > REBUILD_DRIFT * self.average_length)
+
+    def add_document(self, document_id: int, term_ids):
+        """
+        Adds the postings of a document that was added to the catalog. The index is rebuilt instead if the collection
+        drifted too far from the last build.
+        :param document_id: ID of the document
+        :param term_ids: Term ID array of the document
+        """
+        if self.drifted():
+            self.rebuild()
+            return
+        self.document_ids = self.statistics.document_ids
+        terms, rows, tfs = term_frequencies([term_ids], self.statistics.row_of(document_id))
+        impacts = self.quantize(self.bm25(terms, tfs, np.full(len(terms), len(term_ids))))
+        for term, row, impact in zip(terms.tolist(), rows.tolist(), impacts.tolist()):
+            term_segments = self.segments.setdefault(term, [])
+            position = 0
+            while position < len(term_segments) and term_segments[position][0] > impact:
+                position += 1
+            if position < len(term_segments) and term_segments[position][0] == impact:
+                term_segments[position] = (impact, np.append(term_segments[position][1], row))
+            else:
+                term_segments.insert(position, (impact, np.array([row], dtype=np.int64)))
+
+    def delete_document(self):
+        """
+        Accounts for a document that was deleted from the catalog. Its postings stay in the index; deleted rows are
+        skipped during evaluation.
+        """
+        if self.drifted():
+            self.rebuild()
+
+    def query_segments(self, query_weights: dict[int, int]) -> list[tuple]:
+        """
+        Collects the impact segments of the query terms.
+        :param query_weights: Dictionary that maps query term IDs to their frequencies in the query
+        :return: List of (impact * query term frequency, rows) tuples
+        """
+        return [(impact * weight, rows)
+                for term, weight in query_weights.items() for impact, rows in self.segments.get(term, ())]
+
+    def score(self, query_weights: dict[int, int]) -> np.ndarray:
+        """
+        Scores all documents for a query by adding up all impact segments of the query terms.
+        :param query_weights: Dictionary that maps query term IDs to their frequencies in the query
+        :return: Quantized score of every document, in the row order of the catalog
+        """
+        scores = np.zeros(self.statistics.row_count, dtype=np.int64)
+        for impact, rows in self.query_segments(query_weights):
+            scores[rows] += impact
+        return scores * self.statistics.live
@@ -0,0 +1,262 @@
+# Contains the statistics catalog that all ranking models read collection statistics from.
+import numpy as np
+
+# Number of term frequency blocks after which the blocks are merged into one.
+MAX_BLOCKS = 8
+
+
+def term_frequencies(term_lists, first_row: int = 0) -> tuple:
+    """
+    Counts the terms of several documents.
+    :param term_lists: Term ID arrays of the documents
+    :param first_row: Row of the first document
+    :return: Arrays of (term, row, term frequency) triplets, one triplet per distinct term of a document
+    """
+    term_parts, row_parts, tf_parts = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [
+        np.zeros(0, dtype=np.int64)]
+    for row, terms in enumerate(term_lists, first_row):
+        if len(terms):
+            terms_of_row, tfs = np.unique(np.asarray(terms, dtype=np.int64), return_counts=True)
+            term_parts.append(terms_of_row)
+            row_parts.append(np.full(len(terms_of_row), row, dtype=np.int64))
+            tf_parts.append(tfs)
+    return np.concatenate(term_parts), np.concatenate(row_parts), np.concatenate(tf_parts)
+
+
+def build_block(terms: np.ndarray, rows: np.ndarray, tfs: np.ndarray) -> tuple:
+    """
+    Builds a compressed sparse column (CSC) block of the term-document matrix: one column per term ID, one row per
+    document.
+    :return: Column pointers, rows and term frequencies of the block
+    """
+    order = np.lexsort((rows, terms))
+    terms, rows, tfs = terms[order], rows[order], tfs[order]
+    term_count = int(terms.max()) + 1 if len(terms) else 0
+    indptr = np.zeros(term_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=term_count), out=indptr[1:])
+    return indptr, rows, tfs
+
+
+class StatisticsCatalog(object):
+    """
+    Collection statistics of one term view (see indexing.VIEWS) of the live collection: number of documents, document
+    and collection frequencies of every term, document lengths and the Euclidean norms of the documents' TF-IDF
+    vectors. The term frequencies themselves are kept as a sparse term-document matrix in CSC blocks.
+    Adding documents appends a block and deleting documents masks their rows; all statistics are updated
+    incrementally, so reading them never costs more than the values that are read.
+    """
+
+    def __init__(self, document_ids=(), term_lists=()):
+        """
+        Builds the catalog of a collection.
+        :param document_ids: IDs of the documents
+        :param term_lists: Term ID arrays of the documents, in the same order
+        """
+        self.document_count = 0  # Number of live documents (N).
+        self.total_length = 0  # Number of terms in all live documents.
+        self.document_frequencies = np.zeros(0, dtype=np.int64)  # Per term ID.
+        self.collection_frequencies = np.zeros(0, dtype=np.int64)  # Per term ID.
+        # Per row. Rows are assigned in the order documents are added and are not reused after a deletion.
+        self.document_ids = np.zeros(0, dtype=np.int64)
+        self.live = np.zeros(0, dtype=bool)
+        self.document_lengths = np.zeros(0, dtype=np.int64)
+        # Per row: sums of tf², tf² * ln(df) and tf² * ln(df)² over the terms of the document. The squared norm of
+        # the TF-IDF vector follows from them for any N: sum(tf² * (ln N - ln df)²) = A * ln²N - 2 * B * ln N + C.
+        self._norm_sums = np.zeros((0, 3))
+        self._rows = {}  # Maps document IDs to rows.
+        self._blocks = []  # Term frequency blocks (see build_block()).
+        self.version = 0  # Incremented on every change, so that data derived from the catalog can be cached.
+        if len(document_ids):
+            self.add_documents(document_ids, term_lists)
+
+    @property
+    def row_count(self) -> int:
+        return len(self.document_ids)
+
+    @property
+    def average_length(self) -> float:
+        return self.total_length / self.document_count if self.document_count else 0.0
+
+    def row_of(self, document_id: int) -> int:
+        return self._rows[document_id]
+
+    def document_frequency(self, term: int) -> int:
+        return int(self.document_frequencies[term]) if 0 <= term < len(self.document_frequencies) else 0
+
+    def collection_frequency(self, term: int) -> int:
+        return int(self.collection_frequencies[term]) if 0 <= term < len(self.collection_frequencies) else 0
+
+    def idf(self, terms) -> np.ndarray:
+        """
+        Returns the inverse document frequencies ln(N / df) of terms (0 for terms that occur in no live document).
+        :param terms: Term IDs
+        """
+        terms = np.asarray(terms, dtype=np.int64)
+        known = (terms >= 0) & (terms < len(self.document_frequencies))
+        document_frequencies = np.zeros(len(terms), dtype=np.int64)
+        document_frequencies[known] = self.document_frequencies[terms[known]]
+        return np.log(self.document_count / np.maximum(document_frequencies, 1)) * (document_frequencies > 0)
+
+    def norms(self, rows) -> np.ndarray:
+        """
+        Returns the Euclidean norms of the TF-IDF vectors (tf * ln(N / df)) of documents.
+        :param rows: Rows of the documents
+        """
+        sums = self._norm_sums[rows]
+        log_count = np.log(self.document_count) if self.document_count else 0.0
+        return np.sqrt(np.maximum(sums[:, 0] * log_count ** 2 - 2 * sums[:, 1] * log_count + sums[:, 2], 0.0))
+
+    def column(self, term: int, blocks: list = None) -> tuple:
+        """
+        Returns the term frequencies of a term in all live documents that contain it.
+        :param term: The term ID
+        :param blocks: Blocks to read, all blocks by default
+        :return: Rows of the documents and the term frequencies in them
+        """
+        rows, tfs = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for indptr, block_rows, block_tfs in self._blocks if blocks is None else blocks:
+            if 0 <= term < len(indptr) - 1:
+                start, end = indptr[term], indptr[term + 1]
+                rows.append(block_rows[start:end])
+                tfs.append(block_tfs[start:end])
+        rows, tfs = np.concatenate(rows), np.concatenate(tfs)
+        live = self.live[rows]
+        return rows[live], tfs[live]
+
+    def _grow_terms(self, term_count: int):
+        if term_count > len(self.document_frequencies):
+            padding = np.zeros(term_count - len(self.document_frequencies), dtype=np.int64)
+            self.document_frequencies = np.concatenate([self.document_frequencies, padding])
+            self.collection_frequencies = np.concatenate([self.collection_frequencies, padding])
+
+    def _change_frequencies(self, terms: np.ndarray, tfs: np.ndarray, sign: int):
+        """
+        Adds or subtracts term occurrences and updates the norm sums of the other live documents that contain a term
+        whose document frequency changes.
+        """
+        changed_terms, changes = np.unique(terms, return_counts=True)
+        old_frequencies = self.document_frequencies[changed_terms]
+        new_frequencies = old_frequencies + sign * changes
+        for term, old_frequency, new_frequency in zip(changed_terms.tolist(), old_frequencies.tolist(),
+                                                      new_frequencies.tolist()):
+            if old_frequency > 0 and new_frequency > 0:
+                rows, column_tfs = self.column(term)
+                old_log, new_log = np.log(old_frequency), np.log(new_frequency)
+                squares = column_tfs.astype(np.float64) ** 2
+                np.add.at(self._norm_sums[:, 1], rows, squares * (new_log - old_log))
+                np.add.at(self._norm_sums[:, 2], rows, squares * (new_log ** 2 - old_log ** 2))
+        self.document_frequencies[changed_terms] = new_frequencies
+        np.add.at(self.collection_frequencies, terms, sign * tfs)
+
+    def _set_norm_sums(self, terms: np.ndarray, rows: np.ndarray, tfs: np.ndarray):
+        squares = tfs.astype(np.float64) ** 2
+        logs = np.log(np.maximum(self.document_frequencies[terms], 1))
+        self._norm_sums[rows] = 0.0
+        for i, values in enumerate((squares, squares * logs, squares * logs ** 2)):
+            self._norm_sums[:, i] += np.bincount(rows, weights=values, minlength=self.row_count)
+
+    def add_documents(self, document_ids, term_lists):
+        """
+        Adds documents to the catalog.
+        :param document_ids: IDs of the new documents
+        :param term_lists: Term ID arrays of the new documents, in the same order
+        """
+        term_lists = list(term_lists)
+        first_row = self.row_count
+        terms, rows, tfs = term_frequencies(term_lists, first_row)
+        lengths = np.array([len(term_list) for term_list in term_lists], dtype=np.int64)
+
+        self.document_ids = np.concatenate([self.document_ids, np.asarray(document_ids, dtype=np.int64)])
+        self.live = np.concatenate([self.live, np.ones(len(term_lists), dtype=bool)])
+        self.document_lengths = np.concatenate([self.document_lengths, lengths])
+        self._norm_sums = np.concatenate([self._norm_sums, np.zeros((len(term_lists), 3))])
+        for row, document_id in enumerate(document_ids, first_row):
+            self._rows[int(document_id)] = row
+        self.document_count += len(term_lists)
+        self.total_length += int(lengths.sum())
+
+        self._grow_terms(int(terms.max()) + 1 if len(terms) else 0)
+        self._change_frequencies(terms, tfs, 1)
+        self._blocks.append(build_block(terms, rows, tfs))
+        self._set_norm_sums(terms, rows, tfs)
+        self.version += 1
+        if len(self._blocks) > MAX_BLOCKS:
+            self.compact()
+
+    def delete_document(self, document_id: int, term_ids) -> bool:
+        """
+        Removes a document from the catalog.
+        :param document_id: ID of the document
+        :param term_ids: Term ID array of the document
+        :return: True if the document was live in the catalog
+        """
+        row = self._rows.pop(document_id, None)
+        if row is None:
+            return False
+        self.live[row] = False
+        self.document_count -= 1
+        self.total_length -= int(self.document_lengths[row])
+        terms, _, tfs = term_frequencies([term_ids])
+        self._change_frequencies(terms, tfs, -1)
+        self.version += 1
+        return True
+
+    def entries(self) -> tuple:
+        """
+        Returns all term frequencies of the live documents.
+        :return: Arrays of (term, row, term frequency) triplets
+        """
+        terms, rows, tfs = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for indptr, block_rows, block_tfs in self._blocks:
+            block_terms = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+            live = self.live[block_rows]
+            terms.append(block_terms[live])
+            rows.append(block_rows[live])
+            tfs.append(block_tfs[live])
+        return np.concatenate(terms), np.concatenate(rows), np.concatenate(tfs)
+
+    def compact(self):
+        """
+        Merges all term frequency blocks into one and drops the entries of deleted documents.
+        """
+        self._blocks = [build_block(*self.entries())]
+
+    def is_catalog_of(self, document_ids) -> bool:
+        """
+        Checks whether the catalog covers exactly the given documents.
+        """
+        return sorted(self._rows) == sorted(int(document_id) for document_id in document_ids)
+
+    def save(self, file_path: str):
+        """
+        Stores the catalog in a NumPy .npz file. The blocks are merged before.
+        :param file_path: Path of the file
+        """
+        self.compact()
+        indptr, rows, tfs = self._blocks[0]
+        with open(file_path, 'wb') as catalog_file:
+            np.savez(catalog_file, counts=np.array([self.document_count, self.total_length]),
+                     document_frequencies=self.document_frequencies,
+                     collection_frequencies=self.collection_frequencies, document_ids=self.document_ids,
+                     live=self.live, document_lengths=self.document_lengths, norm_sums=self._norm_sums,
+                     indptr=indptr, rows=rows, tfs=tfs)
+
+    @classmethod
+    def load(cls, file_path: str):
+        """
+        Loads a catalog that was stored with save().
+        :param file_path: Path of the file
+        :return: The catalog
+        """
+        catalog = cls()
+        with np.load(file_path) as stored:
+            catalog.document_count, catalog.total_length = (int(count) for count in stored['counts'])
+            catalog.document_frequencies = stored['document_frequencies']
+            catalog.collection_frequencies = stored['collection_frequencies']
+            catalog.document_ids = stored['document_ids']
+            catalog.live = stored['live']
+            catalog.document_lengths = stored['document_lengths']
+            catalog._norm_sums = stored['norm_sums']
+            catalog._blocks = [(stored['indptr'], stored['rows'], stored['tfs'])]
+        catalog._rows = {int(catalog.document_ids[row]): row for row in np.flatnonzero(catalog.live).tolist()}
+        return catalog
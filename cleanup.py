@@ -47,23 +47,32 @@ def is_stop_word(term: str, stop_word_list: list[str]) -> bool:
     return term.lower() in stop_word_list
 
 
-def remove_stop_words_from_term_list(term_list: list[str]) -> list[str]:
+def load_filter_stop_words() -> list[str]:
     """
-    Takes a list of terms and removes all terms that are stop words.
-    :param term_list: List that contains the terms
-    :return: List of terms without stop words
+    Loads the stop words that filter_collection() removes: the stop word list of the system if one was saved, otherwise
+    the English stop word list.
+    :return: List of stop words
     """
-    cleaned_term_list = []
     stop_word_file = os.path.join(DATA_PATH, 'stopwords.json') if os.path.exists(
         os.path.join(DATA_PATH, 'stopwords.json')) else os.path.join(RAW_DATA_PATH, 'englishST.txt')
     # reads stop word file
     if stop_word_file.split('.')[-1] == 'json':
         with open(stop_word_file, 'r') as file:
-            stop_words_list = json.load(file)
-    else:
-        with open(stop_word_file, 'r') as file:
-            file_lines = file.readlines()
-            stop_words_list = [word.strip() for word in file_lines]
+            return json.load(file)
+    with open(stop_word_file, 'r') as file:
+        return [word.strip() for word in file.readlines()]
+
+
+def remove_stop_words_from_term_list(term_list: list[str], stop_words_list=None) -> list[str]:
+    """
+    Takes a list of terms and removes all terms that are stop words.
+    :param term_list: List that contains the terms
+    :param stop_words_list: Stop words to remove, those of load_filter_stop_words() by default
+    :return: List of terms without stop words
+    """
+    cleaned_term_list = []
+    if stop_words_list is None:
+        stop_words_list = load_filter_stop_words()
 
     # removes stop words from the list
     for word in term_list:
@@ -81,9 +90,10 @@ def filter_collection(collection: list[Document]):
     Warning: The result is NOT saved in the documents term list, but in an extra field called filtered_terms.
     :param collection: Document collection to process
     """
+    stop_words = set(load_filter_stop_words())
     for doc in collection:
         # print(doc.filtered_terms)
-        doc.filtered_terms = remove_stop_words_from_term_list(doc.terms)
+        doc.filtered_terms = remove_stop_words_from_term_list(doc.terms, stop_words)
     # print("Going to print filtered terms")
     # print(collection[0].filtered_terms)
 # TEST
@@ -0,0 +1,283 @@
+# Contains cluster-based retrieval over the TF-IDF vectors of the documents.
+import math
+
+import numpy as np
+
+import ranking
+from catalog import StatisticsCatalog, term_frequencies
+
+# Maximum number of k-means iterations; clustering stops earlier when no document changes its cluster.
+MAX_ITERATIONS = 20
+# Number of highest-weighted terms kept per centroid. Truncated centroids keep the clustering and the query-centroid
+# matching linear in the number of document entries instead of in clusters * vocabulary.
+CENTROID_TERMS = 256
+
+
+def document_weights(statistics: StatisticsCatalog, terms: np.ndarray, rows: np.ndarray,
+                     tfs: np.ndarray) -> np.ndarray:
+    """
+    Computes normalized TF-IDF weights (see tfidf.TfIdfMatrix) of postings from the current statistics.
+    """
+    norms = statistics.norms(rows)
+    weights = tfs * statistics.idf(terms)
+    return np.divide(weights, norms, out=np.zeros_like(weights), where=norms > 0)
+
+
+class SparseCentroids(object):
+    """
+    Unit-length cluster centroids, truncated to their CENTROID_TERMS highest-weighted terms and stored as one sparse
+    term-cluster matrix: the non-zero entries sorted by term ID.
+    """
+
+    def __init__(self, cluster_count: int, terms: np.ndarray, clusters: np.ndarray, weights: np.ndarray):
+        """
+        :param cluster_count: Number of clusters
+        :param terms: Term IDs of the non-zero entries
+        :param clusters: Clusters of the entries
+        :param weights: Values of the entries
+        """
+        order = np.argsort(terms, kind='stable')
+        self.cluster_count = cluster_count
+        self.terms = np.asarray(terms, dtype=np.int64)[order]
+        self.clusters = np.asarray(clusters, dtype=np.int64)[order]
+        self.weights = np.asarray(weights, dtype=np.float64)[order]
+
+    def __len__(self):
+        return self.cluster_count
+
+    @classmethod
+    def of_clusters(cls, cluster_count: int, terms: np.ndarray, clusters: np.ndarray, weights: np.ndarray,
+                    term_limit: int = CENTROID_TERMS):
+        """
+        Computes the centroids of clustered sparse vectors: the entries are summed per (cluster, term), truncated to
+        the term_limit highest sums per cluster and normalized to unit length.
+        :param cluster_count: Number of clusters
+        :param terms: Term IDs of the non-zero vector entries
+        :param clusters: Clusters of the entries' vectors
+        :param weights: Values of the entries
+        :param term_limit: Number of terms kept per centroid
+        """
+        term_count = int(terms.max()) + 1 if len(terms) else 1
+        keys, inverse = np.unique(clusters * term_count + terms, return_inverse=True)
+        sums = np.bincount(inverse, weights=weights, minlength=len(keys))
+        centroid_clusters, centroid_terms = keys // term_count, keys % term_count
+        # Rank the entries of each cluster by descending weight and keep the first term_limit.
+        order = np.lexsort((-sums, centroid_clusters))
+        first_of_cluster = np.searchsorted(centroid_clusters[order], centroid_clusters[order])
+        kept = order[np.arange(len(order)) - first_of_cluster < term_limit]
+        centroid_clusters, centroid_terms, sums = centroid_clusters[kept], centroid_terms[kept], sums[kept]
+        norms = np.sqrt(np.bincount(centroid_clusters, weights=sums ** 2, minlength=cluster_count))
+        return cls(cluster_count, centroid_terms, centroid_clusters, sums / norms[centroid_clusters])
+
+    def similarities(self, terms: np.ndarray, rows: np.ndarray, weights: np.ndarray, row_count: int) -> np.ndarray:
+        """
+        Multiplies sparse vectors with all centroids in a single sparse product: every vector entry is joined with the
+        centroid entries of its term, and the products are summed per (row, cluster).
+        :param terms: Term IDs of the non-zero vector entries
+        :param rows: Rows (vectors) of the entries
+        :param weights: Values of the entries
+        :param row_count: Number of rows
+        :return: Array of shape (rows, clusters) of dot products
+        """
+        starts = np.searchsorted(self.terms, terms, side='left')
+        counts = np.searchsorted(self.terms, terms, side='right') - starts
+        entries = np.repeat(np.arange(len(terms)), counts)
+        centroid_entries = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(len(entries))
+        products = np.bincount(rows[entries] * self.cluster_count + self.clusters[centroid_entries],
+                               weights=weights[entries] * self.weights[centroid_entries],
+                               minlength=row_count * self.cluster_count)
+        return products.reshape(row_count, self.cluster_count)
+
+
+def spherical_k_means(terms: np.ndarray, rows: np.ndarray, weights: np.ndarray, row_count: int, cluster_count: int,
+                      seed: int = 0) -> tuple:
+    """
+    Clusters unit-length sparse document vectors by cosine similarity (spherical k-means, Dhillon & Modha). Centroids
+    are sparse, truncated to their highest-weighted terms and normalized to unit length (see SparseCentroids); the
+    initial centroids are randomly chosen documents.
+    :param terms: Term IDs of the non-zero vector entries
+    :param rows: Rows (documents) of the entries
+    :param weights: Values of the entries
+    :param row_count: Number of rows
+    :param cluster_count: Number of clusters
+    :param seed: Seed of the random initialization
+    :return: Centroids and the cluster of every row (-1 for rows without entries)
+    """
+    vector_rows = np.unique(rows)
+    cluster_count = min(cluster_count, len(vector_rows))
+    assignments = np.full(row_count, -1, dtype=np.int64)
+    if not cluster_count:
+        return SparseCentroids(0, *[np.zeros(0)] * 3), assignments
+    seeds = np.full(row_count, -1, dtype=np.int64)
+    seeds[np.random.RandomState(seed).choice(vector_rows, cluster_count, replace=False)] = np.arange(cluster_count)
+    seeded = seeds[rows] >= 0
+    centroids = SparseCentroids.of_clusters(cluster_count, terms[seeded], seeds[rows[seeded]], weights[seeded])
+
+    for _ in range(MAX_ITERATIONS):
+        similarities = centroids.similarities(terms, rows, weights, row_count)
+        new_assignments = np.full(row_count, -1, dtype=np.int64)
+        new_assignments[vector_rows] = np.argmax(similarities[vector_rows], axis=1)
+        if np.array_equal(new_assignments, assignments):
+            break
+        assignments = new_assignments
+        centroids = SparseCentroids.of_clusters(cluster_count, terms, assignments[rows], weights)
+    return centroids, assignments
+
+
+class ClusterIndex(object):
+    """
+    Cluster-based retrieval for the Vector Space Model. The documents of a term view are clustered offline with
+    spherical k-means on their TF-IDF vectors, and the postings are partitioned by cluster. A query is first matched
+    against the centroids; only the documents of the best clusters (the probed clusters) are scored, by reading the
+    query terms' postings within these clusters. Documents added later join the cluster with the nearest centroid.
+    The postings are partitioned on the first search, so loading the index does not depend on the collection size.
+    """
+
+    def __init__(self, statistics: StatisticsCatalog, centroids: SparseCentroids, assignments: dict[int, int]):
+        """
+        :param statistics: Catalog of the term view
+        :param centroids: Unit-length, truncated centroids
+        :param assignments: Dictionary that maps document IDs to their clusters
+        """
+        self.statistics = statistics
+        self.centroids = centroids
+        self.assignments = assignments
+        self._postings = None  # Per cluster: term ID -> (rows, term frequencies), see postings.
+        self.cluster_sizes = np.bincount(list(assignments.values()), minlength=len(centroids))
+
+    @property
+    def postings(self) -> list[dict]:
+        """
+        Postings of the documents partitioned by cluster: per cluster, a dictionary that maps term IDs to the rows of
+        the documents and the term frequencies. Computed from the statistics catalog on first use.
+        """
+        if self._postings is None:
+            self._postings = [{} for _ in range(len(self.centroids))]
+            terms, rows, tfs = self.statistics.entries()
+            row_clusters = np.full(self.statistics.row_count, -1, dtype=np.int64)
+            if self.assignments:
+                row_clusters[[self.statistics.row_of(document_id) for document_id in self.assignments]] = \
+                    list(self.assignments.values())
+            clusters = row_clusters[rows]
+            assigned = clusters >= 0
+            terms, rows, tfs, clusters = terms[assigned], rows[assigned], tfs[assigned], clusters[assigned]
+            order = np.lexsort((rows, terms, clusters))
+            terms, rows, tfs, clusters = terms[order], rows[order], tfs[order], clusters[order]
+            starts = np.flatnonzero(np.r_[True, (terms[1:] != terms[:-1]) | (clusters[1:] != clusters[:-1])])
+            ends = np.r_[starts[1:], len(terms)]
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                self._postings[clusters[start]][int(terms[start])] = rows[start:end], tfs[start:end]
+        return self._postings
+
+    @classmethod
+    def build(cls, statistics: StatisticsCatalog, cluster_count: int = None, seed: int = 0):
+        """
+        Clusters the documents of a term view.
+        :param statistics: Catalog of the term view
+        :param cluster_count: Number of clusters, the square root of the number of documents by default
+        :param seed: Seed of the random initialization
+        :return: The cluster index
+        """
+        cluster_count = cluster_count or max(1, math.isqrt(statistics.document_count))
+        terms, rows, tfs = statistics.entries()
+        centroids, row_assignments = spherical_k_means(terms, rows, document_weights(statistics, terms, rows, tfs),
+                                                       statistics.row_count, cluster_count, seed)
+        assigned_rows = np.flatnonzero(row_assignments >= 0)
+        return cls(statistics, centroids, dict(zip(statistics.document_ids[assigned_rows].tolist(),
+                                                   row_assignments[assigned_rows].tolist())))
+
+    def save(self, file_path: str):
+        """
+        Stores centroids and cluster membership in a NumPy .npz file.
+        :param file_path: Path of the file
+        """
+        with open(file_path, 'wb') as cluster_file:
+            np.savez(cluster_file, cluster_count=self.centroids.cluster_count, centroid_terms=self.centroids.terms,
+                     centroid_clusters=self.centroids.clusters,
+                     centroid_weights=self.centroids.weights.astype(np.float32),
+                     document_ids=np.array(list(self.assignments), dtype=np.int64),
+                     clusters=np.array(list(self.assignments.values()), dtype=np.int64))
+
+    @classmethod
+    def load(cls, file_path: str, statistics: StatisticsCatalog):
+        """
+        Loads a cluster index that was stored with save().
+        :param file_path: Path of the file
+        :param statistics: Catalog of the term view
+        :return: The cluster index, or None if the file holds dense centroids of an older version
+        """
+        with np.load(file_path) as stored:
+            if 'centroid_terms' not in stored.files:
+                return None
+            assignments = dict(zip(stored['document_ids'].tolist(), stored['clusters'].tolist()))
+            centroids = SparseCentroids(int(stored['cluster_count']), stored['centroid_terms'],
+                                        stored['centroid_clusters'], stored['centroid_weights'])
+            return cls(statistics, centroids, assignments)
+
+    def is_index_of_catalog(self) -> bool:
+        """
+        Checks whether the clusters hold exactly the live documents of the catalog that have terms.
+        """
+        clustered = self.statistics.live & (self.statistics.document_lengths > 0)
+        return set(self.assignments) == set(self.statistics.document_ids[clustered].tolist())
+
+    def centroid_similarities(self, terms, weights) -> np.ndarray:
+        """
+        Computes the cosine similarity of a sparse vector with every centroid.
+        """
+        terms, weights = np.asarray(terms, dtype=np.int64), np.asarray(weights, dtype=np.float64)
+        return self.centroids.similarities(terms, np.zeros(len(terms), dtype=np.int64), weights, 1)[0]
+
+    def add_document(self, document_id: int, term_ids):
+        """
+        Assigns a document that was added to the catalog to the cluster with the nearest centroid. The centroids stay
+        unchanged until the next clustering.
+        :param document_id: ID of the document
+        :param term_ids: Term ID array of the document
+        """
+        terms, rows, tfs = term_frequencies([term_ids], self.statistics.row_of(document_id))
+        if not len(terms) or not len(self.centroids):
+            return
+        cluster = int(np.argmax(self.centroid_similarities(terms, document_weights(self.statistics, terms, rows, tfs))))
+        self.assignments[document_id] = cluster
+        self.cluster_sizes[cluster] += 1
+        if self._postings is None:
+            return  # The document is partitioned with all others on first use.
+        for term, row, tf in zip(terms.tolist(), rows.tolist(), tfs.tolist()):
+            cluster_rows, cluster_tfs = self.postings[cluster].get(term, (np.zeros(0, dtype=np.int64),) * 2)
+            self.postings[cluster][term] = np.append(cluster_rows, row), np.append(cluster_tfs, tf)
+
+    def delete_document(self, document_id: int):
+        """
+        Removes a document from its cluster. Its postings stay until the next clustering; deleted rows are skipped.
+        """
+        cluster = self.assignments.pop(document_id, None)
+        if cluster is not None:
+            self.cluster_sizes[cluster] -= 1
+
+    def search(self, query_weights: dict[int, float], k: int, probes: int) -> tuple:
+        """
+        Ranks the clusters by the similarity of their centroids with the query and scores the documents of the best
+        clusters.
+        :param query_weights: Dictionary that maps query term IDs to their full weights (query term weight * IDF)
+        :param k: Number of results
+        :param probes: Number of clusters whose documents are scored
+        :return: List of (score, row) tuples of the top-k documents, sorted by descending score, and the number of
+        documents in the probed clusters
+        """
+        if not len(self.centroids) or not query_weights:
+            return [], 0
+        similarities = self.centroid_similarities(list(query_weights), list(query_weights.values()))
+        probed_clusters = np.argsort(-similarities, kind='stable')[:probes]
+        rows, values = [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+        for cluster in probed_clusters.tolist():
+            for term, weight in query_weights.items():
+                if term in self.postings[cluster]:
+                    term_rows, tfs = self.postings[cluster][term]
+                    live = self.statistics.live[term_rows]
+                    term_rows, tfs = term_rows[live], tfs[live]
+                    rows.append(term_rows)
+                    values.append(document_weights(self.statistics, np.full(len(term_rows), term), term_rows, tfs) *
+                                  weight)
+        probed_documents = int(self.cluster_sizes[probed_clusters].sum())
+        return ranking.accumulate_top_k(np.concatenate(rows), np.concatenate(values), k), probed_documents
@@ -1,17 +1,46 @@
 # Contains a unified class definition for a document.
+from array import array
+
+from term_dictionary import DICTIONARY
+
 
 class Document(object):
     def __init__(self):
         self.document_id = None  # Unique document ID
         self.title = ''  # Title of document
         self.raw_text = ''  # Holds complete text of document.
-        self.terms = []  # Holds all terms.
-        self.filtered_terms = []  # Holds terms without stopwords.
-        self.stemmed_terms = []  # Holds terms that were stemmed with Porter algorithm. (Only relevant in PR03!)
+        # The term lists are stored as arrays of term IDs (see term_dictionary.py). The properties below convert them
+        # from and to lists of term strings.
+        self.term_ids = array('I')  # Holds all terms.
+        self.filtered_term_ids = array('I')  # Holds terms without stopwords.
+        # Holds terms that were stemmed with Porter algorithm. (Only relevant in PR03!)
+        self.stemmed_term_ids = array('I')
         # Note: See PR02 task description for instructions regarding these properties.
-        
+
+    @property
+    def terms(self) -> list[str]:
+        return DICTIONARY.decode(self.term_ids)
+
+    @terms.setter
+    def terms(self, terms: list[str]):
+        self.term_ids = DICTIONARY.encode(terms)
+
+    @property
+    def filtered_terms(self) -> list[str]:
+        return DICTIONARY.decode(self.filtered_term_ids)
+
+    @filtered_terms.setter
+    def filtered_terms(self, terms: list[str]):
+        self.filtered_term_ids = DICTIONARY.encode(terms)
+
+    @property
+    def stemmed_terms(self) -> list[str]:
+        return DICTIONARY.decode(self.stemmed_term_ids)
+
+    @stemmed_terms.setter
+    def stemmed_terms(self, terms: list[str]):
+        self.stemmed_term_ids = DICTIONARY.encode(terms)
 
     def __str__(self):
         shortened_content = self.raw_text[:10] + "..." if len(self.raw_text) > 10 else self.raw_text
         return 'D' + str(self.document_id).zfill(2) + ': ' + self.title + '("' + shortened_content + '")'
-    
\ No newline at end of file
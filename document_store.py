@@ -0,0 +1,399 @@
+# Contains the columnar document store that holds the collection. Instead of one object per document, the store keeps
+# every document attribute in its own column and hands out lightweight views on demand. A store can be backed by a
+# memory-mapped collection file, from which titles and term arrays are read on first use and raw texts on every use.
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import OrderedDict
+
+from document import Document
+from term_dictionary import DICTIONARY
+
+COLLECTION_MAGIC = b'AICL'
+COLLECTION_VERSION = 1
+FLAG_COMPRESSED = 1  # The raw text blocks are zlib-compressed.
+
+# Header: magic, format version, flags, number of documents, number of raw text blocks.
+HEADER = struct.Struct('<4sHHII')
+# Offsets of the document ID column, the document table, the title blob, the term blob, the text block table and the
+# text blob, stored after the header.
+SECTION_OFFSETS = struct.Struct('<QQQQQQ')
+# Document table entry: offset and length of the title, offset of the term arrays in the term blob (in terms), number of
+# terms, filtered terms and stemmed terms, raw text block, offset and length of the raw text within the block.
+DOCUMENT_ENTRY = struct.Struct('<IIQIIIIII')
+# Text block table entry: offset of the block in the text blob, stored length, uncompressed length.
+BLOCK_ENTRY = struct.Struct('<QII')
+# Raw texts are grouped into blocks of at least this many bytes, so that compression has some context to work with and
+# displaying a document only decompresses its own block.
+TEXT_BLOCK_SIZE = 64 * 1024
+
+TERM_COLUMNS = ('term_ids', 'filtered_term_ids', 'stemmed_term_ids')
+
+
+def _uint32_bytes(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values = array('I', values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _read_uint32_array(buffer, start: int, count: int) -> array:
+    values = array('I')
+    values.frombytes(buffer[start:start + 4 * count])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def write_collection_file(store, file_path: str, compress: bool = True) -> None:
+    """
+    Writes a document store into a binary collection file. The file is written next to the target and moved into
+    place, so that a store that is still backed by the old file keeps working.
+    :param store: The DocumentStore to write
+    :param file_path: Path of the collection file
+    :param compress: Controls, whether the raw text blocks are zlib-compressed
+    """
+    document_table = bytearray()
+    titles = bytearray()
+    terms = bytearray()
+    blocks = []
+    block = bytearray()
+    for row in range(len(store)):
+        title = store.title(row).encode('utf-8')
+        term_arrays = [store.term_array(column, row) for column in TERM_COLUMNS]
+        text = store.text(row).encode('utf-8')
+        document_table += DOCUMENT_ENTRY.pack(len(titles), len(title), len(terms) // 4,
+                                              *[len(term_array) for term_array in term_arrays],
+                                              len(blocks), len(block), len(text))
+        titles += title
+        for term_array in term_arrays:
+            terms += _uint32_bytes(term_array)
+        block += text
+        if len(block) >= TEXT_BLOCK_SIZE:
+            blocks.append(bytes(block))
+            block = bytearray()
+    if block:
+        blocks.append(bytes(block))
+
+    block_table = bytearray()
+    text_blob = bytearray()
+    for raw_block in blocks:
+        stored_block = zlib.compress(raw_block) if compress else raw_block
+        block_table += BLOCK_ENTRY.pack(len(text_blob), len(stored_block), len(raw_block))
+        text_blob += stored_block
+
+    document_ids_offset = HEADER.size + SECTION_OFFSETS.size
+    document_table_offset = document_ids_offset + 4 * len(store)
+    titles_offset = document_table_offset + len(document_table)
+    terms_offset = titles_offset + len(titles)
+    block_table_offset = terms_offset + len(terms)
+    text_offset = block_table_offset + len(block_table)
+    temporary_path = file_path + '.tmp'
+    with open(temporary_path, 'wb') as collection_file:
+        collection_file.write(HEADER.pack(COLLECTION_MAGIC, COLLECTION_VERSION, FLAG_COMPRESSED if compress else 0,
+                                          len(store), len(blocks)))
+        collection_file.write(SECTION_OFFSETS.pack(document_ids_offset, document_table_offset, titles_offset,
+                                                   terms_offset, block_table_offset, text_offset))
+        collection_file.write(_uint32_bytes(store.document_ids))
+        collection_file.write(document_table)
+        collection_file.write(titles)
+        collection_file.write(terms)
+        collection_file.write(block_table)
+        collection_file.write(text_blob)
+    os.replace(temporary_path, file_path)
+
+
+class CollectionFile(object):
+    """
+    Read-only view of a binary collection file. The file is memory-mapped on opening; only the document ID column is
+    read eagerly, everything else is read row by row when it is requested.
+    """
+
+    def __init__(self, file_path: str, block_cache_size: int = 8):
+        self.file_path = file_path
+        with open(file_path, 'rb') as collection_file:
+            self._buffer = mmap.mmap(collection_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._flags, self.document_count, self._block_count = HEADER.unpack_from(self._buffer, 0)
+        if magic != COLLECTION_MAGIC or version != COLLECTION_VERSION:
+            raise ValueError(f'{file_path} is not a collection file of version {COLLECTION_VERSION}.')
+        (document_ids_offset, self._document_table_offset, self._titles_offset, self._terms_offset,
+         self._block_table_offset, self._text_offset) = SECTION_OFFSETS.unpack_from(self._buffer, HEADER.size)
+        self.document_ids = _read_uint32_array(self._buffer, document_ids_offset, self.document_count)
+        self._block_cache = OrderedDict()  # Recently decompressed text blocks.
+        self._block_cache_size = block_cache_size
+
+    def _entry(self, row: int) -> tuple:
+        return DOCUMENT_ENTRY.unpack_from(self._buffer, self._document_table_offset + row * DOCUMENT_ENTRY.size)
+
+    def title(self, row: int) -> str:
+        entry = self._entry(row)
+        start = self._titles_offset + entry[0]
+        return self._buffer[start:start + entry[1]].decode('utf-8')
+
+    def term_array(self, column: str, row: int) -> array:
+        """
+        Reads one term ID array of a document.
+        :param column: One of TERM_COLUMNS
+        :param row: Row of the document in the file
+        """
+        entry = self._entry(row)
+        index = TERM_COLUMNS.index(column)
+        start = entry[2] + sum(entry[3:3 + index])
+        return _read_uint32_array(self._buffer, self._terms_offset + 4 * start, entry[3 + index])
+
+    def _block(self, block: int) -> bytes:
+        if block in self._block_cache:
+            self._block_cache.move_to_end(block)
+            return self._block_cache[block]
+        offset, stored_length, _ = BLOCK_ENTRY.unpack_from(self._buffer,
+                                                           self._block_table_offset + block * BLOCK_ENTRY.size)
+        start = self._text_offset + offset
+        data = self._buffer[start:start + stored_length]
+        if self._flags & FLAG_COMPRESSED:
+            data = zlib.decompress(data)
+        self._block_cache[block] = data
+        if len(self._block_cache) > self._block_cache_size:
+            self._block_cache.popitem(last=False)
+        return data
+
+    def text(self, row: int) -> str:
+        """
+        Reads the raw text of a document; only its text block is decompressed.
+        """
+        entry = self._entry(row)
+        return self._block(entry[6])[entry[7]:entry[7] + entry[8]].decode('utf-8')
+
+    def close(self):
+        self._block_cache.clear()
+        self._buffer.close()
+
+
+class DocumentView(object):
+    """
+    Lightweight, read-mostly view of one document in a DocumentStore. It has the same attributes as a Document, but
+    only holds a reference to the store and the document ID; the attributes are read from the store's columns.
+    """
+    __slots__ = ('_store', 'document_id')
+
+    def __init__(self, store, document_id: int):
+        self._store = store
+        self.document_id = document_id
+
+    @property
+    def _row(self) -> int:
+        return self._store.row_of(self.document_id)
+
+    @property
+    def title(self) -> str:
+        return self._store.title(self._row)
+
+    @property
+    def raw_text(self) -> str:
+        return self._store.text(self._row)
+
+    @property
+    def term_ids(self) -> array:
+        return self._store.term_array('term_ids', self._row)
+
+    @property
+    def filtered_term_ids(self) -> array:
+        return self._store.term_array('filtered_term_ids', self._row)
+
+    @filtered_term_ids.setter
+    def filtered_term_ids(self, term_ids: array):
+        self._store.filtered_term_ids[self._row] = term_ids
+
+    @property
+    def stemmed_term_ids(self) -> array:
+        return self._store.term_array('stemmed_term_ids', self._row)
+
+    @stemmed_term_ids.setter
+    def stemmed_term_ids(self, term_ids: array):
+        self._store.stemmed_term_ids[self._row] = term_ids
+
+    @property
+    def terms(self) -> list[str]:
+        return DICTIONARY.decode(self.term_ids)
+
+    @property
+    def filtered_terms(self) -> list[str]:
+        return DICTIONARY.decode(self.filtered_term_ids)
+
+    @filtered_terms.setter
+    def filtered_terms(self, terms: list[str]):
+        self.filtered_term_ids = DICTIONARY.encode(terms)
+
+    @property
+    def stemmed_terms(self) -> list[str]:
+        return DICTIONARY.decode(self.stemmed_term_ids)
+
+    @stemmed_terms.setter
+    def stemmed_terms(self, terms: list[str]):
+        self.stemmed_term_ids = DICTIONARY.encode(terms)
+
+    def __str__(self):
+        return Document.__str__(self)
+
+
+class DocumentStore(object):
+    """
+    Columnar store of a document collection. IDs, titles, the offsets of the raw texts in a shared UTF-8 text buffer and
+    the term ID arrays are kept in parallel columns, one row per document. Documents are found by ID in O(1).
+    The store behaves like the list of documents it replaces: it has a length, iterates over (and is indexed by) row
+    in insertion order, and yields DocumentView objects.
+    Rows that come from a collection file (see CollectionFile) hold None in the title and term columns until the
+    values are first read; their raw texts are never kept in the store.
+    """
+
+    def __init__(self, documents=(), collection_file: CollectionFile = None):
+        """
+        :param documents: Documents (or views) to copy into the store
+        :param collection_file: Collection file whose documents become the first rows of the store
+        """
+        self.document_ids = array('I')
+        self.titles = []
+        self.text_offsets = array('Q', [0])  # The raw text of row i is _text[text_offsets[i]:text_offsets[i + 1]].
+        self.term_ids = []
+        self.filtered_term_ids = []
+        self.stemmed_term_ids = []
+        self.file_rows = array('i')  # Row of every document in the collection file, -1 if it was added later.
+        self._text = bytearray()
+        self._rows = {}  # Maps document IDs to rows.
+        self._file = collection_file
+        if collection_file is not None:
+            count = collection_file.document_count
+            self.document_ids = array('I', collection_file.document_ids)
+            self.titles = [None] * count
+            self.text_offsets = array('Q', bytes(8 * (count + 1)))
+            for column in TERM_COLUMNS:
+                setattr(self, column, [None] * count)
+            self.file_rows = array('i', range(count))
+            self._rows = {document_id: row for row, document_id in enumerate(self.document_ids)}
+        for document in documents:
+            self.append(document)
+
+    @classmethod
+    def open(cls, file_path: str):
+        """
+        Opens a store that is backed by a collection file.
+        :param file_path: Path of the collection file
+        :return: The DocumentStore
+        """
+        return cls(collection_file=CollectionFile(file_path))
+
+    def save(self, file_path: str, compress: bool = True) -> None:
+        """
+        Writes the store into a collection file (see write_collection_file()).
+        """
+        write_collection_file(self, file_path, compress)
+
+    def __len__(self):
+        return len(self.document_ids)
+
+    def __iter__(self):
+        for document_id in self.document_ids:
+            yield DocumentView(self, document_id)
+
+    def __getitem__(self, row: int) -> DocumentView:
+        return DocumentView(self, self.document_ids[row])
+
+    def __contains__(self, document_id: int):
+        return document_id in self._rows
+
+    def row_of(self, document_id: int) -> int:
+        return self._rows[document_id]
+
+    def get(self, document_id: int, default=None):
+        """
+        Returns a view of the document with the given ID.
+        :param document_id: ID of the document to look up
+        :param default: Returned if the store holds no such document
+        :return: The DocumentView
+        """
+        return DocumentView(self, document_id) if document_id in self._rows else default
+
+    def title(self, row: int) -> str:
+        if self.titles[row] is None:
+            self.titles[row] = self._file.title(self.file_rows[row])
+        return self.titles[row]
+
+    def term_array(self, column: str, row: int) -> array:
+        """
+        Returns one term ID array of a document.
+        :param column: One of TERM_COLUMNS
+        :param row: Row of the document
+        """
+        values = getattr(self, column)
+        if values[row] is None:
+            values[row] = self._file.term_array(column, self.file_rows[row])
+        return values[row]
+
+    def term_arrays(self, column: str) -> list[array]:
+        """
+        Returns one term ID array of every document, in row order.
+        :param column: One of TERM_COLUMNS
+        """
+        return [self.term_array(column, row) for row in range(len(self))]
+
+    def text(self, row: int) -> str:
+        if self.file_rows[row] >= 0:
+            return self._file.text(self.file_rows[row])
+        return self._text[self.text_offsets[row]:self.text_offsets[row + 1]].decode('utf-8')
+
+    @property
+    def next_document_id(self) -> int:
+        """
+        Smallest document ID that is larger than all IDs in the store.
+        """
+        return max(self.document_ids) + 1 if self.document_ids else 0
+
+    def append(self, document) -> DocumentView:
+        """
+        Copies a document into a new row.
+        :param document: Document or DocumentView to add; its ID must not be in the store yet
+        :return: View of the stored document
+        """
+        if document.document_id in self._rows:
+            raise ValueError(f'Document ID {document.document_id} is already used in the store.')
+        self._rows[document.document_id] = len(self.document_ids)
+        self.document_ids.append(document.document_id)
+        self.titles.append(document.title)
+        self._text += document.raw_text.encode('utf-8')
+        self.text_offsets.append(len(self._text))
+        for column in TERM_COLUMNS:
+            getattr(self, column).append(getattr(document, column))
+        self.file_rows.append(-1)
+        return DocumentView(self, document.document_id)
+
+    def delete(self, document_id: int) -> bool:
+        """
+        Removes a document. The rows after it and their raw texts move up.
+        :param document_id: ID of the document to remove
+        :return: True if the document was in the store
+        """
+        row = self._rows.pop(document_id, None)
+        if row is None:
+            return False
+        text_length = self.text_offsets[row + 1] - self.text_offsets[row]
+        del self._text[self.text_offsets[row]:self.text_offsets[row + 1]]
+        del self.text_offsets[row + 1]
+        for following_row in range(row + 1, len(self.text_offsets)):
+            self.text_offsets[following_row] -= text_length
+        del self.document_ids[row]
+        del self.titles[row]
+        for column in TERM_COLUMNS:
+            del getattr(self, column)[row]
+        del self.file_rows[row]
+        for following_row in range(row, len(self.document_ids)):
+            self._rows[self.document_ids[following_row]] = following_row
+        return True
+
+    def close(self):
+        """
+        Releases the collection file; rows that were read from it can no longer be accessed.
+        """
+        if self._file is not None:
+            self._file.close()
@@ -1,7 +1,27 @@
 # Contains functions that deal with the extraction of documents from a text file (see PR01)
 import json
+import os
+from array import array
 
 from document import Document
+from document_store import DocumentStore
+from term_dictionary import DICTIONARY
+
+
+def create_document(document_id: int, title: str, raw_text: str) -> Document:
+    """
+    Creates a document from its title and text. The terms of the document are the whitespace separated words of both.
+    :param document_id: ID of the new document
+    :param title: Title of the document
+    :param raw_text: Complete text of the document
+    :return: The new Document object
+    """
+    document = Document()
+    document.document_id = document_id
+    document.title = title
+    document.raw_text = raw_text
+    document.terms = title.split() + raw_text.split()
+    return document
 
 
 def extract_collection(source_file_path: str) -> list[Document]:
@@ -59,14 +79,7 @@ def extract_collection(source_file_path: str) -> list[Document]:
                     else:
                         second_line = file.readline()
                         if second_line == '':
-                            doc = Document()
-                            doc.document_id = doc_id
-                            doc.title = title
-                            doc.raw_text = raw_text
-                            terms = title.split()
-                            terms = terms+raw_text.split()
-                            doc.terms = terms
-                            catalog.append(doc)
+                            catalog.append(create_document(doc_id, title, raw_text))
                         elif second_line == '\n':
                             third_line = file.readline()
                             if third_line == '\n':
@@ -76,14 +89,7 @@ def extract_collection(source_file_path: str) -> list[Document]:
                         else:
                             raw_text = raw_text+second_line
                         if save_in_catalog:
-                            doc = Document()
-                            doc.document_id = doc_id
-                            doc.title = title
-                            doc.raw_text = raw_text
-                            terms = title.split()
-                            terms = terms+raw_text.split()
-                            doc.terms = terms
-                            catalog.append(doc)
+                            catalog.append(create_document(doc_id, title, raw_text))
                             store_title = True
                             store_text = False
                             save_in_catalog = False
@@ -95,48 +101,167 @@ def extract_collection(source_file_path: str) -> list[Document]:
 
 def save_collection_as_json(collection: list[Document], file_path: str) -> None:
     """
-    Saves the collection to a JSON file.
+    Saves the collection to a JSON file. The term lists are stored as term IDs; the term dictionary is saved next to
+    the collection (see vocabulary_path()).
     :param collection: The collection to store (= a list of Document objects)
     :param file_path: Path of the JSON file
     """
-
-    serializable_collection = []
-    for document in collection:
-        serializable_collection += [{
-            'document_id': document.document_id,
-            'title': document.title,
-            'raw_text': document.raw_text,
-            'terms': document.terms,
-            'filtered_terms': document.filtered_terms,
-            'stemmed_terms': document.stemmed_terms
-        }]
+    DICTIONARY.save(vocabulary_path(file_path))
+    serializable_collection = [document_to_dict(document) for document in collection]
 
     with open(file_path, "w") as json_file:
         json.dump(serializable_collection, json_file)
 
+    # A freshly saved collection starts without changes.
+    if os.path.exists(journal_path(file_path)):
+        os.remove(journal_path(file_path))
+
 
 def load_collection_from_json(file_path: str) -> list[Document]:
     """
-    Loads the collection from a JSON file.
+    Loads the collection from a JSON file, together with its term dictionary. Collections that were saved with term
+    strings instead of term IDs are still accepted.
     :param file_path: Path of the JSON file
     :return: list of Document objects
     """
+    DICTIONARY.load(vocabulary_path(file_path))
     try:
         with open(file_path, "r") as json_file:
             json_collection = json.load(json_file)
 
         collection = []
         for doc_dict in json_collection:
-            document = Document()
-            document.document_id = doc_dict.get('document_id')
-            document.title = doc_dict.get('title')
-            document.raw_text = doc_dict.get('raw_text')
-            document.terms = doc_dict.get('terms')
-            document.filtered_terms = doc_dict.get('filtered_terms')
-            document.stemmed_terms = doc_dict.get('stemmed_terms')
-            collection += [document]
+            collection += [document_from_dict(doc_dict)]
 
+        collection = replay_journal(collection, journal_path(file_path))
+        # Keep the IDs of terms that were new to the dictionary (e.g. from an older collection file) stable.
+        DICTIONARY.append(vocabulary_path(file_path))
         return collection
     except FileNotFoundError:
         print('No collection was found. Creating empty one.')
         return []
+
+
+def save_collection_as_binary(collection, file_path: str) -> None:
+    """
+    Saves the collection to a binary collection file (see document_store.write_collection_file()). The term lists are
+    stored as term IDs; the term dictionary is saved next to the collection (see vocabulary_path()).
+    :param collection: The collection to store (a DocumentStore or a list of Document objects)
+    :param file_path: Path of the collection file
+    """
+    DICTIONARY.save(vocabulary_path(file_path))
+    if not isinstance(collection, DocumentStore):
+        collection = DocumentStore(collection)
+    collection.save(file_path)
+
+    # A freshly saved collection starts without changes.
+    if os.path.exists(journal_path(file_path)):
+        os.remove(journal_path(file_path))
+
+
+def load_collection_from_binary(file_path: str) -> DocumentStore:
+    """
+    Opens a binary collection file, together with its term dictionary, and applies the changes recorded in its journal.
+    The file is memory-mapped: only the document IDs are read now, raw texts are read whenever a document is displayed.
+    :param file_path: Path of the collection file
+    :return: The DocumentStore, backed by the collection file
+    """
+    DICTIONARY.load(vocabulary_path(file_path))
+    try:
+        collection = DocumentStore.open(file_path)
+    except FileNotFoundError:
+        print('No collection was found. Creating empty one.')
+        return DocumentStore()
+
+    for entry in read_journal(journal_path(file_path)):
+        if 'add' in entry:
+            collection.append(document_from_dict(entry['add']))
+        else:
+            collection.delete(entry['delete'])
+    DICTIONARY.append(vocabulary_path(file_path))
+    return collection
+
+
+def journal_path(file_path: str) -> str:
+    """
+    Returns the path of the journal that records the changes made to a saved collection.
+    :param file_path: Path of the collection file
+    """
+    return file_path + '.journal'
+
+
+def vocabulary_path(file_path: str) -> str:
+    """
+    Returns the path of the term dictionary that the term IDs of a saved collection refer to.
+    :param file_path: Path of the collection file
+    """
+    return file_path + '.vocabulary'
+
+
+def document_to_dict(document: Document) -> dict:
+    return {
+        'document_id': document.document_id,
+        'title': document.title,
+        'raw_text': document.raw_text,
+        'term_ids': document.term_ids.tolist(),
+        'filtered_term_ids': document.filtered_term_ids.tolist(),
+        'stemmed_term_ids': document.stemmed_term_ids.tolist()
+    }
+
+
+def document_from_dict(doc_dict: dict) -> Document:
+    document = Document()
+    document.document_id = doc_dict.get('document_id')
+    document.title = doc_dict.get('title')
+    document.raw_text = doc_dict.get('raw_text')
+    if 'term_ids' in doc_dict:
+        document.term_ids = array('I', doc_dict['term_ids'])
+        document.filtered_term_ids = array('I', doc_dict['filtered_term_ids'])
+        document.stemmed_term_ids = array('I', doc_dict['stemmed_term_ids'])
+    else:
+        document.terms = doc_dict.get('terms')
+        document.filtered_terms = doc_dict.get('filtered_terms')
+        document.stemmed_terms = doc_dict.get('stemmed_terms')
+    return document
+
+
+def append_to_journal(file_path: str, added: list[Document] = (), deleted: list[int] = ()) -> None:
+    """
+    Records added and deleted documents in the journal of a saved collection. Only the changes are written, the
+    collection file itself stays untouched; new terms are appended to the term dictionary.
+    :param file_path: Path of the collection file
+    :param added: Documents that were added to the collection
+    :param deleted: IDs of documents that were deleted from the collection
+    """
+    DICTIONARY.append(vocabulary_path(file_path))
+    with open(journal_path(file_path), 'a') as journal_file:
+        for document in added:
+            journal_file.write(json.dumps({'add': document_to_dict(document)}) + '\n')
+        for document_id in deleted:
+            journal_file.write(json.dumps({'delete': document_id}) + '\n')
+
+
+def read_journal(file_path: str) -> list[dict]:
+    """
+    Reads the entries of a journal in the order they were recorded.
+    :param file_path: Path of the journal
+    :return: Entries {'add': document dictionary} and {'delete': document ID}; empty if there is no journal
+    """
+    try:
+        with open(file_path, 'r') as journal_file:
+            return [json.loads(line) for line in journal_file if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def replay_journal(collection: list[Document], file_path: str) -> list[Document]:
+    """
+    Applies the changes recorded in a journal to a collection.
+    :param collection: Collection as it was saved
+    :param file_path: Path of the journal
+    :return: The changed collection
+    """
+    entries = read_journal(file_path)
+    deleted = {entry['delete'] for entry in entries if 'delete' in entry}
+    collection = collection + [document_from_dict(entry['add']) for entry in entries if 'add' in entry]
+    return [document for document in collection if document.document_id not in deleted]
@@ -0,0 +1,587 @@
+# Contains all functions and classes that build, store and load the inverted index of a collection.
+import json
+import math
+import os
+import threading
+from array import array
+
+import postings
+import query_compiler
+from document import Document
+
+# Names of the indexed term views of a document:
+VIEW_FILTERED = 'filtered'
+VIEW_STEMMED = 'stemmed'
+VIEWS = (VIEW_FILTERED, VIEW_STEMMED)
+
+# Files of a stored index:
+MANIFEST_FILE = 'manifest.json'
+SEGMENT_SUFFIX = '.seg'
+DOCUMENTS_SUFFIX = '.docs'
+
+
+def build_inverted_list(term_lists: dict[int, array]) -> dict[int, dict[int, list[int]]]:
+    """
+    Builds a positional inverted list that maps every term to the documents that contain it, and those to the
+    positions of the term in the document.
+    :param term_lists: Dictionary that maps document IDs to the term IDs of the document
+    :return: Dictionary that maps term IDs to dictionaries from sorted document IDs to sorted positions
+    """
+    inverted_list = {}
+    for document_id in sorted(term_lists):
+        for position, term in enumerate(term_lists[document_id]):
+            if term not in inverted_list:
+                inverted_list[term] = {document_id: [position]}
+            elif document_id not in inverted_list[term]:
+                inverted_list[term][document_id] = [position]
+            else:
+                inverted_list[term][document_id].append(position)
+    return inverted_list
+
+
+def build_inverted_index(collection: list[Document]) -> dict:
+    """
+    Builds the inverted index of a collection. The index holds one inverted list for the stopword-filtered and one for
+    the stemmed terms of the documents.
+    :param collection: Collection to index
+    :return: The inverted index
+    """
+    return {
+        'document_ids': sorted(document.document_id for document in collection),
+        VIEW_FILTERED: build_inverted_list({d.document_id: d.filtered_term_ids for d in collection}),
+        VIEW_STEMMED: build_inverted_list({d.document_id: d.stemmed_term_ids for d in collection})
+    }
+
+
+def segment_path(directory: str, name: str, view: str) -> str:
+    return os.path.join(directory, f'{name}.{view}{SEGMENT_SUFFIX}')
+
+
+def documents_path(directory: str, name: str) -> str:
+    return os.path.join(directory, name + DOCUMENTS_SUFFIX)
+
+
+class IndexSegment(object):
+    """
+    An immutable part of the index. It consists of one segment file per term view and covers a contiguous range of
+    document IDs. Readers that use the segment outside the index lock (see IndexCursor) hold a reference to it; a
+    segment that a merge retires is only closed and deleted after its last reader released it.
+    """
+
+    def __init__(self, directory: str, name: str, first_id: int, last_id: int, document_count: int):
+        self.directory = directory
+        self.name = name
+        self.first_id = first_id
+        self.last_id = last_id
+        self.document_count = document_count
+        self._readers = 0
+        self._retired = False
+        self._reader_lock = threading.Lock()
+        self._files = {view: postings.Segment(segment_path(directory, name, view)) for view in VIEWS}
+        with open(documents_path(directory, name), 'rb') as documents_file:
+            self.documents = postings.to_bitmap(postings.decode_postings(documents_file.read()))
+
+    def __getitem__(self, view):
+        return self._files[view]
+
+    def to_json(self) -> dict:
+        return {'name': self.name, 'first_id': self.first_id, 'last_id': self.last_id,
+                'document_count': self.document_count}
+
+    def close(self):
+        for segment_file in self._files.values():
+            segment_file.close()
+
+    def acquire(self):
+        """
+        Registers a reader, which keeps the segment files open until it calls release().
+        """
+        with self._reader_lock:
+            self._readers += 1
+
+    def release(self):
+        with self._reader_lock:
+            self._readers -= 1
+            remove = self._retired and not self._readers
+        if remove:
+            self._remove_files()
+
+    def retire(self):
+        """
+        Closes and deletes the segment files as soon as no reader uses them any more.
+        """
+        with self._reader_lock:
+            self._retired = True
+            remove = not self._readers
+        if remove:
+            self._remove_files()
+
+    def _remove_files(self):
+        self.close()
+        for view in VIEWS:
+            os.remove(segment_path(self.directory, self.name, view))
+        os.remove(documents_path(self.directory, self.name))
+
+
+class IndexCursor(object):
+    """
+    Forward-only cursor on the posting list of a term over all segments of an index. Segments cover disjoint, ordered
+    ranges of document IDs, so a seek only touches the segment that can hold the target. Deleted documents are not
+    left out; the cursor is meant for probing candidates that are already known to be live. The cursor holds a
+    reference to the segments it has not passed yet, so a merge can not close them under it; close it (or use it as a
+    context manager) when done.
+    """
+
+    def __init__(self, segments: list, view: str, term: int):
+        """
+        :param segments: Segments of the index, already acquired for the cursor (see IndexSegment.acquire())
+        """
+        self._segments = segments
+        self._view = view
+        self._term = term
+        self._position = 0
+        self._cursor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Releases the segments that the cursor did not pass yet.
+        """
+        self._cursor = None
+        for segment in self._segments[self._position:]:
+            segment.release()
+        self._position = len(self._segments)
+
+    def seek(self, target: int):
+        """
+        Moves the cursor to the first document ID that is greater than or equal to the target.
+        :param target: Document ID to look for; must not be smaller than the target of the previous call
+        :return: The found document ID, or None if the posting list holds no such ID
+        """
+        while self._position < len(self._segments):
+            segment = self._segments[self._position]
+            if segment.last_id >= target:
+                if self._cursor is None:
+                    self._cursor = segment[self._view].cursor(self._term)
+                found = self._cursor.seek(target) if self._cursor is not None else None
+                if found is not None:
+                    return found
+            self._position += 1
+            self._cursor = None
+            segment.release()
+        return None
+
+
+class IndexView(object):
+    """
+    One term view (e.g. the stemmed terms) of a segmented index. Terms are looked up by their IDs in the term
+    dictionary. Posting lists are read from every segment and concatenated; deleted documents are left out.
+    """
+
+    def __init__(self, index, view: str):
+        self._index = index
+        self._view = view
+
+    def __contains__(self, term):
+        return bool(self.get(term))
+
+    def __getitem__(self, term):
+        return self.get(term, [])
+
+    def get(self, term: int, default=None):
+        """
+        Returns the posting list of a term over all segments.
+        :param term: ID of the term to look up
+        :param default: Returned if no live document contains the term
+        :return: Sorted document IDs
+        """
+        with self._index.lock:
+            deleted = self._index.deleted
+            document_ids = []
+            for segment in self._index.segments:
+                segment_postings = segment[self._view].get(term)
+                if segment_postings:
+                    document_ids += [d for d in segment_postings if d not in deleted] if deleted else segment_postings
+        return document_ids if document_ids else default
+
+    @property
+    def lock(self):
+        return self._index.lock
+
+    def document_frequency(self, term: int) -> int:
+        """
+        Returns the number of documents that contain a term, read from the term tables of the segments without
+        decoding any postings. Deleted documents that were not merged away yet are still counted.
+        """
+        with self._index.lock:
+            return sum(segment[self._view].document_frequency(term) for segment in self._index.segments)
+
+    def cursor(self, term: int):
+        """
+        Opens a cursor on the posting list of a term over all segments (see IndexCursor).
+        """
+        with self._index.lock:
+            segments = list(self._index.segments)
+            for segment in segments:
+                segment.acquire()
+            return IndexCursor(segments, self._view, term)
+
+    def bitmap(self, term: int) -> int:
+        """
+        Returns the posting list of a term over all segments as a bitmap (see postings.to_bitmap()).
+        :param term: ID of the term to look up
+        :return: Bitmap of the live documents that contain the term
+        """
+        with self._index.lock:
+            bitmap = 0
+            for segment in self._index.segments:
+                bitmap |= segment[self._view].bitmap(term)
+            return bitmap & self._index.live_documents if self._index.deleted else bitmap
+
+    def live_documents(self) -> int:
+        """
+        Returns the bitmap of all live documents, i.e. the universe that Boolean negation is computed against.
+        """
+        return self._index.live_documents
+
+    def document_count(self) -> int:
+        return self._index.document_count
+
+    def positions(self, term: int) -> dict[int, list[int]]:
+        """
+        Returns the positions of a term in all live documents that contain it.
+        :param term: ID of the term to look up
+        :return: Dictionary that maps sorted document IDs to sorted positions
+        """
+        with self._index.lock:
+            deleted = self._index.deleted
+            positional_postings = {}
+            for segment in self._index.segments:
+                for document_id, positions in segment[self._view].positions(term).items():
+                    if document_id not in deleted:
+                        positional_postings[document_id] = positions
+        return positional_postings
+
+
+class SegmentedIndex(object):
+    """
+    Inverted index that consists of small immutable segments. New documents are written into a new segment, deleted
+    documents are only marked with a tombstone. A tiered merge policy compacts segments of similar size in the
+    background and drops the postings of deleted documents on the way.
+    """
+
+    def __init__(self, directory: str, merge_factor: int = 4):
+        """
+        Opens the index stored in a directory, or an empty index if nothing was stored yet.
+        :param directory: Directory that holds the index files
+        :param merge_factor: Number of segments of the same tier that are merged into one
+        """
+        self.directory = directory
+        self.merge_factor = merge_factor
+        self.lock = threading.RLock()
+        self.segments = []  # Ordered by document IDs.
+        self.deleted = set()  # Tombstones of deleted documents.
+        self.next_segment = 0
+        self._live_documents = None  # Cached bitmap of the live documents.
+        self._merge_thread = None
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE), 'r') as json_file:
+                manifest = json.load(json_file)
+            self.segments = [IndexSegment(directory, **entry) for entry in manifest['segments']]
+            self.deleted = set(manifest['deleted'])
+            self.next_segment = manifest['next_segment']
+        except (FileNotFoundError, KeyError, TypeError, ValueError):
+            self.segments = []
+            self.deleted = set()
+
+    def view(self, view: str) -> IndexView:
+        return IndexView(self, view)
+
+    @property
+    def document_count(self) -> int:
+        """
+        Number of live (not deleted) documents in the index.
+        """
+        with self.lock:
+            return sum(segment.document_count for segment in self.segments) - len(self.deleted)
+
+    @property
+    def live_documents(self) -> int:
+        """
+        Bitmap of all live (not deleted) documents in the index.
+        """
+        with self.lock:
+            if self._live_documents is None:
+                self._live_documents = 0
+                for segment in self.segments:
+                    self._live_documents |= segment.documents
+                self._live_documents &= ~postings.to_bitmap(self.deleted)
+            return self._live_documents
+
+    @property
+    def next_document_id(self) -> int:
+        """
+        Smallest document ID that was never used in this index.
+        """
+        with self.lock:
+            return self.segments[-1].last_id + 1 if self.segments else 0
+
+    def is_index_of_collection(self, collection: list[Document]) -> bool:
+        """
+        Checks whether the index covers the documents of a collection.
+        :param collection: The collection the index should belong to
+        :return: True if document count and ID range of index and collection match
+        """
+        if self.document_count != len(collection):
+            return False
+        return not collection or max(d.document_id for d in collection) < self.next_document_id
+
+    def _write_manifest(self):
+        self._live_documents = None
+        manifest = {
+            'segments': [segment.to_json() for segment in self.segments],
+            'deleted': sorted(self.deleted),
+            'next_segment': self.next_segment
+        }
+        temporary_path = os.path.join(self.directory, MANIFEST_FILE + '.tmp')
+        with open(temporary_path, 'w') as json_file:
+            json.dump(manifest, json_file)
+        os.replace(temporary_path, os.path.join(self.directory, MANIFEST_FILE))
+
+    def _write_segment(self, inverted_index: dict, first_id: int, last_id: int) -> IndexSegment:
+        with self.lock:
+            name = f'seg_{self.next_segment:06d}'
+            self.next_segment += 1
+        for view in VIEWS:
+            postings.write_segment(inverted_index[view], segment_path(self.directory, name, view))
+        with open(documents_path(self.directory, name), 'wb') as documents_file:
+            documents_file.write(postings.encode_postings(inverted_index['document_ids']))
+        return IndexSegment(self.directory, name, first_id, last_id, len(inverted_index['document_ids']))
+
+    def rebuild(self, collection: list[Document]):
+        """
+        Replaces the whole index with a single segment that holds the given collection.
+        :param collection: Collection to index
+        """
+        self.wait_for_merges()
+        with self.lock:
+            old_segments = self.segments
+            self.segments = []
+            self.deleted = set()
+            if collection:
+                document_ids = [d.document_id for d in collection]
+                self.segments = [self._write_segment(build_inverted_index(collection), min(document_ids),
+                                                     max(document_ids))]
+            self._write_manifest()
+            for segment in old_segments:
+                segment.retire()
+
+    def add_documents(self, documents: list[Document]):
+        """
+        Indexes new documents in a new segment. The IDs of the documents must be larger than all IDs in the index.
+        :param documents: Documents to add
+        """
+        if not documents:
+            return
+        document_ids = [d.document_id for d in documents]
+        if min(document_ids) < self.next_document_id:
+            raise ValueError(f'Document ID {min(document_ids)} is already used in the index.')
+        segment = self._write_segment(build_inverted_index(documents), min(document_ids), max(document_ids))
+        with self.lock:
+            self.segments.append(segment)
+            self._write_manifest()
+
+    def delete_document(self, document_id: int) -> bool:
+        """
+        Marks a document as deleted. Its postings are dropped the next time its segment is merged.
+        :param document_id: ID of the document to delete
+        :return: True if the document was live in the index
+        """
+        with self.lock:
+            if document_id in self.deleted or not any(
+                    s.first_id <= document_id <= s.last_id for s in self.segments):
+                return False
+            self.deleted.add(document_id)
+            self._write_manifest()
+            return True
+
+    def _tier(self, segment: IndexSegment) -> int:
+        return int(math.log(max(segment.document_count, 1), self.merge_factor))
+
+    def _find_merge(self):
+        """
+        Tiered merge policy: finds merge_factor adjacent segments that belong to the same size tier. Only adjacent
+        segments are merged, so that segments keep covering disjoint and ordered ranges of document IDs.
+        :return: Start and end position of the segments to merge, or None
+        """
+        for start in range(len(self.segments) - self.merge_factor + 1):
+            run = self.segments[start:start + self.merge_factor]
+            if all(self._tier(segment) == self._tier(run[0]) for segment in run):
+                return start, start + self.merge_factor
+        return None
+
+    def _merge_segments(self, segments: list[IndexSegment], deleted: set) -> IndexSegment:
+        """
+        Writes a new segment that holds all live postings of the given segments.
+        :param segments: Adjacent segments to merge
+        :param deleted: IDs of the deleted documents of the segments, whose postings are dropped
+        :return: The new segment
+        """
+        merged_index = {}
+        for view in VIEWS:
+            merged_lists = {}
+            for segment in segments:
+                for term, positional_postings in segment[view].items():
+                    for document_id, positions in positional_postings.items():
+                        if document_id not in deleted:
+                            merged_lists.setdefault(term, {})[document_id] = positions
+            merged_index[view] = merged_lists
+        merged_documents = 0
+        for segment in segments:
+            merged_documents |= segment.documents
+        merged_index['document_ids'] = [d for d in postings.from_bitmap(merged_documents) if d not in deleted]
+        return self._write_segment(merged_index, segments[0].first_id, segments[-1].last_id)
+
+    def merge(self):
+        """
+        Merges segments according to the tiered merge policy until no tier holds merge_factor adjacent segments.
+        """
+        while True:
+            with self.lock:
+                run = self._find_merge()
+                if run is None:
+                    return
+                segments = self.segments[run[0]:run[1]]
+                # Snapshot of the tombstones, since delete_document() may add to them while the segments are merged.
+                dropped = {d for d in self.deleted if segments[0].first_id <= d <= segments[-1].last_id}
+            merged_segment = self._merge_segments(segments, dropped)
+            with self.lock:
+                position = self.segments.index(segments[0])
+                self.segments[position:position + len(segments)] = [merged_segment]
+                self.deleted -= dropped
+                self._write_manifest()
+                for segment in segments:
+                    segment.retire()
+
+    def merge_in_background(self):
+        """
+        Starts merging segments in a background thread, unless a merge is already running.
+        """
+        if self._merge_thread is None or not self._merge_thread.is_alive():
+            self._merge_thread = threading.Thread(target=self.merge, daemon=True)
+            self._merge_thread.start()
+
+    def wait_for_merges(self):
+        if self._merge_thread is not None:
+            self._merge_thread.join()
+
+    def close(self):
+        self.wait_for_merges()
+        with self.lock:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+
+
+def term_positions(terms) -> dict[int, list[int]]:
+    """
+    Maps each term of a single term list to its positions in the list.
+    :param terms: Terms of one document
+    :return: Dictionary that maps terms to sorted positions
+    """
+    positions = {}
+    for position, term in enumerate(terms):
+        positions.setdefault(term, []).append(position)
+    return positions
+
+
+def phrase_spans(phrase: tuple, positions_of) -> dict[int, list[tuple]]:
+    """
+    Finds all occurrences of a phrase by merging the position lists of its terms.
+    :param phrase: Terms of the phrase in order
+    :param positions_of: Function that returns the positional postings (document ID -> positions) of a term
+    :return: Dictionary that maps document IDs to the sorted (first, last) position spans of the phrase
+    """
+    term_postings = [positions_of(term) for term in phrase]
+    if not term_postings or not all(term_postings):
+        return {}
+    # Only documents that contain all terms can contain the phrase; start from the rarest term.
+    candidates = set(min(term_postings, key=len))
+    for postings_of_term in term_postings:
+        candidates.intersection_update(postings_of_term)
+
+    spans = {}
+    for document_id in sorted(candidates):
+        starts = term_postings[0][document_id]
+        for offset in range(1, len(phrase)):
+            # Keep the starts whose term at this offset follows, by merging two sorted lists.
+            following = term_postings[offset][document_id]
+            matching_starts = []
+            i, j = 0, 0
+            while i < len(starts) and j < len(following):
+                if starts[i] + offset == following[j]:
+                    matching_starts.append(starts[i])
+                    i += 1
+                    j += 1
+                elif starts[i] + offset < following[j]:
+                    i += 1
+                else:
+                    j += 1
+            starts = matching_starts
+            if not starts:
+                break
+        if starts:
+            spans[document_id] = [(start, start + len(phrase) - 1) for start in starts]
+    return spans
+
+
+def near_spans(left_spans: dict[int, list[tuple]], right_spans: dict[int, list[tuple]],
+               distance: int) -> dict[int, list[tuple]]:
+    """
+    Combines two span lists into the spans where both operands occur at most `distance` positions apart, in any order.
+    :param left_spans: Spans of the left operand
+    :param right_spans: Spans of the right operand
+    :param distance: Maximum number of positions between the operands (1 = adjacent)
+    :return: Dictionary that maps document IDs to the sorted spans that cover both operands
+    """
+    spans = {}
+    for document_id in sorted(set(left_spans).intersection(right_spans)):
+        right = right_spans[document_id]
+        longest_right = max(end - start for start, end in right)
+        combined = set()
+        j = 0
+        for left_start, left_end in left_spans[document_id]:
+            # Skip right spans that end too early for this and all following left spans.
+            while j < len(right) and right[j][0] + longest_right < left_start - distance:
+                j += 1
+            k = j
+            while k < len(right) and right[k][0] <= left_end + distance:
+                right_start, right_end = right[k]
+                if (right_start, right_end) != (left_start, left_end) and right_end >= left_start - distance:
+                    combined.add((min(left_start, right_start), max(left_end, right_end)))
+                k += 1
+        if combined:
+            spans[document_id] = sorted(combined)
+    return spans
+
+
+def operand_spans(operand, positions_of) -> dict[int, list[tuple]]:
+    """
+    Evaluates a positional query operand: a single term, a phrase ('phrase', terms) or a proximity expression
+    ('near', distance, left operand, right operand).
+    :param operand: The operand to evaluate
+    :param positions_of: Function that returns the positional postings (document ID -> positions) of a term
+    :return: Dictionary that maps document IDs to sorted position spans
+    """
+    if query_compiler.is_term(operand):
+        return {d: [(p, p) for p in positions] for d, positions in positions_of(operand).items()}
+    if operand[0] == 'phrase':
+        return phrase_spans(operand[1], positions_of)
+    return near_spans(operand_spans(operand[2], positions_of), operand_spans(operand[3], positions_of), operand[1])
@@ -20,24 +20,101 @@ import json
 import os
 import time
 
+import numpy as np
+
+import bm25
+import catalog
 import cleanup
+import clustering
+import document_store
 import extraction
+import indexing
+import lsi
+import minhash
 import models
 import porter
+import pruning
+import query_compiler
+import ranking
+import reports
+import signatures
+import term_dictionary
+import tfidf
 from document import Document
+from query_compiler import CompiledQuery
 
 # Important paths:
 RAW_DATA_PATH = 'raw_data'
 DATA_PATH = 'data'
-COLLECTION_PATH = os.path.join(DATA_PATH, 'my_collection.json')
+COLLECTION_PATH = os.path.join(DATA_PATH, 'my_collection.bin')
+JSON_COLLECTION_PATH = os.path.join(DATA_PATH, 'my_collection.json')  # Collection saved by older versions.
 STOPWORD_FILE_PATH = os.path.join(DATA_PATH, 'stopwords.json')
+INDEX_PATH = os.path.join(DATA_PATH, 'index')
+NEAR_DUPLICATES_PATH = os.path.join(INDEX_PATH, 'near_duplicates.npz')  # Pairs of near-duplicate document IDs.
+SIGNATURE_PARAMETERS_PATH = os.path.join(INDEX_PATH, 'signature_parameters.json')  # Tuned signature file parameters.
 GROUND_TRUTH_PATH = os.path.join(RAW_DATA_PATH, 'ground_truth.txt')
 
 # Menu choices:
 (CHOICE_LIST, CHOICE_SEARCH, CHOICE_EXTRACT, CHOICE_UPDATE_STOP_WORDS, CHOICE_SET_MODEL, CHOICE_SHOW_DOCUMENT,
- CHOICE_EXIT) = 1, 2, 3, 4, 5, 6, 9
-MODEL_BOOL_LIN, MODEL_BOOL_INV, MODEL_BOOL_SIG, MODEL_FUZZY, MODEL_VECTOR = 1, 2, 3, 4, 5
+ CHOICE_SIMILAR, CHOICE_REPORTS, CHOICE_EXIT) = 1, 2, 3, 4, 5, 6, 7, 8, 9
+REPORT_CHAMPION_LISTS, REPORT_PRUNING, REPORT_CLUSTERS, REPORT_SIGNATURES = 1, 2, 3, 4
+MODEL_BOOL_LIN, MODEL_BOOL_INV, MODEL_BOOL_SIG, MODEL_FUZZY, MODEL_VECTOR, MODEL_BM25, MODEL_LSI = 1, 2, 3, 4, 5, 6, 7
 SW_METHOD_LIST, SW_METHOD_CROUCH = 1, 2
+SIGNATURES_SEQUENTIAL, SIGNATURES_BIT_SLICED = 1, 2
+TOP_K_BUCKLEY_LEWIT, TOP_K_WAND, TOP_K_BLOCK_MAX_WAND, TOP_K_TIERED, TOP_K_CLUSTERS = 1, 2, 3, 4, 5
+CHAMPION_LIST_SIZE = 10  # Default size r of the champion lists of the tiered index.
+CLUSTER_PROBES = 2  # Default number of clusters probed by cluster-based search.
+
+
+def view_column(view: str) -> str:
+    """
+    Returns the name of the document term column (see document_store.TERM_COLUMNS) that a term view is built from.
+    """
+    return 'stemmed_term_ids' if view == indexing.VIEW_STEMMED else 'filtered_term_ids'
+
+
+def signature_column(stemming: bool, stop_word_filtering: bool) -> str:
+    """
+    Returns the name of the document term column that the signature-based model searches with the given options.
+    """
+    return 'stemmed_term_ids' if stemming else 'filtered_term_ids' if stop_word_filtering else 'term_ids'
+
+
+def statistics_path(view: str) -> str:
+    return os.path.join(INDEX_PATH, f'statistics_{view}.npz')
+
+
+def clusters_path(view: str) -> str:
+    return os.path.join(INDEX_PATH, f'clusters_{view}.npz')
+
+
+def impacts_path(view: str) -> str:
+    return os.path.join(INDEX_PATH, f'impacts_{view}.npz')
+
+
+def minhash_path(view: str) -> str:
+    return os.path.join(INDEX_PATH, f'minhash_{view}.npz')
+
+
+class LazyIndexes(dict):
+    """
+    Indexes of the term views (see indexing.VIEWS) that are loaded, or rebuilt, on first access. Only the indexes that
+    were accessed are held (and saved), so starting the program does not depend on the collection size.
+    """
+
+    def __init__(self, load, indexes=()):
+        """
+        :param load: Function that loads or rebuilds the index of a term view
+        :param indexes: Indexes that are already built, per term view
+        """
+        super().__init__(indexes)
+        self.load = load
+
+    def __missing__(self, view: str):
+        if view not in indexing.VIEWS:
+            raise KeyError(view)
+        self[view] = self.load(view)
+        return self[view]
 
 
 def load_ground_truth_inline() -> dict:  # extract data from ground_truth.txt
@@ -69,13 +146,42 @@ class InformationRetrievalSystem(object):
         if not os.path.isdir(DATA_PATH):
             os.makedirs(DATA_PATH)
 
-        # Collection of documents, initially empty.
+        # Collection of documents, initially empty. A collection in the older JSON format is converted once.
+        if not os.path.exists(COLLECTION_PATH) and os.path.exists(JSON_COLLECTION_PATH):
+            extraction.save_collection_as_binary(extraction.load_collection_from_json(JSON_COLLECTION_PATH),
+                                                 COLLECTION_PATH)
+        self.collection = extraction.load_collection_from_binary(COLLECTION_PATH)
+
+        # Inverted index of the collection, rebuilt if it does not match the loaded collection.
+        self.inverted_index = indexing.SegmentedIndex(INDEX_PATH)
+        # Collection statistics per term view, built and stored with the index.
+        self.statistics = LazyIndexes(self.load_statistics_catalog)
+        # Fraction of the postings that static pruning keeps in the TF-IDF matrices (1.0: no pruning), and the method.
+        self.pruning_budget = 1.0
+        self.pruning_method = pruning.PRUNING_TERM
+        self.tfidf_matrices = {}  # TF-IDF matrices of the Vector Space Model per term view.
+        self.impact_indexes = LazyIndexes(self.load_impact_index)  # Quantized BM25 impacts, stored with the index.
+        self.cluster_indexes = LazyIndexes(self.load_cluster_index)  # Document clusters, stored with the index.
+        self.lsi_indexes = LazyIndexes(self.load_lsi_index)  # Latent semantic indexes, stored with the index.
+        self.minhash_indexes = LazyIndexes(self.load_minhash_index)  # MinHash sketches, stored with the index.
+        # Near-duplicates of every document that has some (IDs), flagged when documents are ingested and stored with the
+        # MinHash sketches; loaded on first use (see near_duplicates). They are only valid while the stored sketches
+        # of the filtered view are.
+        self._near_duplicates = None
+        self.near_duplicates_stored = False
+        # Signature file of the signature-based model for the last searched term column, computed on first use.
+        self.signature_files = {}
+        # Tuned parameters of the signature-based model (see signatures.tune()), with the term column and the false-drop
+        # budget they were tuned for; None until the model was tuned.
         try:
-            self.collection = extraction.load_collection_from_json(
-                COLLECTION_PATH)
+            with open(SIGNATURE_PARAMETERS_PATH, 'r') as f:
+                self.signature_parameters = json.load(f)
         except FileNotFoundError:
-            print('No previous collection was found. Creating empty one.')
-            self.collection = []
+            self.signature_parameters = None
+        if not self.inverted_index.is_index_of_collection(self.collection):
+            self.build_inverted_index()
+        else:
+            self.load_statistics()
 
         # Stopword list, initially empty.
         try:
@@ -85,9 +191,19 @@ class InformationRetrievalSystem(object):
             print('No stopword list was found.')
             self.stop_word_list = []
 
+        # Stop words that were filtered from the indexed terms; they are removed from phrases (see compile_query()).
+        self.phrase_stop_words = frozenset(cleanup.load_filter_stop_words())
+
         self.model = None  # Saves the current IR model in use.
         # Controls how many results should be shown for a query.
         self.output_k = 5
+        # Top-k algorithm of the ranked models and its settings.
+        self.top_k_algorithm = TOP_K_BLOCK_MAX_WAND
+        self.champion_list_size = CHAMPION_LIST_SIZE
+        self.cluster_probes = CLUSTER_PROBES
+        self.postings_budget = None  # Postings budget of score-at-a-time searches, None for no limit.
+        # Work done by the last search (e.g. number of fully scored documents), shown after the results.
+        self.search_statistics = {}
 
     def main_menu(self):
         """
@@ -104,6 +220,8 @@ class InformationRetrievalSystem(object):
             print(f'{CHOICE_UPDATE_STOP_WORDS} - Rebuild stopword list')
             print(f'{CHOICE_SET_MODEL} - Set model')
             print(f'{CHOICE_SHOW_DOCUMENT} - Show a specific document')
+            print(f'{CHOICE_SIMILAR} - Find similar documents')
+            print(f'{CHOICE_REPORTS} - Reports')
             print(f'{CHOICE_EXIT} - Exit')
             action_choice = int(input('Enter choice: '))
 
@@ -135,16 +253,35 @@ class InformationRetrievalSystem(object):
 
                 # Actual query processing begins here:
                 query = input('Query: ')
-                if stemming:
-                    query = porter.stem_query_terms(query)
+                if isinstance(self.model, models.VectorSpaceModel) and self.top_k_algorithm == TOP_K_CLUSTERS:
+                    probes = input(f'Number of probed clusters (default: {CLUSTER_PROBES}): ')
+                    self.cluster_probes = int(probes or CLUSTER_PROBES)
 
                 start_time = time.time()  # Start time measurement
+                query = self.compile_query(query, stemming, stop_word_filtering)
+                self.search_statistics = {}
                 if isinstance(self.model, models.InvertedListBooleanModel):
                     results = self.inverted_list_search(
                         query, stemming, stop_word_filtering)
-                elif isinstance(self.model, models.VectorSpaceModel):
+                elif isinstance(self.model, models.VectorSpaceModel) and \
+                        self.top_k_algorithm == TOP_K_BUCKLEY_LEWIT:
                     results = self.buckley_lewit_search(
                         query, stemming, stop_word_filtering)
+                elif isinstance(self.model, models.VectorSpaceModel) and self.top_k_algorithm == TOP_K_TIERED:
+                    results = self.tiered_search(
+                        query, stemming, stop_word_filtering)
+                elif isinstance(self.model, models.VectorSpaceModel) and self.top_k_algorithm == TOP_K_CLUSTERS:
+                    results = self.cluster_search(
+                        query, stemming, stop_word_filtering, self.cluster_probes)
+                elif isinstance(self.model, models.VectorSpaceModel):
+                    results = self.wand_search(
+                        query, stemming, stop_word_filtering)
+                elif isinstance(self.model, models.BM25Model):
+                    results = self.score_at_a_time_search(
+                        query, stemming, stop_word_filtering)
+                elif isinstance(self.model, models.LSIModel):
+                    results = self.lsi_search(
+                        query, stemming, stop_word_filtering)
                 elif isinstance(self.model, models.SignatureBasedBooleanModel):
                     results = self.signature_search(
                         query, stemming, stop_word_filtering)
@@ -152,9 +289,9 @@ class InformationRetrievalSystem(object):
                     results = self.basic_query_search(
                         query, stemming, stop_word_filtering)
 
-                # Output of results:
-                for (score, document) in results[:self.output_k]:
-                    print(f'{score}: {document}')
+                # Output of results (only the printed documents are looked up in the collection):
+                for (score, document_id) in results[:self.output_k]:
+                    print(f'{score}: {self.collection.get(document_id)}')
 
                 end_time = time.time()  # End time measurement
 
@@ -166,25 +303,31 @@ class InformationRetrievalSystem(object):
                 elapsed_time_ms = (end_time - start_time) * \
                     1000  # calculate the elapsed time
                 print(f'Time taken: {elapsed_time_ms:.2f} ms')
+                for name, value in self.search_statistics.items():
+                    print(f'{name}: {value}')
 
             elif action_choice == CHOICE_EXTRACT:
                 # Extract document collection from text file.
 
                 raw_collection_file = os.path.join(
                     RAW_DATA_PATH, 'aesopa10.txt')
-                self.collection = extraction.extract_collection(
+                collection = extraction.extract_collection(
                     raw_collection_file)
-                assert isinstance(self.collection, list)
-                assert all(isinstance(d, Document) for d in self.collection)
+                assert isinstance(collection, list)
+                assert all(isinstance(d, Document) for d in collection)
 
                 if input('Should stopwords be filtered? [y/N]: ') == 'y':
-                    cleanup.filter_collection(self.collection)
+                    cleanup.filter_collection(collection)
+                    self.phrase_stop_words = frozenset(cleanup.load_filter_stop_words())
 
                 if input('Should stemming be performed? [y/N]: ') == 'y':
-                    porter.stem_all_documents(self.collection)
+                    porter.stem_all_documents(collection)
 
-                extraction.save_collection_as_json(
+                self.collection.close()
+                self.collection = document_store.DocumentStore(collection)
+                extraction.save_collection_as_binary(
                     self.collection, COLLECTION_PATH)
+                self.build_inverted_index()
                 print('Done.\n')
 
             elif action_choice == CHOICE_UPDATE_STOP_WORDS:
@@ -224,6 +367,8 @@ class InformationRetrievalSystem(object):
                     f'{MODEL_BOOL_SIG} - Boolean model with signature-based search')
                 print(f'{MODEL_FUZZY} - Fuzzy set model')
                 print(f'{MODEL_VECTOR} - Vector space model')
+                print(f'{MODEL_BM25} - BM25 model')
+                print(f'{MODEL_LSI} - Latent semantic indexing model')
                 model_choice = int(input('Enter choice: '))
                 if model_choice == MODEL_BOOL_LIN:
                     self.model = models.LinearBooleanModel()
@@ -231,27 +376,97 @@ class InformationRetrievalSystem(object):
                     self.model = models.InvertedListBooleanModel()
                 elif model_choice == MODEL_BOOL_SIG:
                     self.model = models.SignatureBasedBooleanModel()
+                    if self.signature_parameters is not None:
+                        self.model.configure(self.signature_parameters)
+                    print('Signature file organizations:')
+                    print(f'{SIGNATURES_SEQUENTIAL} - Sequential (default)')
+                    print(f'{SIGNATURES_BIT_SLICED} - Bit-sliced')
+                    if int(input('Enter choice: ') or SIGNATURES_SEQUENTIAL) == SIGNATURES_BIT_SLICED:
+                        self.model.organization = signatures.ORGANIZATION_BIT_SLICED
+                    if input('Tune the signature parameters for a false-drop budget? [y/N]: ') == 'y':
+                        target = input(f'Highest acceptable false-drop rate (default: '
+                                       f'{signatures.TARGET_FALSE_DROP_RATE}): ')
+                        stemming = input('Tune for stemmed terms? [y/N]: ') == 'y'
+                        stop_word_filtering = not stemming and input('Tune for terms without stopwords? [y/N]: ') == 'y'
+                        self.tune_signatures(float(target or signatures.TARGET_FALSE_DROP_RATE), stemming,
+                                             stop_word_filtering)
                 elif model_choice == MODEL_FUZZY:
                     self.model = models.FuzzySetModel()
                 elif model_choice == MODEL_VECTOR:
                     self.model = models.VectorSpaceModel()
+                    print('Top-k algorithms:')
+                    print(f'{TOP_K_BUCKLEY_LEWIT} - Buckley & Lewit')
+                    print(f'{TOP_K_WAND} - WAND')
+                    print(f'{TOP_K_BLOCK_MAX_WAND} - Block-Max WAND (default)')
+                    print(f'{TOP_K_TIERED} - Tiered index with champion lists (approximate)')
+                    print(f'{TOP_K_CLUSTERS} - Cluster-based search (approximate)')
+                    self.top_k_algorithm = int(input('Enter choice: ') or TOP_K_BLOCK_MAX_WAND)
+                    if self.top_k_algorithm == TOP_K_TIERED:
+                        champion_list_size = input(f'Champion list size r (default: {CHAMPION_LIST_SIZE}): ')
+                        self.champion_list_size = int(champion_list_size or CHAMPION_LIST_SIZE)
+                    pruning_budget = input('Fraction of postings to keep after static pruning (default: 1 = all): ')
+                    self.set_pruning_budget(float(pruning_budget or 1.0))
+                elif model_choice == MODEL_BM25:
+                    self.model = models.BM25Model()
+                    postings_budget = input('Postings budget per query (default: no limit): ')
+                    self.postings_budget = int(postings_budget) if postings_budget else None
+                elif model_choice == MODEL_LSI:
+                    self.model = models.LSIModel()
                 else:
                     print('Invalid choice.')
 
             elif action_choice == CHOICE_SHOW_DOCUMENT:
                 target_id = int(input('ID of the desired document:'))
-                found = False
-                for document in self.collection:
-                    if document.document_id == target_id:
-                        print(document.title)
-                        print('-' * len(document.title))
-                        print(document.raw_text)
-                        found = True
-
-                if not found:
+                document = self.collection.get(target_id)
+                if document is not None:
+                    print(document.title)
+                    print('-' * len(document.title))
+                    print(document.raw_text)
+                    if target_id in self.near_duplicates:
+                        print()
+                        print(f'Near-duplicates: {sorted(self.near_duplicates[target_id])}')
+                else:
                     print(f'Document #{target_id} not found!')
 
+            elif action_choice == CHOICE_SIMILAR:
+                target_id = int(input('ID of the document: '))
+                stemming = input('Compare stemmed terms? [y/N]: ') == 'y'
+                if self.collection.get(target_id) is not None:
+                    start_time = time.time()
+                    results = self.similar_documents(target_id, stemming)
+                    for (score, document_id) in results:
+                        print(f'{score}: {self.collection.get(document_id)}')
+                    print()
+                    print(f'Time taken: {(time.time() - start_time) * 1000:.2f} ms')
+                    for name, value in self.search_statistics.items():
+                        print(f'{name}: {value}')
+                else:
+                    print(f'Document #{target_id} not found!')
+
+            elif action_choice == CHOICE_REPORTS:
+                # Compare fast or approximate search methods with exact search.
+                print('Available reports:')
+                print(f'{REPORT_CHAMPION_LISTS} - Tiered index / champion lists vs. exact search')
+                print(f'{REPORT_PRUNING} - Static index pruning')
+                print(f'{REPORT_CLUSTERS} - Cluster-based search vs. exhaustive search')
+                print(f'{REPORT_SIGNATURES} - Bit-sliced vs. sequential signature files')
+                report_choice = int(input('Enter choice: '))
+                queries = reports.benchmark_queries(load_ground_truth_inline())
+                if report_choice == REPORT_CHAMPION_LISTS:
+                    reports.champion_list_report(self, queries)
+                elif report_choice == REPORT_PRUNING:
+                    reports.pruning_report(self, queries)
+                elif report_choice == REPORT_CLUSTERS:
+                    reports.cluster_report(self, queries)
+                elif report_choice == REPORT_SIGNATURES:
+                    reports.signature_report(self, queries)
+                else:
+                    print('Invalid choice.')
+
             elif action_choice == CHOICE_EXIT:
+                self.save_statistics()
+                self.inverted_index.close()
+                self.collection.close()
                 break
             else:
                 print('Invalid choice.')
@@ -260,16 +475,16 @@ class InformationRetrievalSystem(object):
             input('Press ENTER to continue...')
             print()
 
-    def basic_query_search(self, query: str, stemming: bool, stop_word_filtering: bool) -> list:
+    def basic_query_search(self, query: CompiledQuery, stemming: bool, stop_word_filtering: bool) -> list:
         """
         Searches the collection for a query string. This method is "basic" in that it does not use any special algorithm
         to accelerate the search. It simply calculates all representations and matches them, returning a sorted list of
         the k most relevant documents and their scores.
-        :param query: Query string
+        :param query: Compiled query (see compile_query())
         :param stemming: Controls, whether stemming is used
         :param stop_word_filtering: Controls, whether stop-words are ignored in the search
         :return: List of tuples, where the first element is the relevance score and the second the corresponding
-        document
+        document ID
         """
         query_representation = self.model.query_to_representation(query)
         document_representations = [self.model.document_to_representation(d, stop_word_filtering, stemming)
@@ -278,526 +493,562 @@ class InformationRetrievalSystem(object):
         scores = [self.model.match(dr, query_representation)
                   for dr in document_representations]
         ranked_collection = sorted(
-            zip(scores, self.collection), key=lambda x: x[0], reverse=True)
+            zip(scores, self.collection.document_ids), key=lambda x: x[0], reverse=True)
 
         results = ranked_collection
         return results
 
-    def inverted_list_search(self, query: str, stemming: bool, stop_word_filtering: bool) -> list:
-        inverted_list_stemmed = {}
-        inverted_list_stopped_words = {}
-        stopped_terms = [self.model.document_to_representation(d, True, False)
-                         for d in self.collection]
-        stemmed_terms = [self.model.document_to_representation(d, False, True)
-                         for d in self.collection]
-        query_representation = self.model.query_to_representation(query)
-        for sublist in stemmed_terms:
-            for element in sublist:
-                if len(inverted_list_stemmed) == 0:
-                    inverted_list_stemmed[element] = [
-                        stemmed_terms.index(sublist)]
-                else:
-                    if element in inverted_list_stemmed:
-                        if stemmed_terms.index(sublist) not in inverted_list_stemmed[element]:
-                            inverted_list_stemmed[element].append(
-                                stemmed_terms.index(sublist))
-                    else:
-                        inverted_list_stemmed[element] = [
-                            stemmed_terms.index(sublist)]
-
-        for sublist in stopped_terms:
-            for element in sublist:
-                if len(inverted_list_stopped_words) == 0:
-                    inverted_list_stopped_words[element] = [
-                        stopped_terms.index(sublist)]
-                else:
-                    if element in inverted_list_stopped_words:
-                        if stopped_terms.index(sublist) not in inverted_list_stopped_words[element]:
-                            inverted_list_stopped_words[element].append(
-                                stopped_terms.index(sublist))
-                    else:
-                        inverted_list_stopped_words[element] = [
-                            stopped_terms.index(sublist)]
-        if stemming:
-            documents = [self.collection[i]
-                         for i in self.model.match(inverted_list_stemmed, query_representation)]
-        else:
-            documents = [self.collection[i]
-                         for i in self.model.match(inverted_list_stopped_words, query_representation)]
-        scores = [1.0 if doc in documents else 0.0 for doc in self.collection]
-        ranked_collection = sorted(
-            zip(scores, self.collection), key=lambda x: x[0], reverse=True)
-
-        # results = ranked_collection[:self.output_k]
-        results = ranked_collection
-        return results
-
-    def buckley_lewit_search(self, query: str, stemming: bool, stop_word_filtering: bool) -> list:
+    def compile_query(self, query, stemming: bool, stop_word_filtering: bool) -> CompiledQuery:
         """
-        Fast query search for the Vector Space Model using the algorithm by Buckley & Lewit.
+        Compiles a query for the chosen model and search options and binds it to the term dictionary, once per user
+        query; the search methods take the result (see query_compiler.compile_and_bind()). The inverted index and the
+        filtered and stemmed term columns do not hold stop words, so when they are searched, stop words are removed
+        from phrases, which then match on the positions of the filtered terms in every Boolean model.
         :param query: Query string
         :param stemming: Controls, whether stemming is used
         :param stop_word_filtering: Controls, whether stop-words are ignored in the search
-        :return: List of tuples, where the first element is the relevance score and the second the corresponding
-        document
+        :return: The compiled query in term ID space
         """
-        # TODO: Implement this function (PR04)
+        filtered_terms = stemming or stop_word_filtering or isinstance(self.model, models.InvertedListBooleanModel)
+        return query_compiler.compile_and_bind(query, stemming, self.phrase_stop_words if filtered_terms else None)
 
-        query_weights_without_log = self.model.query_to_representation(query)
+    def build_inverted_index(self):
+        """
+        Builds the inverted index, the statistics catalogs, the BM25 impacts, the document clusters, the latent
+        semantic indexes and the MinHash sketches of the current collection, and flags near-duplicate documents. They
+        are stored next to the collection.
+        """
+        self.inverted_index.rebuild(self.collection)
+        self.signature_files = {}
+        self.statistics = LazyIndexes(self.load_statistics_catalog, {
+            view: catalog.StatisticsCatalog(self.collection.document_ids,
+                                            self.collection.term_arrays(view_column(view)))
+            for view in indexing.VIEWS})
+        self.impact_indexes = LazyIndexes(self.load_impact_index, {
+            view: bm25.ImpactIndex(statistics) for view, statistics in self.statistics.items()})
+        self.cluster_indexes = LazyIndexes(self.load_cluster_index, {
+            view: clustering.ClusterIndex.build(statistics) for view, statistics in self.statistics.items()})
+        self.lsi_indexes = LazyIndexes(self.load_lsi_index, {
+            view: lsi.LatentSemanticIndex.build(statistics) for view, statistics in self.statistics.items()})
+        self.minhash_indexes = LazyIndexes(self.load_minhash_index, {
+            view: minhash.MinHashIndex.build(self.collection.document_ids,
+                                             self.collection.term_arrays(view_column(view)))
+            for view in indexing.VIEWS})
+        self.flag_near_duplicates()
+        self.save_statistics()
+        self.tfidf_matrices = {}
+
+    def load_statistics(self):
+        """
+        Prepares loading the stored statistics catalogs, BM25 impacts, document clusters, latent semantic indexes
+        (memory-mapped), MinHash sketches and near-duplicate flags. Each is loaded on first use (see LazyIndexes);
+        those that are missing or do not match the collection (e.g. after the program was not exited through the menu)
+        are rebuilt then.
+        """
+        self.statistics = LazyIndexes(self.load_statistics_catalog)
+        self.impact_indexes = LazyIndexes(self.load_impact_index)
+        self.cluster_indexes = LazyIndexes(self.load_cluster_index)
+        self.lsi_indexes = LazyIndexes(self.load_lsi_index)
+        self.minhash_indexes = LazyIndexes(self.load_minhash_index)
+        self._near_duplicates = None
+        self.near_duplicates_stored = os.path.exists(NEAR_DUPLICATES_PATH)
+        self.tfidf_matrices = {}
+
+    def load_statistics_catalog(self, view: str) -> catalog.StatisticsCatalog:
+        statistics = None
+        if os.path.exists(statistics_path(view)):
+            statistics = catalog.StatisticsCatalog.load(statistics_path(view))
+        if statistics is None or not statistics.is_catalog_of(self.collection.document_ids):
+            statistics = catalog.StatisticsCatalog(self.collection.document_ids,
+                                                   self.collection.term_arrays(view_column(view)))
+        return statistics
+
+    def load_impact_index(self, view: str) -> bm25.ImpactIndex:
+        impact_index = None
+        if os.path.exists(impacts_path(view)):
+            impact_index = bm25.ImpactIndex.load(impacts_path(view), self.statistics[view])
+        if impact_index is None or not impact_index.is_index_of_catalog():
+            impact_index = bm25.ImpactIndex(self.statistics[view])
+        return impact_index
+
+    def load_cluster_index(self, view: str) -> clustering.ClusterIndex:
+        cluster_index = None
+        if os.path.exists(clusters_path(view)):
+            cluster_index = clustering.ClusterIndex.load(clusters_path(view), self.statistics[view])
+        if cluster_index is None or not cluster_index.is_index_of_catalog():
+            cluster_index = clustering.ClusterIndex.build(self.statistics[view])
+        return cluster_index
+
+    def load_lsi_index(self, view: str) -> lsi.LatentSemanticIndex:
+        lsi_index = lsi.LatentSemanticIndex.load(INDEX_PATH, view, self.statistics[view])
+        if lsi_index is None or not lsi_index.is_index_of_catalog():
+            lsi_index = lsi.LatentSemanticIndex.build(self.statistics[view])
+        return lsi_index
+
+    def load_minhash_index(self, view: str) -> minhash.MinHashIndex:
+        minhash_index = None
+        if os.path.exists(minhash_path(view)):
+            minhash_index = minhash.MinHashIndex.load(minhash_path(view))
+        if minhash_index is None or not minhash_index.is_index_of(self.collection.document_ids):
+            minhash_index = minhash.MinHashIndex.build(self.collection.document_ids,
+                                                       self.collection.term_arrays(view_column(view)))
+            if view == indexing.VIEW_FILTERED:
+                self.near_duplicates_stored = False  # The stored flags were computed from other sketches.
+        return minhash_index
+
+    @property
+    def near_duplicates(self) -> dict[int, set]:
+        """
+        Near-duplicates of every document that has some. Loaded on first use, or flagged anew if the stored flags do
+        not belong to the MinHash sketches of the filtered view.
+        """
+        if self._near_duplicates is None:
+            self.minhash_indexes[indexing.VIEW_FILTERED]  # Loading the sketches validates the stored flags.
+            if self.near_duplicates_stored:
+                self._near_duplicates = {}
+                with np.load(NEAR_DUPLICATES_PATH) as stored:
+                    for first_id, second_id in stored['pairs'].tolist():
+                        self._near_duplicates.setdefault(first_id, set()).add(second_id)
+                        self._near_duplicates.setdefault(second_id, set()).add(first_id)
+            else:
+                self.flag_near_duplicates()
+        return self._near_duplicates
 
-        terms = [self.model.document_to_representation(d, True, False)
-                 for d in self.collection]
-        document_terms_weight, query_terms_weight = self.model.match(
-            terms, query_weights_without_log)
-
-        auxilary_DS = {}
-        top_docs = []
-        top_docs_size = 10
-
-        def InitList(k):
-            inverted_list = []
-            # print("stopped_terms")
-            # print(stopped_terms)
-            for sublist in terms:
-                if k in sublist:
-                    if not k in inverted_list:
-                        inverted_list.append(terms.index(sublist))
-            return inverted_list
-
-        def GetNextElementOfList(document, term):
-            # return document and it's weight
-            return document_terms_weight[document][term]
-
-        def IsInDS(document):
-            return True if document in auxilary_DS else False
-
-        def InsertIntoDS(document, weight):
-            auxilary_DS[document] = weight
-            InsertIntoTopDocs(document, weight)
-            return
-
-        def AddToDSEntry(document, weight):
-            auxilary_DS[document] += weight
-            InsertIntoTopDocs(document, weight)
-            return
-
-        def GetWeightFromDS(document):
-
-            return auxilary_DS[document]
-
-        def InsertIntoTopDocs(document, weight):
-
-            updated = False
-            for idx, (key, value) in enumerate(top_docs):
-                if key == document:
-                    top_docs[idx][1] = (weight+value)
-                    updated = True
-                    break
-
-            if not updated:
-                top_docs.append([document, weight])
-
-            top_docs.sort(key=lambda x: x[1], reverse=True)
-            return
-
-        def MaxRemainingWeight(index):
-            remaining_weight = 0
-            for idx in range((index+1), len(query_terms_weight)):
-                key, value = query_terms_weight[idx]
-                remaining_weight += value
-            return remaining_weight
-
-        def isTopDocsTerminate(index):
-            if (len(top_docs) > (top_docs_size)):
-                if top_docs[(top_docs_size-1)][1] > (top_docs[(top_docs_size)][1]+MaxRemainingWeight(index)):
-                    return True
-                else:
-                    return False
+    def load_derived_indexes(self):
+        """
+        Loads all indexes derived from the collection. Called before the collection changes, so that the stored
+        indexes are still validated against the collection they were built for and then updated incrementally.
+        """
+        for indexes in [self.statistics, self.impact_indexes, self.cluster_indexes, self.lsi_indexes,
+                        self.minhash_indexes]:
+            for view in indexing.VIEWS:
+                indexes[view]
+        self.near_duplicates
+
+    def save_statistics(self):
+        for view, statistics in self.statistics.items():
+            statistics.save(statistics_path(view))
+        for view, impact_index in self.impact_indexes.items():
+            impact_index.save(impacts_path(view))
+        for view, cluster_index in self.cluster_indexes.items():
+            cluster_index.save(clusters_path(view))
+        for view, lsi_index in self.lsi_indexes.items():
+            lsi_index.save(INDEX_PATH, view)
+        for view, minhash_index in self.minhash_indexes.items():
+            minhash_index.save(minhash_path(view))
+        if self._near_duplicates is None:
+            return  # Not loaded, so the stored flags are unchanged.
+        pairs = [(document_id, other_id) for document_id, other_ids in self._near_duplicates.items()
+                 for other_id in other_ids if document_id < other_id]
+        with open(NEAR_DUPLICATES_PATH, 'wb') as near_duplicates_file:
+            np.savez(near_duplicates_file, pairs=np.array(pairs, dtype=np.int64).reshape(-1, 2))
+        self.near_duplicates_stored = True
+
+    def tfidf_matrix(self, view: str) -> tfidf.TfIdfMatrix:
+        """
+        Returns the TF-IDF matrix of a term view (see indexing.VIEWS) of the collection.
+        """
+        if view not in self.tfidf_matrices:
+            if self.pruning_budget < 1.0:
+                self.tfidf_matrices[view] = pruning.PrunedTfIdfMatrix(self.statistics[view], self.pruning_budget,
+                                                                      self.pruning_method)
             else:
-                return False
+                self.tfidf_matrices[view] = tfidf.TfIdfMatrix(self.statistics[view])
+        return self.tfidf_matrices[view]
 
-        def buckley(query_weights):
-            for index, term in enumerate(query_weights):
-                inverted_list = InitList(term[0])
-                for document in inverted_list:
-                    term_weight_in_doc = GetNextElementOfList(
-                        document, term[0])
+    def set_pruning_budget(self, budget: float):
+        """
+        Sets the fraction of postings that static pruning keeps and prunes the TF-IDF matrices accordingly.
+        """
+        self.pruning_budget = budget
+        self.build_tfidf_matrices()
 
-                    weight = (term_weight_in_doc*term[1])
+    def build_tfidf_matrices(self):
+        """
+        Builds the TF-IDF matrices of all term views from the statistics catalogs, including static pruning.
+        """
+        self.tfidf_matrices = {}
+        for view in indexing.VIEWS:
+            self.tfidf_matrix(view)
 
-                    if IsInDS(document):
-                        AddToDSEntry(document, weight)
-                    else:
-                        InsertIntoDS(document, weight)
-                if isTopDocsTerminate(index):
-                    return top_docs
-            return top_docs
+    def prune_tfidf_matrices(self):
+        """
+        Re-runs static pruning on the TF-IDF matrices after the collection changed.
+        """
+        for matrix in self.tfidf_matrices.values():
+            if isinstance(matrix, pruning.PrunedTfIdfMatrix):
+                matrix.prune()
 
-        result = buckley(query_terms_weight)
+    def add_document(self, title: str, raw_text: str) -> document_store.DocumentView:
+        """
+        Adds a single document to the collection. Only the new document is processed and indexed: it goes into a new
+        index segment and is recorded in the journal of the saved collection.
+        :param title: Title of the new document
+        :param raw_text: Complete text of the new document
+        :return: The new document
+        """
+        document_id = max(self.inverted_index.next_document_id, self.collection.next_document_id)
+        document = extraction.create_document(document_id, title, raw_text)
+        document.filtered_terms = cleanup.remove_stop_words_from_term_list(document.terms)
+        porter.stem_all_documents([document])
+
+        self.load_derived_indexes()
+        self.inverted_index.add_documents([document])
+        for view, statistics in self.statistics.items():
+            statistics.add_documents([document_id], [getattr(document, view_column(view))])
+            self.impact_indexes[view].add_document(document_id, getattr(document, view_column(view)))
+            self.cluster_indexes[view].add_document(document_id, getattr(document, view_column(view)))
+            self.lsi_indexes[view].add_document(document_id, getattr(document, view_column(view)))
+        near_duplicates = self.minhash_indexes[indexing.VIEW_FILTERED].add_document(
+            document_id, document.filtered_term_ids, self.term_ids_of(indexing.VIEW_FILTERED))
+        self.minhash_indexes[indexing.VIEW_STEMMED].add_document(
+            document_id, document.stemmed_term_ids, self.term_ids_of(indexing.VIEW_STEMMED))
+        for _, other_id in near_duplicates:
+            self.near_duplicates.setdefault(document_id, set()).add(other_id)
+            self.near_duplicates.setdefault(other_id, set()).add(document_id)
+        self.prune_tfidf_matrices()
+        self.signature_files = {}
+        extraction.append_to_journal(COLLECTION_PATH, added=[document])
+        self.inverted_index.merge_in_background()
+        return self.collection.append(document)
+
+    def delete_document(self, document_id: int) -> bool:
+        """
+        Deletes a single document from the collection. The index only records a tombstone; the postings of the
+        document are dropped when its segment is merged.
+        :param document_id: ID of the document to delete
+        :return: True if the document existed
+        """
+        document = self.collection.get(document_id)
+        if document is None:
+            return False
+        self.load_derived_indexes()
+        for view, statistics in self.statistics.items():
+            statistics.delete_document(document_id, getattr(document, view_column(view)))
+            self.impact_indexes[view].delete_document()
+            self.cluster_indexes[view].delete_document(document_id)
+            self.lsi_indexes[view].delete_document(document_id)
+            self.minhash_indexes[view].delete_document(document_id)
+        for other_id in self.near_duplicates.pop(document_id, ()):
+            self.near_duplicates[other_id].discard(document_id)
+            if not self.near_duplicates[other_id]:
+                del self.near_duplicates[other_id]
+        self.prune_tfidf_matrices()
+        self.signature_files = {}
+        self.collection.delete(document_id)
+        self.inverted_index.delete_document(document_id)
+        extraction.append_to_journal(COLLECTION_PATH, deleted=[document_id])
+        self.inverted_index.merge_in_background()
+        return True
+
+    def term_ids_of(self, view: str):
+        """
+        Returns a function that looks up the term ID array of a document ID in a term view.
+        """
+        return lambda document_id: getattr(self.collection.get(document_id), view_column(view))
 
-        all_docs = [[i, 0.0] for i in range(82)]
+    def flag_near_duplicates(self):
+        """
+        Flags all pairs of near-duplicate documents of the collection (see minhash.NEAR_DUPLICATE_THRESHOLD), comparing
+        their stopword-filtered terms. This only runs when the MinHash sketches are built; afterwards, the flags are
+        stored with them and updated when documents are added or deleted.
+        """
+        minhash_index = self.minhash_indexes[indexing.VIEW_FILTERED]
+        self._near_duplicates = {}
+        for document_id in map(int, self.collection.document_ids):
+            near_duplicates, _ = minhash_index.similar(document_id, self.term_ids_of(indexing.VIEW_FILTERED),
+                                                       threshold=minhash.NEAR_DUPLICATE_THRESHOLD)
+            if near_duplicates:
+                self._near_duplicates[document_id] = {other_id for _, other_id in near_duplicates}
+
+    def similar_documents(self, document_id: int, stemming: bool = False) -> list:
+        """
+        "More like this" search: finds the documents most similar to a document of the collection by the Jaccard
+        similarity of their terms. Candidates come from the MinHash LSH index (see minhash.MinHashIndex); only they are
+        compared exactly. The number of candidates is kept in search_statistics.
+        :param document_id: ID of the document
+        :param stemming: Controls, whether stemmed or stopword-filtered terms are compared
+        :return: List of tuples, where the first element is the Jaccard similarity and the second the corresponding
+        document ID, for the top output_k documents
+        """
+        view = indexing.VIEW_STEMMED if stemming else indexing.VIEW_FILTERED
+        results, candidates = self.minhash_indexes[view].similar(document_id, self.term_ids_of(view), self.output_k)
+        self.search_statistics = {'Candidates': candidates}
+        return [(round(score, 4), document_id) for score, document_id in results]
 
-        for doc_id, score in result:
-            all_docs[doc_id][1] = round(score, 4)
+    def inverted_list_search(self, query: CompiledQuery, stemming: bool, stop_word_filtering: bool) -> list:
+        """
+        Fast Boolean query search that only reads the posting lists of the query terms from the inverted index. The
+        index holds the stopword-filtered terms, so stop words are removed from phrases, which then match on the
+        positions of the filtered terms.
+        :param query: Compiled query (see compile_query())
+        :param stemming: Controls, whether stemming is used
+        :param stop_word_filtering: Controls, whether stop-words are ignored in the search
+        :return: List of tuples, where the first element is the relevance score and the second the corresponding
+        document ID
+        """
+        query_representation = self.model.query_to_representation(query)
+        if stemming:
+            inverted_list = self.inverted_index.view(indexing.VIEW_STEMMED)
+        else:
+            inverted_list = self.inverted_index.view(indexing.VIEW_FILTERED)
+        matching_ids = set(self.model.match(inverted_list, query_representation))
 
-        scores = [score[1] for score in all_docs]
+        scores = [1.0 if document_id in matching_ids else 0.0 for document_id in self.collection.document_ids]
         ranked_collection = sorted(
-            zip(scores, self.collection), key=lambda x: x[0], reverse=True)
-        final_result = ranked_collection
-        return final_result
-        # raise NotImplementedError('To be implemented in PR04')
+            zip(scores, self.collection.document_ids), key=lambda x: x[0], reverse=True)
 
-    def signature_search(self, query: str, stemming: bool, stop_word_filtering: bool) -> list:
+        results = ranked_collection
+        return results
+
+    def buckley_lewit_search(self, query: CompiledQuery, stemming: bool, stop_word_filtering: bool) -> list:
         """
-        Fast Boolean query search using signatures for quicker processing.
-        :param query: Query string
+        Fast query search for the Vector Space Model using the algorithm by Buckley & Lewit (see
+        ranking.buckley_lewit()). Only the top output_k documents are determined.
+        :param query: Compiled query (see compile_query())
         :param stemming: Controls, whether stemming is used
         :param stop_word_filtering: Controls, whether stop-words are ignored in the search
         :return: List of tuples, where the first element is the relevance score and the second the corresponding
-        document
+        document ID, for the top output_k documents
         """
-        # TODO: Implement this function (PR04)
+        query_weights_without_log = self.model.query_to_representation(query)
+
+        matrix = self.tfidf_matrix(indexing.VIEW_STEMMED if stemming else indexing.VIEW_FILTERED)
+        query_terms_weight = self.model.query_term_weights(matrix, query_weights_without_log)
+        top_documents = ranking.buckley_lewit(matrix, query_terms_weight, self.output_k)
+        return [(round(score, 4), int(matrix.document_ids[row])) for score, row in top_documents]
 
+    def wand_search(self, query: CompiledQuery, stemming: bool, stop_word_filtering: bool) -> list:
+        """
+        Fast query search for ranked models with WAND or Block-Max WAND (see ranking.wand()), depending on the chosen
+        top-k algorithm. Only the top output_k documents are determined; they are the same as with exhaustive
+        scoring. The number of fully scored documents is kept in search_statistics.
+        :param query: Compiled query (see compile_query())
+        :param stemming: Controls, whether stemming is used
+        :param stop_word_filtering: Controls, whether stop-words are ignored in the search
+        :return: List of tuples, where the first element is the relevance score and the second the corresponding
+        document ID, for the top output_k documents
+        """
         query_representation = self.model.query_to_representation(query)
-        document_representation = [self.model.document_to_representation(d, stemming, stop_word_filtering)
-                                   for d in self.collection]
-        scores = self.model.match(document_representation,
-                                  query_representation)
 
-        updated_scores = []
+        matrix = self.tfidf_matrix(indexing.VIEW_STEMMED if stemming else indexing.VIEW_FILTERED)
+        top_documents, scored_documents = ranking.wand(
+            self.model.query_postings(matrix, query_representation), self.output_k,
+            block_max=self.top_k_algorithm == TOP_K_BLOCK_MAX_WAND)
+        self.search_statistics = {'Fully scored documents': scored_documents}
+        return [(round(score, 4), int(matrix.document_ids[row])) for score, row in top_documents]
+
+    def tiered_search(self, query: CompiledQuery, stemming: bool, stop_word_filtering: bool) -> list:
+        """
+        Approximate query search for the Vector Space Model on a tiered index (see ranking.tiered()): only the
+        champion lists of the query terms are read unless they hold fewer than output_k documents. The number of read
+        tiers is kept in search_statistics.
+        :param query: Compiled query (see compile_query())
+        :param stemming: Controls, whether stemming is used
+        :param stop_word_filtering: Controls, whether stop-words are ignored in the search
+        :return: List of tuples, where the first element is the relevance score and the second the corresponding
+        document ID, for the top output_k documents
+        """
+        query_representation = self.model.query_to_representation(query)
 
-        for count, (score, document) in enumerate(zip(scores, self.collection)):
+        matrix = self.tfidf_matrix(indexing.VIEW_STEMMED if stemming else indexing.VIEW_FILTERED)
+        top_documents, read_tiers = ranking.tiered(
+            self.model.query_tiers(matrix, query_representation, self.champion_list_size), self.output_k)
+        self.search_statistics = {'Read tiers': read_tiers}
+        return [(round(score, 4), int(matrix.document_ids[row])) for score, row in top_documents]
 
-            # Determine which document attribute to check based on the flags
-            if stemming:
-                doc_terms = document.stemmed_terms
-            elif stop_word_filtering:
-                doc_terms = document.filtered_terms
-            else:
-                doc_terms = document.terms
+    def cluster_search(self, query: CompiledQuery, stemming: bool, stop_word_filtering: bool,
+                       probes: int = None) -> list:
+        """
+        Approximate query search for the Vector Space Model on document clusters (see clustering.ClusterIndex): the
+        clusters are ranked by the similarity of their centroids with the query, and only the documents of the best
+        clusters are scored. The number of documents in the probed clusters is kept in search_statistics.
+        :param query: Compiled query (see compile_query())
+        :param stemming: Controls, whether stemming is used
+        :param stop_word_filtering: Controls, whether stop-words are ignored in the search
+        :param probes: Number of probed clusters, cluster_probes by default
+        :return: List of tuples, where the first element is the relevance score and the second the corresponding
+        document ID, for the top output_k documents
+        """
+        query_representation = self.model.query_to_representation(query)
 
-            if score == 1.0 and query in doc_terms:
-                updated_scores.append(1.0)
-            else:
-                updated_scores.append(0.0)
+        view = indexing.VIEW_STEMMED if stemming else indexing.VIEW_FILTERED
+        matrix = self.tfidf_matrix(view)
+        top_documents, probed_documents = self.cluster_indexes[view].search(
+            dict(self.model.query_term_weights(matrix, query_representation)), self.output_k,
+            probes or self.cluster_probes)
+        self.search_statistics = {'Documents in probed clusters': probed_documents}
+        return [(round(score, 4), int(matrix.document_ids[row])) for score, row in top_documents]
 
-        results = [(score, i) for i, score in enumerate(scores)]
-        # # Sort results by score in descending order
-        ranked_collection = sorted(results, key=lambda x: x[0], reverse=True)
+    def score_at_a_time_search(self, query: CompiledQuery, stemming: bool, stop_word_filtering: bool) -> list:
+        """
+        Fast query search for the BM25 model: score-at-a-time evaluation over the quantized impacts of the query
+        terms (see ranking.score_at_a_time()), stopped early when the postings budget is used up. The number of
+        processed postings is kept in search_statistics.
+        :param query: Compiled query (see compile_query())
+        :param stemming: Controls, whether stemming is used
+        :param stop_word_filtering: Controls, whether stop-words are ignored in the search
+        :return: List of tuples, where the first element is the relevance score and the second the corresponding
+        document ID, for the top output_k documents
+        """
+        query_representation = self.model.query_to_representation(query)
+
+        view = indexing.VIEW_STEMMED if stemming else indexing.VIEW_FILTERED
+        impact_index = self.impact_indexes[view]
+        top_documents, processed_postings = ranking.score_at_a_time(
+            self.model.query_segments(impact_index, query_representation), self.output_k,
+            self.statistics[view].live, self.postings_budget)
+        self.search_statistics = {'Processed postings': processed_postings}
+        # Scores are sums of quantized impacts; dividing by the quantization scale brings them back to BM25 units.
+        return [(round(score / impact_index.scale, 4), int(self.statistics[view].document_ids[row]))
+                for score, row in top_documents]
+
+    def lsi_search(self, query: CompiledQuery, stemming: bool, stop_word_filtering: bool) -> list:
+        """
+        Query search for the LSI model: the query is projected into the latent space and all documents are scored with
+        one dense matrix-vector product (see lsi.LatentSemanticIndex).
+        :param query: Compiled query (see compile_query())
+        :param stemming: Controls, whether stemming is used
+        :param stop_word_filtering: Controls, whether stop-words are ignored in the search
+        :return: List of tuples, where the first element is the relevance score and the second the corresponding
+        document ID, for the top output_k documents
+        """
+        query_representation = self.model.query_to_representation(query)
 
-        # # Extract the top-k results and format them as (score, document)
-        results = [(score, self.collection[i])
-                   for score, i in ranked_collection]
+        lsi_index = self.lsi_indexes[indexing.VIEW_STEMMED if stemming else indexing.VIEW_FILTERED]
+        top_documents = ranking.dense_top_k(self.model.match(lsi_index, query_representation), self.output_k)
+        return [(round(score, 4), int(lsi_index.document_ids[row])) for score, row in top_documents]
 
-        return results
-        # raise NotImplementedError('To be implemented in PR04')
+    def signature_file(self, stemming: bool, stop_word_filtering: bool):
+        """
+        Returns the signature file of the signature-based model for the chosen terms of the collection. It is kept until
+        the collection, the term column or the model parameters change.
+        :param stemming: Controls, whether stemming is used
+        :param stop_word_filtering: Controls, whether stop-words are ignored in the search
+        :return: The signature file (see signatures.SignatureFile)
+        """
+        column = signature_column(stemming, stop_word_filtering)
+        key = (column, self.model.D, self.model.F, self.model.m, self.model.document_F, self.model.document_m,
+               self.model.organization)
+        if key not in self.signature_files:
+            self.signature_files = {key: self.model.signature_file(self.collection.term_arrays(column))}
+        return self.signature_files[key]
+
+    def tune_signatures(self, target: float, stemming: bool, stop_word_filtering: bool) -> dict:
+        """
+        Tunes the parameters of the signature-based model on a term column for a false-drop budget and validates them
+        on the ground truth terms and random terms (see reports.signature_tuning_report()). The model is configured
+        with the chosen parameters, which are stored next to the index and configured whenever the model is chosen.
+        :param target: False-drop budget, the highest acceptable fraction of the documents without a query term that
+        the signatures match
+        :param stemming: Controls, whether the stemmed terms are tuned for
+        :param stop_word_filtering: Controls, whether the terms without stop-words are tuned for
+        :return: The tuned parameters (see signatures.PARAMETERS)
+        """
+        column = signature_column(stemming, stop_word_filtering)
+        parameters = reports.signature_tuning_report(self, column, sorted(load_ground_truth_inline()),
+                                                     self.model.parameters, target)
+        self.model.configure(parameters)
+        self.signature_parameters = dict(parameters, column=column, target_false_drop_rate=target)
+        os.makedirs(INDEX_PATH, exist_ok=True)
+        with open(SIGNATURE_PARAMETERS_PATH, 'w') as f:
+            json.dump(self.signature_parameters, f, indent=2)
+        return parameters
+
+    def signature_search(self, query: CompiledQuery, stemming: bool, stop_word_filtering: bool) -> list:
+        """
+        Fast Boolean query search on the two-level signature file (see signatures.SignatureFile): document signatures
+        are checked first, then the block signatures of the remaining documents. Documents that the signatures can not
+        decide are verified exactly on their terms, so false drops are not returned. Candidates, false drops and the
+        time of every level are kept in search_statistics.
+        :param query: Compiled query (see compile_query())
+        :param stemming: Controls, whether stemming is used
+        :param stop_word_filtering: Controls, whether stop-words are ignored in the search
+        :return: List of tuples, where the first element is the relevance score and the second the corresponding
+        document ID
+        """
+        query_representation = self.model.query_to_representation(query)
+        document_representation = self.signature_file(stemming, stop_word_filtering)
+        counters = {}
+        possible, certain = self.model.evaluate(document_representation, query_representation.tree, counters)
+
+        start_time = time.perf_counter()
+        column = signature_column(stemming, stop_word_filtering)
+        unverified = np.flatnonzero(possible & ~certain)
+        verified = [row for row in unverified.tolist()
+                    if self.model.verify(self.collection.term_array(column, row), query_representation.tree)]
+        matches = certain.copy()
+        matches[verified] = True
+        self.search_statistics = {
+            'Document-level candidates': counters.get('document_candidates', 0),
+            'Block-level candidates': counters.get('block_candidates', 0),
+            'Verified documents': len(unverified),
+            'False drops': len(unverified) - len(verified),
+            'Time document level': f'{counters.get("document_time", 0.0) * 1000:.2f} ms',
+            'Time block level': f'{counters.get("block_time", 0.0) * 1000:.2f} ms',
+            'Time verification': f'{(time.perf_counter() - start_time) * 1000:.2f} ms'}
+
+        return sorted(((1.0 if match else 0.0, document_id)
+                       for match, document_id in zip(matches.tolist(), map(int, self.collection.document_ids))),
+                      key=lambda x: x[0], reverse=True)
+
+    def relevant_documents(self, query) -> set:
+        """
+        Determines the relevant documents of a query from the ground truth. The compiled query tree is evaluated on
+        the ground truth lists; phrases and proximity expressions count as the conjunction of their terms.
+        :param query: Query string or compiled query, also in term ID space
+        :return: Set of the IDs of all relevant documents
+        """
+        query = query_compiler.compile_query(query)
+        ground_truth = {term: {int(x) for x in doc_ids} for term, doc_ids in load_ground_truth_inline().items()}
+        if query.stemming:
+            ground_truth = {porter.stem_term(term): doc_ids for term, doc_ids in ground_truth.items()}
+        if term_dictionary.is_bound(query):
+            ground_truth = {term_dictionary.DICTIONARY.lookup(term): doc_ids for term, doc_ids in ground_truth.items()
+                            if term_dictionary.DICTIONARY.lookup(term) != term_dictionary.UNKNOWN_TERM}
+        all_documents = set(self.collection.document_ids)
+
+        def evaluate(tree: tuple) -> set:
+            kind = tree[0]
+            if kind == 'term':
+                relevant = set(all_documents)
+                for term in query_compiler.operand_terms(tree[1]):
+                    relevant &= ground_truth.get(term, set())
+                return relevant
+            if kind == 'not':
+                return all_documents - evaluate(tree[1])
+            child_results = [evaluate(child) for child in tree[1]]
+            if not child_results:
+                return set()
+            if kind == 'and':
+                return set.intersection(*child_results)
+            return set.union(*child_results)
+
+        return evaluate(query.tree)
 
     def calculate_precision(self, query: str, result_list: list[tuple]) -> float:
-        # TODO: Implement this function (PR03)
-        operator_chars = ['&', '|', '-']
-        contains_operators = any(char in query for char in operator_chars)
-        contains_spaces = ' ' in query
-
-        def query_to_representation(query: str):
-            def get_precedence(op):
-                if op == '-':
-                    return 3
-                if op == '&':
-                    return 2
-                if op == '|':
-                    return 1
-                return 0
-
-            def is_operator(c):
-                return c in ['&', '|', '-']
-
-            def convertToList(query):
-                queryList = []
-                i = 0
-                while i < len(query):
-                    if query[i].isalnum():
-                        word = []
-                        while i < len(query) and query[i].isalnum():
-                            word.append(query[i])
-                            i += 1
-                        queryList.append(''.join(word))
-                    elif query[i] == '(':
-                        queryList.append(query[i])
-                        i = i+1
-                    elif query[i] == ')':
-                        queryList.append(query[i])
-                        i = i+1
-                    elif (is_operator(query[i])):
-                        queryList.append(query[i])
-                        i = i+1
-                return queryList
-
-            if contains_operators:
-                str_query = convertToList(query)
-
-                stack = []
-                result = []
-
-                i = 0
-                while i < len(str_query):
-                    if str_query[i].isalpha():
-                        result.append(''.join(str_query[i]))
-                    elif str_query[i] == '(':
-                        stack.append(str_query[i])
-                    elif str_query[i] == ')':
-                        while stack and stack[-1] != '(':
-                            result.append(stack.pop())
-                        stack.pop()
-                    else:
-                        while stack and is_operator(stack[-1]) and get_precedence(str_query[i]) <= get_precedence(stack[-1]):
-                            result.append(stack.pop())
-                        stack.append(str_query[i])
-                    i += 1
-
-                while stack:
-                    result.append(stack.pop())
-                return result  # Returning as list to simulate a stack
-            elif contains_spaces:
-                query_terms = query.split()
-                return query_terms
-            else:
-                return [query]
-
-        def match(document_representation, query) -> list:
-            if contains_operators:
-                universal_list = list(range(82))
-                query_representation = query[:]
-                if len(query_representation) > 1:
-                    stack = []
-                    while query_representation:
-                        query_element = query_representation.pop(0)
-                        if not any(op in query_element for op in ["&", "|", "-"]):
-                            if query_element in document_representation:
-                                stack.append(
-                                    document_representation[query_element])
-                            else:
-                                return []
-                        elif query_element == "&":
-                            query_element1 = stack.pop() if stack else []
-                            query_element2 = stack.pop() if stack else []
-                            intersection_set = set(
-                                query_element1) & set(query_element2)
-                            and_result = list(intersection_set)
-                            stack.append(and_result)
-                        elif query_element == "|":
-                            query_element1 = stack.pop() if stack else []
-                            query_element2 = stack.pop() if stack else []
-                            union_set = set(query_element1) | set(
-                                query_element2)
-                            or_result = list(union_set)
-                            stack.append(or_result)
-                        elif query_element == "-":
-                            query_element1 = stack.pop() if stack else []
-                            negation_set = set(universal_list) - \
-                                set(query_element1)
-                            not_result = list(negation_set)
-                            stack.append(not_result)
-                        else:
-                            "in disasters"
-                    return stack[0] if stack[0] else []
-                elif (len(query_representation) == 1):
-                    if query_representation[0] in document_representation:
-                        return document_representation[query_representation[0]]
-                return []
-            elif contains_spaces:
-                results = []
-                for term in query:
-                    if term in document_representation:
-                        if results:
-                            union_set = set(results).union(
-                                set(document_representation[term]))
-                            results = list(union_set)
-                        else:
-                            results = document_representation[term][:]
-                    else:
-                        return []
-                return results
-            elif len(query) == 1:
-                if query[0] in document_representation:
-                    return document_representation[query[0]]
-                else:
-                    return []
-            else:
-                return []
-        lowercase_query = query.lower()
-        query_representation = query_to_representation(lowercase_query)
-        ground_truth = load_ground_truth_inline()
-        truth_result = match(ground_truth, query_representation)
-        if not truth_result:
+        relevant_docs = self.relevant_documents(query)
+        if not relevant_docs:
             return -1
 
-        truth_result_int = [int(x) for x in truth_result]
-        # retrieved_docs = set()
-        truth_result_int.sort()
-        retrieved_docs = {document.document_id for score,
-                          document in result_list if score > 0}
+        retrieved_docs = {document_id for score, document_id in result_list if score > 0}
         if not retrieved_docs:
             return -1.0
 
-        ground_truth_set = set(truth_result_int)
-        relevant_docs = ground_truth_set.intersection(retrieved_docs)
-        precision = len(relevant_docs) / len(retrieved_docs)
+        precision = len(relevant_docs.intersection(retrieved_docs)) / len(retrieved_docs)
         return precision
-        # raise NotImplementedError('To be implemented in PR03')
 
     def calculate_recall(self, query: str, result_list: list[tuple]) -> float:
-        # TODO: Implement this function (PR03)
-        operator_chars = ['&', '|', '-']
-        contains_operators = any(char in query for char in operator_chars)
-        contains_spaces = ' ' in query
-
-        def query_to_representation(query: str):
-            def get_precedence(op):
-                if op == '-':
-                    return 3
-                if op == '&':
-                    return 2
-                if op == '|':
-                    return 1
-                return 0
-
-            def is_operator(c):
-                return c in ['&', '|', '-']
-
-            def convertToList(query):
-                queryList = []
-                i = 0
-                while i < len(query):
-                    if query[i].isalnum():
-                        word = []
-                        while i < len(query) and query[i].isalnum():
-                            word.append(query[i])
-                            i += 1
-                        queryList.append(''.join(word))
-                    elif query[i] == '(':
-                        queryList.append(query[i])
-                        i = i+1
-                    elif query[i] == ')':
-                        queryList.append(query[i])
-                        i = i+1
-                    elif (is_operator(query[i])):
-                        queryList.append(query[i])
-                        i = i+1
-                return queryList
-
-            if contains_operators:
-                str_query = convertToList(query)
-
-                stack = []
-                result = []
-
-                i = 0
-                while i < len(str_query):
-                    if str_query[i].isalpha():
-                        result.append(''.join(str_query[i]))
-                    elif str_query[i] == '(':
-                        stack.append(str_query[i])
-                    elif str_query[i] == ')':
-                        while stack and stack[-1] != '(':
-                            result.append(stack.pop())
-                        stack.pop()
-                    else:
-                        while stack and is_operator(stack[-1]) and get_precedence(str_query[i]) <= get_precedence(stack[-1]):
-                            result.append(stack.pop())
-                        stack.append(str_query[i])
-                    i += 1
-
-                while stack:
-                    result.append(stack.pop())
-                return result  # Returning as list to simulate a stack
-            elif contains_spaces:
-                query_terms = query.split()
-                return query_terms
-            else:
-                return [query]
-
-        def match(document_representation, query) -> list:
-            if contains_operators:
-                universal_list = list(range(82))
-                query_representation = query[:]
-                if len(query_representation) > 1:
-                    stack = []
-                    while query_representation:
-                        query_element = query_representation.pop(0)
-                        if not any(op in query_element for op in ["&", "|", "-"]):
-                            if query_element in document_representation:
-                                stack.append(
-                                    document_representation[query_element])
-                            else:
-                                return []
-                        elif query_element == "&":
-                            query_element1 = stack.pop() if stack else []
-                            query_element2 = stack.pop() if stack else []
-                            intersection_set = set(
-                                query_element1) & set(query_element2)
-                            and_result = list(intersection_set)
-                            stack.append(and_result)
-                        elif query_element == "|":
-                            query_element1 = stack.pop() if stack else []
-                            query_element2 = stack.pop() if stack else []
-                            union_set = set(query_element1) | set(
-                                query_element2)
-                            or_result = list(union_set)
-                            stack.append(or_result)
-                        elif query_element == "-":
-                            query_element1 = stack.pop() if stack else []
-                            negation_set = set(universal_list) - \
-                                set(query_element1)
-                            not_result = list(negation_set)
-                            stack.append(not_result)
-                        else:
-                            "in disasters"
-                    return stack[0] if stack[0] else []
-                elif (len(query_representation) == 1):
-                    if query_representation[0] in document_representation:
-                        return document_representation[query_representation[0]]
-                return []
-            elif contains_spaces:
-                results = []
-                for term in query:
-                    if term in document_representation:
-                        if results:
-                            union_set = set(results).union(
-                                set(document_representation[term]))
-                            results = list(union_set)
-                        else:
-                            results = document_representation[term][:]
-                    else:
-                        return []
-                return results
-            elif len(query) == 1:
-                if query[0] in document_representation:
-                    return document_representation[query[0]]
-                else:
-                    return []
-            else:
-                return []
-        lowercase_query = query.lower()
-        query_representation = query_to_representation(lowercase_query)
-        ground_truth = load_ground_truth_inline()
-        truth_result = match(ground_truth, query_representation)
-
-        if not truth_result:
+        relevant_docs = self.relevant_documents(query)
+        if not relevant_docs:
             return -1
 
-        truth_result_int = [int(x) for x in truth_result]
-        truth_result_int.sort()
-        retrieved_docs = {document.document_id for score,
-                          document in result_list if score > 0}
-
+        retrieved_docs = {document_id for score, document_id in result_list if score > 0}
         if not retrieved_docs:
             return -1.0
 
-        ground_truth_set = set(truth_result_int)
-        relevant_docs = ground_truth_set.intersection(retrieved_docs)
-        recall = len(relevant_docs) / len(ground_truth_set)
+        recall = len(relevant_docs.intersection(retrieved_docs)) / len(relevant_docs)
         return recall
-        # raise NotImplementedError('To be implemented in PR03')
 
 
 if __name__ == '__main__':
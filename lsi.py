@@ -0,0 +1,191 @@
+# Contains the latent semantic index that the LSI model scores queries on.
+import os
+
+import numpy as np
+
+from catalog import StatisticsCatalog, term_frequencies
+
+# Default rank of the truncated SVD.
+RANK = 100
+# Randomized SVD: extra dimensions of the sampled range beyond the rank, and power iterations that sharpen it.
+OVERSAMPLING = 20
+POWER_ITERATIONS = 4
+# Arrays of a stored index, each in its own .npy file.
+ARRAYS = ('term_vectors', 'document_vectors', 'document_ids')
+
+
+def array_path(directory: str, view: str, array: str) -> str:
+    return os.path.join(directory, f'lsi_{view}_{array}.npy')
+
+
+class LatentSemanticIndex(object):
+    """
+    Latent semantic index (Deerwester et al.) of a term view: the rank-k truncated SVD A ~ U_k S_k V_k^T of the
+    term-document matrix A of normalized TF-IDF weights, computed once at index time with a randomized SVD on the
+    sparse entries of A (see truncated_svd()). Documents are stored as the rows of V_k S_k, normalized to unit length,
+    in a dense float32 matrix; queries are projected into the latent space with U_k. Scoring a query is one dense
+    matrix-vector product whose cost only depends on the number of documents and the rank. Documents added later are
+    folded in with the same projection.
+    """
+
+    def __init__(self, statistics: StatisticsCatalog, term_vectors: np.ndarray, document_vectors: np.ndarray,
+                 document_ids: np.ndarray):
+        """
+        :param statistics: Catalog of the term view
+        :param term_vectors: U_k, array of shape (terms, rank)
+        :param document_vectors: Unit-length latent document vectors, array of shape (documents, rank)
+        :param document_ids: IDs of the documents, in the order of the document vectors
+        """
+        self.statistics = statistics
+        self.term_vectors = term_vectors
+        self.document_vectors = document_vectors
+        self.document_ids = document_ids
+        self.live = np.ones(len(document_ids), dtype=bool)
+        self._rows = {document_id: row for row, document_id in enumerate(document_ids.tolist())}
+
+    @classmethod
+    def build(cls, statistics: StatisticsCatalog, rank: int = RANK, seed: int = 0):
+        """
+        Computes the truncated SVD of the term-document matrix of a term view. Only the terms of the live documents
+        are rows of the matrix.
+        :param statistics: Catalog of the term view
+        :param rank: Rank k of the SVD
+        :param seed: Seed of the random projection of the randomized SVD
+        :return: The index
+        """
+        terms, rows, tfs = statistics.entries()
+        live_rows = np.flatnonzero(statistics.live)
+        columns = np.full(statistics.row_count, -1, dtype=np.int64)
+        columns[live_rows] = np.arange(len(live_rows))
+        live_terms, term_rows = np.unique(terms, return_inverse=True)
+        norms = statistics.norms(rows)
+        weights = np.divide(tfs * statistics.idf(terms), norms, out=np.zeros(len(tfs)), where=norms > 0)
+        u, s, vt = truncated_svd(term_rows, columns[rows], weights, (len(live_terms), len(live_rows)), rank, seed)
+        term_vectors = np.zeros((len(statistics.document_frequencies), len(s)), dtype=np.float32)
+        term_vectors[live_terms] = u
+        return cls(statistics, term_vectors, normalize(vt.T * s).astype(np.float32), statistics.document_ids[live_rows])
+
+    def save(self, directory: str, view: str):
+        """
+        Stores the index in .npy files.
+        :param directory: Directory of the files
+        :param view: Term view of the index, part of the file names
+        """
+        live = self.live
+        arrays = {'term_vectors': self.term_vectors, 'document_vectors': self.document_vectors[live],
+                  'document_ids': self.document_ids[live]}
+        for array in ARRAYS:
+            temporary_path = array_path(directory, view, array) + '.tmp'
+            with open(temporary_path, 'wb') as array_file:
+                np.save(array_file, arrays[array])
+            os.replace(temporary_path, array_path(directory, view, array))
+
+    @classmethod
+    def load(cls, directory: str, view: str, statistics: StatisticsCatalog):
+        """
+        Opens an index that was stored with save(). The factors are memory-mapped, not read.
+        :param directory: Directory of the files
+        :param view: Term view of the index
+        :param statistics: Catalog of the term view
+        :return: The index, or None if it was not stored
+        """
+        if not all(os.path.exists(array_path(directory, view, array)) for array in ARRAYS):
+            return None
+        arrays = {array: np.load(array_path(directory, view, array), mmap_mode='r') for array in ARRAYS}
+        return cls(statistics, arrays['term_vectors'], arrays['document_vectors'], np.array(arrays['document_ids']))
+
+    def is_index_of_catalog(self) -> bool:
+        """
+        Checks whether the index holds exactly the live documents of the catalog.
+        """
+        return (set(self.document_ids[self.live].tolist()) ==
+                set(self.statistics.document_ids[self.statistics.live].tolist()))
+
+    def project(self, terms, weights) -> np.ndarray:
+        """
+        Projects a sparse term vector into the latent space (U_k^T x).
+        :return: Unit-length latent vector
+        """
+        terms, weights = np.asarray(terms, dtype=np.int64), np.asarray(weights, dtype=np.float32)
+        known = (terms >= 0) & (terms < len(self.term_vectors))
+        return normalize(weights[known] @ self.term_vectors[terms[known]])
+
+    def add_document(self, document_id: int, term_ids):
+        """
+        Folds a document that was added to the catalog into the latent space. The factors stay unchanged until the
+        next index build.
+        :param document_id: ID of the document
+        :param term_ids: Term ID array of the document
+        """
+        # The document norm is left out: projected vectors are normalized anyway.
+        terms, _, tfs = term_frequencies([term_ids])
+        self._rows[document_id] = len(self.document_ids)
+        self.document_vectors = np.vstack([self.document_vectors,
+                                           self.project(terms, tfs * self.statistics.idf(terms))])
+        self.document_ids = np.append(self.document_ids, document_id)
+        self.live = np.append(self.live, True)
+
+    def delete_document(self, document_id: int):
+        row = self._rows.pop(document_id, None)
+        if row is not None:
+            self.live[row] = False
+
+    def score(self, query_weights: dict[int, float]) -> np.ndarray:
+        """
+        Scores all documents for a query by the cosine similarity of their latent vectors with the projected query.
+        :param query_weights: Dictionary that maps query term IDs to their full weights (query term weight * IDF)
+        :return: Score of every document, in the order of document_ids (0 for deleted documents)
+        """
+        query_vector = self.project(list(query_weights), list(query_weights.values()))
+        return (self.document_vectors @ query_vector) * self.live
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scales vectors (the last axis) to unit length; zero vectors stay zero.
+    """
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def sparse_product(rows: np.ndarray, columns: np.ndarray, values: np.ndarray, row_count: int,
+                   matrix: np.ndarray) -> np.ndarray:
+    """
+    Multiplies a sparse matrix, given by its non-zero entries, with a dense matrix.
+    :return: Dense array of shape (row_count, matrix columns)
+    """
+    return np.stack([np.bincount(rows, weights=values * matrix[columns, column], minlength=row_count)
+                     for column in range(matrix.shape[1])], axis=1).reshape(row_count, matrix.shape[1])
+
+
+def truncated_svd(rows: np.ndarray, columns: np.ndarray, values: np.ndarray, shape: tuple, rank: int,
+                  seed: int = 0) -> tuple:
+    """
+    Computes the rank-k truncated SVD of a sparse matrix with the randomized range finder of Halko, Martinsson & Tropp:
+    the range of the matrix is sampled with k + OVERSAMPLING random vectors and refined with POWER_ITERATIONS, and
+    only the projection onto that small range is decomposed exactly. The matrix is only multiplied with dense blocks of
+    k + OVERSAMPLING columns, so memory is linear in its size and number of non-zero entries. If the sampled range has
+    the full dimension of the matrix, the result is exact.
+    :param rows: Row indexes of the non-zero entries
+    :param columns: Column indexes of the non-zero entries
+    :param values: Values of the non-zero entries
+    :param shape: Shape (rows, columns) of the matrix
+    :param rank: Rank k
+    :param seed: Seed of the random vectors
+    :return: U_k (shape (rows, k')), singular values (k') and V_k^T (shape (k', columns)), where k' = min(k, rows,
+    columns)
+    """
+    row_count, column_count = shape
+    sample_size = min(rank + OVERSAMPLING, row_count, column_count)
+    if not sample_size:
+        return np.zeros((row_count, 0)), np.zeros(0), np.zeros((0, column_count))
+    random_vectors = np.random.RandomState(seed).standard_normal((column_count, sample_size))
+    basis = np.linalg.qr(sparse_product(rows, columns, values, row_count, random_vectors))[0]
+    for _ in range(POWER_ITERATIONS):
+        # Re-orthonormalized after every product, so that small singular values are not lost to rounding.
+        column_basis = np.linalg.qr(sparse_product(columns, rows, values, column_count, basis))[0]
+        basis = np.linalg.qr(sparse_product(rows, columns, values, row_count, column_basis))[0]
+    projection = sparse_product(columns, rows, values, column_count, basis).T  # basis^T A
+    u, s, vt = np.linalg.svd(projection, full_matrices=False)
+    rank = min(rank, len(s))
+    return (basis @ u)[:, :rank], s[:rank], vt[:rank]
@@ -0,0 +1,199 @@
+# Contains the MinHash LSH index that finds documents similar to a given document.
+import numpy as np
+
+# Number of MinHash functions, i.e. length of a sketch.
+PERMUTATION_COUNT = 128
+# Sketch values per LSH band. With 64 bands of 2 rows, documents with a Jaccard similarity of about (1/64)^(1/2) =
+# 0.125 become candidates with probability 1/2; fables rarely share more than a few of their terms.
+BAND_ROWS = 2
+# Length of the shingles (term n-grams). Single terms, since fables hardly share any pair of consecutive terms.
+SHINGLE_SIZE = 1
+# Exact Jaccard similarity from which two documents are flagged as near-duplicates.
+NEAR_DUPLICATE_THRESHOLD = 0.8
+# The MinHash functions are h(x) = (a * x + b) mod PRIME, with random a and b.
+PRIME = (1 << 31) - 1
+EMPTY_SKETCH_VALUE = PRIME  # Value of all entries of the sketch of a document without shingles.
+
+
+def shingles(term_ids, shingle_size: int = SHINGLE_SIZE) -> np.ndarray:
+    """
+    Computes the distinct shingles of a document, each hashed to one 64-bit key.
+    :param term_ids: Term ID array of the document
+    :param shingle_size: Number of consecutive terms per shingle
+    :return: Sorted array of shingle keys
+    """
+    term_ids = np.asarray(term_ids, dtype=np.uint64)
+    count = len(term_ids) - shingle_size + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    keys = term_ids[:count].copy()
+    for offset in range(1, shingle_size):
+        keys = keys * np.uint64(1000003) + term_ids[offset:offset + count]  # Wraps around at 2^64.
+    return np.unique(keys)
+
+
+def jaccard(first: np.ndarray, second: np.ndarray) -> float:
+    """
+    Computes the exact Jaccard similarity of two sorted shingle arrays.
+    """
+    intersection = len(np.intersect1d(first, second, assume_unique=True))
+    union = len(first) + len(second) - intersection
+    return intersection / union if union else 0.0
+
+
+class MinHashIndex(object):
+    """
+    Locality-sensitive hashing index of MinHash sketches (Broder; Indyk & Motwani) for "more like this" search. The
+    sketch of a document holds the minima of PERMUTATION_COUNT hash functions over its shingles; two sketches agree in
+    one position with a probability equal to the Jaccard similarity of the shingle sets. Sketches are cut into bands of
+    BAND_ROWS values, and each band is hashed into its own table, so that documents that agree in a whole band become
+    candidates without comparing against the whole collection. Only the candidates are re-ranked by exact Jaccard
+    similarity.
+    """
+
+    def __init__(self, permutation_count: int = PERMUTATION_COUNT, band_rows: int = BAND_ROWS,
+                 shingle_size: int = SHINGLE_SIZE, seed: int = 0):
+        """
+        :param permutation_count: Number of MinHash functions, a multiple of band_rows
+        :param band_rows: Sketch values per band
+        :param shingle_size: Number of consecutive terms per shingle
+        :param seed: Seed of the hash functions
+        """
+        self.band_rows = band_rows
+        self.shingle_size = shingle_size
+        self.seed = seed
+        random_state = np.random.RandomState(seed)  # Own generator, the global random state stays untouched.
+        self.a = random_state.randint(1, PRIME, permutation_count).astype(np.uint64)
+        self.b = random_state.randint(0, PRIME, permutation_count).astype(np.uint64)
+        self.sketches = {}  # Maps document IDs to their sketches.
+        self.bands = [{} for _ in range(permutation_count // band_rows)]  # Per band: band key -> set of document IDs.
+        self.shingle_cache = {}  # Maps document IDs to their shingles, filled by similar().
+
+    @classmethod
+    def build(cls, document_ids, term_lists, **parameters):
+        """
+        Sketches all documents of a collection.
+        :param document_ids: IDs of the documents
+        :param term_lists: Term ID arrays of the documents
+        :return: The index
+        """
+        minhash_index = cls(**parameters)
+        for document_id, term_ids in zip(document_ids, term_lists):
+            minhash_index.insert(int(document_id), minhash_index.sketch(term_ids))
+        return minhash_index
+
+    def save(self, file_path: str):
+        """
+        Stores the sketches and the parameters in a NumPy .npz file. The LSH tables are rebuilt when loading.
+        :param file_path: Path of the file
+        """
+        with open(file_path, 'wb') as minhash_file:
+            np.savez(minhash_file, document_ids=np.array(list(self.sketches), dtype=np.int64),
+                     sketches=np.array(list(self.sketches.values()), dtype=np.uint32).reshape(-1, len(self.a)),
+                     parameters=np.array([len(self.a), self.band_rows, self.shingle_size, self.seed]))
+
+    @classmethod
+    def load(cls, file_path: str):
+        """
+        Loads an index that was stored with save().
+        :param file_path: Path of the file
+        :return: The index
+        """
+        with np.load(file_path) as stored:
+            permutation_count, band_rows, shingle_size, seed = stored['parameters'].tolist()
+            minhash_index = cls(permutation_count, band_rows, shingle_size, seed)
+            for document_id, sketch in zip(stored['document_ids'].tolist(), stored['sketches'].astype(np.uint64)):
+                minhash_index.insert(document_id, sketch)
+        return minhash_index
+
+    def is_index_of(self, document_ids) -> bool:
+        """
+        Checks whether the index holds exactly the given documents.
+        """
+        return set(self.sketches) == set(int(document_id) for document_id in document_ids)
+
+    def sketch(self, term_ids) -> np.ndarray:
+        """
+        Computes the MinHash sketch of a document.
+        :param term_ids: Term ID array of the document
+        :return: Array of PERMUTATION_COUNT minima
+        """
+        keys = shingles(term_ids, self.shingle_size) % np.uint64(PRIME)
+        if not len(keys):
+            return np.full(len(self.a), EMPTY_SKETCH_VALUE, dtype=np.uint64)
+        # a, b and the keys are below 2^31, so a * key + b does not overflow.
+        return ((keys[:, None] * self.a + self.b) % np.uint64(PRIME)).min(axis=0)
+
+    def band_keys(self, sketch: np.ndarray) -> list[bytes]:
+        return [sketch[band * self.band_rows:(band + 1) * self.band_rows].tobytes() for band in range(len(self.bands))]
+
+    def insert(self, document_id: int, sketch: np.ndarray):
+        self.sketches[document_id] = sketch
+        if sketch[0] == EMPTY_SKETCH_VALUE:
+            return  # Documents without shingles are similar to none.
+        for band, band_key in zip(self.bands, self.band_keys(sketch)):
+            band.setdefault(band_key, set()).add(document_id)
+
+    def candidates(self, document_id: int) -> set:
+        """
+        Collects the documents that share at least one band with a document.
+        """
+        sketch = self.sketches.get(document_id)
+        if sketch is None or sketch[0] == EMPTY_SKETCH_VALUE:
+            return set()
+        candidates = set()
+        for band, band_key in zip(self.bands, self.band_keys(sketch)):
+            candidates |= band.get(band_key, set())
+        candidates.discard(document_id)
+        return candidates
+
+    def similar(self, document_id: int, term_ids_of, k: int = None, threshold: float = 0.0) -> tuple:
+        """
+        Finds the documents most similar to a document: the LSH candidates ranked by exact Jaccard similarity.
+        :param document_id: ID of an indexed document
+        :param term_ids_of: Function that returns the term ID array of a document ID
+        :param k: Number of results, all candidates by default
+        :param threshold: Minimum Jaccard similarity of the results
+        :return: List of (Jaccard similarity, document ID) tuples, sorted by descending similarity, and the number of
+        candidates
+        """
+        candidates = self.candidates(document_id)
+        document_shingles = self.document_shingles(document_id, term_ids_of)
+        results = [(jaccard(document_shingles, self.document_shingles(candidate, term_ids_of)), candidate)
+                   for candidate in candidates]
+        results = sorted((result for result in results if result[0] >= threshold and result[0] > 0),
+                         key=lambda x: (-x[0], x[1]))
+        return results[:k], len(candidates)
+
+    def document_shingles(self, document_id: int, term_ids_of) -> np.ndarray:
+        """
+        Returns the shingles of an indexed document, computed once from its terms.
+        :param document_id: ID of the document
+        :param term_ids_of: Function that returns the term ID array of a document ID
+        """
+        if document_id not in self.shingle_cache:
+            self.shingle_cache[document_id] = shingles(term_ids_of(document_id), self.shingle_size)
+        return self.shingle_cache[document_id]
+
+    def add_document(self, document_id: int, term_ids, term_ids_of) -> list[tuple]:
+        """
+        Sketches a new document and inserts it into the LSH tables.
+        :param document_id: ID of the document
+        :param term_ids: Term ID array of the document
+        :param term_ids_of: Function that returns the term ID array of an indexed document ID
+        :return: Near-duplicates of the document among the indexed documents, as (Jaccard similarity, document ID)
+        tuples
+        """
+        self.insert(document_id, self.sketch(term_ids))
+        return self.similar(document_id, lambda other: term_ids if other == document_id else term_ids_of(other),
+                            threshold=NEAR_DUPLICATE_THRESHOLD)[0]
+
+    def delete_document(self, document_id: int):
+        self.shingle_cache.pop(document_id, None)
+        sketch = self.sketches.pop(document_id, None)
+        if sketch is None or sketch[0] == EMPTY_SKETCH_VALUE:
+            return
+        for band, band_key in zip(self.bands, self.band_keys(sketch)):
+            band[band_key].discard(document_id)
+            if not band[band_key]:
+                del band[band_key]
@@ -1,14 +1,13 @@
 # Contains all retrieval models.
-from pyparsing import Word, alphas, alphanums, oneOf, infixNotation, opAssoc, Group, ParseException
-from pyparsing import ParseResults
+import numpy as np
 
 from abc import ABC, abstractmethod
-import random
+from array import array
+import indexing
+import planner
+import query_compiler
+import signatures
 from document import Document
-from extraction import extract_collection
-from cleanup import filter_collection
-from cleanup import remove_symbols
-import math
 
 
 class RetrievalModel(ABC):
@@ -45,114 +44,51 @@ class RetrievalModel(ABC):
         pass
 
 
+def evaluate_boolean(terms: array, tree: tuple) -> bool:
+    """
+    Evaluates a query tree in term ID space on the term IDs of a single document.
+    """
+    kind = tree[0]
+    if kind == 'term':
+        return contains_operand(terms, tree[1])
+    if kind == 'not':
+        return not evaluate_boolean(terms, tree[1])
+    if kind == 'and':
+        return all(evaluate_boolean(terms, child) for child in tree[1])
+    return any(evaluate_boolean(terms, child) for child in tree[1])
+
+
+def contains_operand(terms: array, operand) -> bool:
+    """
+    Checks whether a term, a phrase or a proximity expression occurs in a term ID list.
+    """
+    if query_compiler.is_term(operand):
+        return operand in terms
+    positions = indexing.term_positions(terms)
+    return bool(indexing.operand_spans(operand, lambda term: {0: positions[term]} if term in positions else {}))
+
+
 class LinearBooleanModel(RetrievalModel):
-    # TODO: Implement all abstract methods and __init__() in this class. (PR02)
     def document_to_representation(self, document: Document, stopword_filtering=False, stemming=False):
         if stemming:
-            return document.stemmed_terms
+            return document.stemmed_term_ids
         elif stopword_filtering:
-            return document.filtered_terms
+            return document.filtered_term_ids
         else:
-            return document.terms
+            return document.term_ids
         # raise ValueError("The stopword list is empty. Cannot process an empty list.")
 
     def query_to_representation(self, query: str):
-        # print("query")
-        # print(query)
-
-        def get_precedence(op):
-            if op == '-':
-                return 3
-            if op == '&':
-                return 2
-            if op == '|':
-                return 1
-            return 0
-
-        def is_operator(c):
-            return c in ['&', '|', '-']
-
-        def convertToList(query):
-            queryList = []
-            i = 0
-            while i < len(query):
-                if query[i].isalnum():
-                    word = []
-                    while i < len(query) and query[i].isalnum():
-                        word.append(query[i])
-                        i += 1
-                    queryList.append(''.join(word))
-                elif query[i] == '(':
-                    queryList.append(query[i])
-                    i = i+1
-                elif query[i] == ')':
-                    queryList.append(query[i])
-                    i = i+1
-                elif (is_operator(query[i])):
-                    queryList.append(query[i])
-                    i = i+1
-            return queryList
-
-        lowercase_query = query.lower()
-        str_query = convertToList(lowercase_query)
-        stack = []
-        result = []
-
-        i = 0
-        while i < len(str_query):
-            if str_query[i].isalpha():
-                result.append(''.join(str_query[i]))
-            elif str_query[i] == '(':
-                stack.append(str_query[i])
-            elif str_query[i] == ')':
-                while stack and stack[-1] != '(':
-                    result.append(stack.pop())
-                stack.pop()
-            else:
-                while stack and is_operator(stack[-1]) and get_precedence(str_query[i]) <= get_precedence(stack[-1]):
-                    result.append(stack.pop())
-                stack.append(str_query[i])
-            i += 1
-
-        while stack:
-            result.append(stack.pop())
-        return result  # Returning as list to simulate a stack
+        return query_compiler.compile_and_bind(query)
 
     def match(self, document_representation, query) -> float:
-        # print(query)
-        # print(document_representation)
-        query_representation = query[:]
-        if len(query_representation) > 1:
-            stack = []
-            while query_representation:
-                query_element = query_representation.pop(0)
-                if not any(op in query_element for op in ["&", "|", "-"]):
-                    if query_element in document_representation:
-                        stack.append(True)
-                    else:
-                        stack.append(False)
-                elif query_element == "&":
-                    query_element1 = stack.pop() if stack else []
-                    query_element2 = stack.pop() if stack else []
-                    and_result = (query_element1 and query_element2)
-                    stack.append(and_result)
-                elif query_element == "|":
-                    query_element1 = stack.pop() if stack else []
-                    query_element2 = stack.pop() if stack else []
-                    or_result = (query_element1 or query_element2)
-                    stack.append(or_result)
-                elif query_element == "-":
-                    query_element1 = stack.pop() if stack else []
-                    not_result = (not query_element1)
-                    stack.append(not_result)
-                else:
-                    "in disasters"
-            return 1.0 if stack[0] else 0.0
-        elif (len(query_representation) == 1):
-            if query_representation[0] in document_representation:
-                return 1.0
-        return 0.0
-        # return 1.0 if query_representation in document_representation else 0.0
+        return 1.0 if self.evaluate(document_representation, self.query_to_representation(query).tree) else 0.0
+
+    def evaluate(self, terms: array, tree: tuple) -> bool:
+        """
+        Evaluates a query tree in term ID space on the term IDs of a single document (see evaluate_boolean()).
+        """
+        return evaluate_boolean(terms, tree)
 
     def __init__(self):
         pass
@@ -162,145 +98,28 @@ class LinearBooleanModel(RetrievalModel):
 
 
 class InvertedListBooleanModel(RetrievalModel):
-    # TODO: Implement all abstract methods and __init__() in this class. (PR03)
     def document_to_representation(self, document: Document, stopword_filtering=True, stemming=False):
         if stemming:
-            # print("ASKING FOR STEMMING")
-            # print(document.stemmed_terms)
-            return document.stemmed_terms
+            return document.stemmed_term_ids
         elif stopword_filtering:
-            return document.filtered_terms
+            return document.filtered_term_ids
         else:
-            return document.terms
+            return document.term_ids
 
     def query_to_representation(self, query: str):
-
-        def get_precedence(op):
-            if op == '-':
-                return 3
-            if op == '&':
-                return 2
-            if op == '|':
-                return 1
-            return 0
-
-        def is_operator(c):
-            return c in ['&', '|', '-']
-
-        def convertToList(query):
-            queryList = []
-            i = 0
-            while i < len(query):
-                if query[i].isalnum():
-                    word = []
-                    while i < len(query) and query[i].isalnum():
-                        word.append(query[i])
-                        i += 1
-                    queryList.append(''.join(word))
-                elif query[i] == '(':
-                    queryList.append(query[i])
-                    i = i+1
-                elif query[i] == ')':
-                    queryList.append(query[i])
-                    i = i+1
-                elif (is_operator(query[i])):
-                    queryList.append(query[i])
-                    i = i+1
-            return queryList
-
-        lowercase_query = query.lower()
-        str_query = convertToList(lowercase_query)
-
-        stack = []
-        result = []
-
-        i = 0
-        while i < len(str_query):
-            if str_query[i].isalpha():
-                result.append(''.join(str_query[i]))
-            elif str_query[i] == '(':
-                stack.append(str_query[i])
-            elif str_query[i] == ')':
-                while stack and stack[-1] != '(':
-                    result.append(stack.pop())
-                stack.pop()
-            else:
-                while stack and is_operator(stack[-1]) and get_precedence(str_query[i]) <= get_precedence(stack[-1]):
-                    result.append(stack.pop())
-                stack.append(str_query[i])
-            i += 1
-
-        while stack:
-            result.append(stack.pop())
-        return result  # Returning as list to simulate a stack
+        return query_compiler.compile_and_bind(query)
 
     def match(self, document_representation, query_representation) -> list:
-        if len(query_representation) > 1:
-            stack = []
-            total_documents = 82
-            while query_representation:
-                query_element = query_representation.pop(0)
-                if not any(op in query_element for op in ["&", "|", "-"]):
-                    for key, value in document_representation.items():
-                        if key == query_element:
-                            stack.append(value)
-                            break
-                elif query_element == "&":
-                    query_element1 = stack.pop() if stack else []
-                    query_element2 = stack.pop() if stack else []
-                    query_element1.sort()
-                    query_element2.sort()
-                    and_result = []
-                    i, j = 0, 0
-                    while i < len(query_element1) and j < len(query_element2):
-                        if query_element1[i] == query_element2[j]:
-                            and_result.append(query_element1[i])
-                            i += 1
-                            j += 1
-                        elif query_element1[i] < query_element2[j]:
-                            i += 1
-                        else:
-                            j += 1
-                    stack.append(and_result)
-                elif query_element == "|":
-                    query_element1 = stack.pop() if stack else []
-                    query_element2 = stack.pop() if stack else []
-                    query_element1.sort()
-                    query_element2.sort()
-                    or_result = []
-                    i, j = 0, 0
-                    added_elements = set()  # Set to store elements that have already been added
-                    while i < len(query_element1) or j < len(query_element2):
-                        if i < len(query_element1) and (j >= len(query_element2) or query_element1[i] < query_element2[j]):
-                            # Check if element has already been added
-                            if query_element1[i] not in added_elements:
-                                or_result.append(query_element1[i])
-                                # Add element to set
-                                added_elements.add(query_element1[i])
-                            i += 1
-                        elif j < len(query_element2):
-                            # Check if element has already been added
-                            if query_element2[j] not in added_elements:
-                                or_result.append(query_element2[j])
-                                # Add element to set
-                                added_elements.add(query_element2[j])
-                            j += 1
-
-                    stack.append(or_result)
-                elif query_element == "-":
-                    query_element1 = stack.pop() if stack else []
-                    query_element1.sort()
-                    all_documents = set(range(total_documents))
-                    stack.append(list(all_documents - set(query_element1)))
-                else:
-                    "in disasters"
-            return stack[0]
-        else:
-            query_element = query_representation.pop()
-            for key, value in document_representation.items():
-                if key == query_element:
-                    return value
-        return []
+        """
+        Evaluates a Boolean query on the inverted index with the cost-based planner (see planner.py): AND operands run
+        from the shortest posting list on, stop on an empty intermediate result and probe long lists with skip
+        cursors; negated AND operands are subtracted. Other combinations are word-parallel bitmap operations, and NOT
+        is computed against the live documents of the index.
+        :param document_representation: The inverted index (see indexing.IndexView)
+        :param query_representation: The compiled query
+        :return: Sorted IDs of the matching documents
+        """
+        return planner.evaluate(self.query_to_representation(query_representation).tree, document_representation)
 
     def __init__(self):
         pass
@@ -310,10 +129,22 @@ class InvertedListBooleanModel(RetrievalModel):
 # models.py
 
 
+def augmented_query_weights(query) -> dict[int, float]:
+    """
+    Weights the terms of a query by their augmented term frequency, 0.5 + 0.5 * tf / max tf, as the ranked models
+    (Vector Space Model, LSI) do before the IDF is applied.
+    :param query: Search query of the user, or a compiled query
+    :return: Dictionary that maps query term IDs to their weights in the query
+    """
+    term_frequencies = {}
+    for term in query_compiler.compile_and_bind(query).terms:
+        term_frequencies[term] = term_frequencies.get(term, 0) + 1
+    max_term_frequency = max(term_frequencies.values(), default=1)
+    return {term: 0.5 + 0.5 * tf / max_term_frequency for term, tf in term_frequencies.items()}
+
+
 class VectorSpaceModel(RetrievalModel):
-    # TODO: Implement all abstract methods. (PR04)
     def __init__(self):
-        # TODO: Remove this line and implement the function.
         pass
 
     def __str__(self):
@@ -321,93 +152,140 @@ class VectorSpaceModel(RetrievalModel):
 
     def document_to_representation(self, document: Document, stopword_filtering=True, stemming=False):
         if stemming == True:
-            return document.stemmed_terms
+            return document.stemmed_term_ids
         elif stopword_filtering == True:
-            return document.filtered_terms
+            return document.filtered_term_ids
         else:
-            return document.terms
+            return document.term_ids
 
     def query_to_representation(self, query: str):
-        query_representation = query.split()
-        unique_query_terms = list(set(query_representation))
-        query_terms_initials = {}  # at [2]
-        query_weights_without_log = {}
-        for element in unique_query_terms:
-            query_terms_initials[element] = (
-                query_representation.count(element))
+        return augmented_query_weights(query)
 
-        frequency_list = []
+    def match(self, document_representation, query_representation) -> np.ndarray:
+        """
+        Scores all documents for a query on the precomputed TF-IDF matrix of the collection. The score of a document
+        is the dot product of its normalized TF-IDF vector and the query vector (query term weight * IDF); only the
+        matrix columns of the query terms are read.
+        :param document_representation: TF-IDF matrix of the collection (see tfidf.TfIdfMatrix)
+        :param query_representation: Query term weights (see query_to_representation())
+        :return: Score of every document, in the row order of the matrix
+        """
+        return document_representation.score(query_representation)
 
-        for value in query_terms_initials.values():
-            frequency_list.append(value)
+    def match_batch(self, document_representation, query_representations: list) -> np.ndarray:
+        """
+        Scores all documents for several queries at once, as one sparse matrix-matrix product.
+        :param document_representation: TF-IDF matrix of the collection (see tfidf.TfIdfMatrix)
+        :param query_representations: Query term weights of every query (see query_to_representation())
+        :return: Array of shape (documents, queries) with the score of every document for every query
+        """
+        return document_representation.score_batch(query_representations)
 
-        max_term_frequency = max(frequency_list) if frequency_list else 1
-        for key, value in query_terms_initials.items():
-            query_weights_without_log[key] = (
-                0.5+((0.5*value)/max_term_frequency))
-        return query_weights_without_log
+    def query_term_weights(self, document_representation, query_representation) -> list[tuple]:
+        """
+        Computes the full weight (query term weight * IDF) of every query term that occurs in the collection.
+        :param document_representation: TF-IDF matrix of the collection (see tfidf.TfIdfMatrix)
+        :param query_representation: Query term weights (see query_to_representation())
+        :return: List of (term ID, weight) tuples, sorted by descending weight
+        """
+        query_terms_weight = [(term, weight * document_representation.term_weight(term))
+                              for term, weight in query_representation.items()
+                              if document_representation.statistics.document_frequency(term)]
+        query_terms_weight.sort(key=lambda x: x[1], reverse=True)
+        return query_terms_weight
 
-    def match(self, document_representation, query_representation) -> list:
-        N = 82
-        stopped_terms = document_representation
+    def query_postings(self, document_representation, query_representation) -> list[tuple]:
+        """
+        Collects the postings of the query terms for document-at-a-time evaluation (see ranking.wand()).
+        :param document_representation: TF-IDF matrix of the collection (see tfidf.TfIdfMatrix)
+        :param query_representation: Query term weights (see query_to_representation())
+        :return: List of (postings, weight) tuples, where the weight is query term weight * IDF
+        """
+        return [(document_representation.postings(term), weight)
+                for term, weight in self.query_term_weights(document_representation, query_representation)]
 
-        unique_query_terms = query_representation.keys()
-        inverted_stop_word_list = {}
+    def query_tiers(self, document_representation, query_representation, champion_list_size: int) -> list[tuple]:
+        """
+        Collects the tiers of the query terms for evaluation on a tiered index (see ranking.tiered()).
+        :param document_representation: TF-IDF matrix of the collection (see tfidf.TfIdfMatrix)
+        :param query_representation: Query term weights (see query_to_representation())
+        :param champion_list_size: Number of postings in the champion list (tier 1) of each term
+        :return: List of (tiers, weight) tuples, where the weight is query term weight * IDF
+        """
+        return [(document_representation.tiers(term, champion_list_size), weight)
+                for term, weight in self.query_term_weights(document_representation, query_representation)]
 
-        for term in unique_query_terms:
-            for sublist in stopped_terms:
-                if term in sublist:
-                    if not term in inverted_stop_word_list:
-                        inverted_stop_word_list[term] = [
-                            stopped_terms.index(sublist)]
-                    else:
-                        if stopped_terms.index(sublist) not in inverted_stop_word_list[term]:
-                            inverted_stop_word_list[term].append(
-                                stopped_terms.index(sublist))
 
-        query_nks = {}
-        query_terms_weight = []
+class BM25Model(RetrievalModel):
+    def __init__(self):
+        pass
 
-        for key, value in inverted_stop_word_list.items():
-            query_nks[key] = len(value)
+    def __str__(self):
+        return 'BM25 Model'
 
-        for key, value in query_nks.items():
-            query_terms_weight.append(
-                (key, (query_representation[key] * math.log(N/value))))
+    def document_to_representation(self, document: Document, stopword_filtering=True, stemming=False):
+        if stemming:
+            return document.stemmed_term_ids
+        elif stopword_filtering:
+            return document.filtered_term_ids
+        else:
+            return document.term_ids
 
-        query_terms_weight.sort(key=lambda x: x[1], reverse=True)
+    def query_to_representation(self, query: str):
+        query_terms = query_compiler.compile_and_bind(query).terms
+        return {term: query_terms.count(term) for term in set(query_terms)}
 
-        document_tfs = [{} for _ in range(82)]
-        # We will store each document with the tfdk score of each query term
+    def match(self, document_representation, query_representation) -> np.ndarray:
+        """
+        Scores all documents for a query on the quantized BM25 impacts of the collection, reading all postings of the
+        query terms.
+        :param document_representation: Impact index of the collection (see bm25.ImpactIndex)
+        :param query_representation: Query term frequencies (see query_to_representation())
+        :return: Score of every document, in the row order of the index
+        """
+        return document_representation.score(query_representation)
 
-        for term in unique_query_terms:
-            for key, values in inverted_stop_word_list.items():
-                if term == key:
-                    for value in values:
-                        document_tfs[value][key] = stopped_terms[value].count(
-                            key)
+    def query_segments(self, document_representation, query_representation) -> list[tuple]:
+        """
+        Collects the impact segments of the query terms for score-at-a-time evaluation (see ranking.score_at_a_time()).
+        :param document_representation: Impact index of the collection (see bm25.ImpactIndex)
+        :param query_representation: Query term frequencies (see query_to_representation())
+        :return: List of (impact, rows) tuples
+        """
+        return document_representation.query_segments(query_representation)
 
-        document_idfs = {}
-        for key, value in query_nks.items():
-            document_idfs[key] = math.log(N/value)
 
-        document_normalizer = [0] * 82
+class LSIModel(RetrievalModel):
+    def __init__(self):
+        pass
 
-        for index, value in enumerate(stopped_terms):
-            summation_result = 0
-            for term in unique_query_terms:
-                if (term in inverted_stop_word_list):
-                    summation_result += ((value.count(
-                        term)*(math.log((N/(len(inverted_stop_word_list[term]))))))**2)
-            document_normalizer[index] = math.sqrt(summation_result)
+    def __str__(self):
+        return 'Latent Semantic Indexing Model'
+
+    def document_to_representation(self, document: Document, stopword_filtering=True, stemming=False):
+        if stemming:
+            return document.stemmed_term_ids
+        elif stopword_filtering:
+            return document.filtered_term_ids
+        else:
+            return document.term_ids
 
-        document_terms_weight = [{} for _ in range(82)]
-        for index, document in enumerate(document_tfs):
-            for tf_key, tf_value in document.items():
-                document_terms_weight[index][tf_key] = (
-                    document_idfs[tf_key]*tf_value)/document_normalizer[index]
+    def query_to_representation(self, query: str):
+        # Queries are weighted like in the Vector Space Model before they are projected into the latent space.
+        return augmented_query_weights(query)
 
-        return document_terms_weight, query_terms_weight
+    def match(self, document_representation, query_representation) -> np.ndarray:
+        """
+        Scores all documents for a query in the latent space of the collection: the query vector (query term weight *
+        IDF) is projected with the term factors of the SVD and compared with every latent document vector.
+        :param document_representation: Latent semantic index of the collection (see lsi.LatentSemanticIndex)
+        :param query_representation: Query term weights (see query_to_representation())
+        :return: Score of every document, in the order of the index's document_ids
+        """
+        terms = np.array(list(query_representation), dtype=np.int64)
+        idf = document_representation.statistics.idf(terms)
+        return document_representation.score(dict(zip(terms.tolist(),
+                                                       np.array(list(query_representation.values())) * idf)))
 
 
 class SignatureBasedBooleanModel(RetrievalModel):
@@ -419,177 +297,114 @@ class SignatureBasedBooleanModel(RetrievalModel):
         self.D = 4  # Number of hash functions (overlay factor)
         self.F = 64  # Size of the bit signature
         self.m = 12  # Signature weight
+        # Size and weight of the document-level signatures, which superimpose all terms of a document.
+        self.document_F = 512
+        self.document_m = 4
+        self.organization = signatures.ORGANIZATION_SEQUENTIAL  # Organization of the signature file
 
-    def hash_function(self, word):
+    @property
+    def parameters(self) -> dict:
         """
-        A hash function to generate a 512-bit vector with exactly 16 ones.
+        Parameters of the signature file (see signatures.PARAMETERS).
         """
+        return {name: getattr(self, name) for name in signatures.PARAMETERS}
 
-        hash_value = 0
-        prime = 31  # A prime number for hash function
-        mod = 2 ** 64  # To ensure the hash value fits within 64-bit unsigned integer
-
-        for char in word:
-            hash_value = (hash_value * prime + ord(char.lower())) % mod
-
-        # Initialize a zero vector of length F
-        vector = [0] * self.F
-
-        random.seed(hash_value)
-
-        positions = random.sample(range(self.F), self.m)
-
-        for pos in positions:
-            vector[pos] = 1
+    def configure(self, parameters: dict):
+        """
+        Sets the parameters of the signature file, e.g. ones chosen by signatures.tune().
+        :param parameters: Dictionary with the signatures.PARAMETERS
+        """
+        for name in signatures.PARAMETERS:
+            setattr(self, name, int(parameters[name]))
 
-        return vector
+    def hash_function(self, term_id: int, level: str = signatures.LEVEL_BLOCKS) -> int:
+        """
+        A hash function to generate an F-bit signature with exactly m ones for a term ID (see
+        signatures.term_signature()), or a document-level signature with document_m of document_F bits.
+        :return: The signature, packed into a Python int (bit i is position i)
+        """
+        if level == signatures.LEVEL_DOCUMENTS:
+            return signatures.term_signature(term_id, self.document_F, self.document_m)
+        return signatures.term_signature(term_id, self.F, self.m)
 
     def document_to_representation(self, document, stemming=False, stopword_filtering=False):
         if stemming:
-            terms = document.stemmed_terms
+            terms = document.stemmed_term_ids
         elif stopword_filtering:
-            terms = document.filtered_terms
+            terms = document.filtered_term_ids
         else:
-            terms = document.terms
+            terms = document.term_ids
+        return self.signature_file([terms])
 
-        total_words = len(terms)
-        num_blocks = (total_words + self.D - 1) // self.D
-        bit_signatures = [[0] * self.F for _ in range(num_blocks)]
-
-        for i, term in enumerate(terms):
-            block_index = i // self.D
-            term_signature = self.hash_function(term)
-            for j in range(self.F):
-                bit_signatures[block_index][j] |= term_signature[j]
-        return bit_signatures
+    def signature_file(self, term_lists) -> signatures.SignatureFile:
+        """
+        Computes the packed block signatures of several documents, in the chosen organization (see
+        signatures.SignatureFile and signatures.BitSlicedSignatureFile).
+        :param term_lists: Term ID arrays of the documents
+        """
+        if self.organization == signatures.ORGANIZATION_BIT_SLICED:
+            return signatures.BitSlicedSignatureFile.build(term_lists, self.hash_function, self.D, self.F,
+                                                           self.document_F)
+        return signatures.SignatureFile.build(term_lists, self.hash_function, self.D, self.F, self.document_F)
 
     def query_to_representation(self, query: str):
-        def get_precedence(op):
-            if op == '-':
-                return 3
-            if op == '&':
-                return 2
-            if op == '|':
-                return 1
-            return 0
-
-        def is_operator(c):
-            return c in ['&', '|', '-']
-
-        def convertToList(query):
-            queryList = []
-            i = 0
-            while i < len(query):
-                if query[i].isalnum():
-                    word = []
-                    while i < len(query) and query[i].isalnum():
-                        word.append(query[i])
-                        i += 1
-                    queryList.append(''.join(word))
-                elif query[i] == '(':
-                    queryList.append(query[i])
-                    i = i+1
-                elif query[i] == ')':
-                    queryList.append(query[i])
-                    i = i+1
-                elif (is_operator(query[i])):
-                    queryList.append(query[i])
-                    i = i+1
-            return queryList
-
-        lowercase_query = query.lower()
-        str_query = convertToList(lowercase_query)
-        stack = []
-        result = []
-
-        i = 0
-        while i < len(str_query):
-            if str_query[i].isalpha():
-                bit_signature = [0] * self.F
-                term_signature = self.hash_function(str_query[i])
-                for j in range(self.F):
-                    bit_signature[j] |= term_signature[j]
-                result.append(bit_signature)
-            elif str_query[i] == '(':
-                stack.append(str_query[i])
-            elif str_query[i] == ')':
-                while stack and stack[-1] != '(':
-                    result.append(stack.pop())
-                stack.pop()
-            else:
-                while stack and is_operator(stack[-1]) and get_precedence(str_query[i]) <= get_precedence(stack[-1]):
-                    # print(stack.pop)
-                    result.append(stack.pop())
-                stack.append(str_query[i])
-            i += 1
-        while stack:
-            result.append(stack.pop())
-        return result
-
-    def compute_match_score(self, query_signature, doc_signature):
-        """
-        Compute the match score between the query signature and the document signatures.
-        """
-        if not isinstance(query_signature, list):
-            query_signature = list(query_signature)
-        if not isinstance(doc_signature, list):
-            doc_signature = list(doc_signature)
-        # Compute the intersection and union
-        intersection = [q & d for q, d in zip(query_signature, doc_signature)]
-        is_present = intersection == query_signature
-
-        return 1.0 if is_present else 0.0
+        return query_compiler.compile_and_bind(query)
+
+    def compute_match_score(self, query_signature: int, doc_signature: int) -> float:
+        """
+        Compute the match score between a query signature and a block signature: 1.0 if the block contains all bits of
+        the query.
+        """
+        return 1.0 if doc_signature & query_signature == query_signature else 0.0
 
     def match(self, document_representation, query_representation):
-        match_results = []
-        if len(query_representation) > 1:
-            stack = []
-            while query_representation:
-                query_element = query_representation.pop(0)
-                if not any(op in query_element for op in ["&", "|", "-"]):
-
-                    match_results = []
-                    for document in document_representation:
-                        match_score = max(self.compute_match_score(
-                            query_element, doc_signature) for doc_signature in document)
-                        match_results.append(match_score)
-                    stack.append(match_results)
-                elif query_element == "&":
-                    query_element1 = stack.pop() if stack else []
-                    query_element2 = stack.pop() if stack else []
-                    bitwise_and_result = [int(a) & int(b) for a, b in zip(
-                        query_element1, query_element2)]
-                    bitwise_and_result_float = [
-                        float(result) for result in bitwise_and_result]
-                    stack.append(bitwise_and_result_float)
-                elif query_element == "|":
-                    query_element1 = stack.pop() if stack else []
-                    query_element2 = stack.pop() if stack else []
-                    bitwise_or_result = [int(a) | int(b) for a, b in zip(
-                        query_element1, query_element2)]
-                    bitwise_or_result_float = [
-                        float(result) for result in bitwise_or_result]
-                    stack.append(bitwise_or_result_float)
-                elif query_element == "-":
-                    query_element1 = stack.pop() if stack else []
-                    negation_result = [~int(a) & 1 for a in query_element1]
-                    negation_result_float = [
-                        float(result) for result in negation_result]
-
-                    stack.append(negation_result_float)
-                else:
-                    "in disasters"
-            return stack[0]
-        elif len(query_representation) == 1:
-            query_element = query_representation.pop()
-            for document in document_representation:
-                match_score = max(self.compute_match_score(
-                    query_element, doc_signature) for doc_signature in document)
-                match_results.append(match_score)
-            return match_results
-        return []
+        """
+        Matches a query against the signature file of the collection.
+        :return: 1.0 for every document that may match (including false drops), 0.0 for the others
+        """
+        possible, _ = self.evaluate(document_representation, self.query_to_representation(query_representation).tree)
+        return possible.astype(float)
+
+    def evaluate(self, document_representation, tree: tuple, counters: dict = None) -> tuple:
+        """
+        Evaluates a query tree in term ID space on the signature file of the collection. Signatures can only tell
+        that a document does not contain a term, so every node yields two bounds: the documents that may match and
+        the documents that certainly match. Phrases and proximity expressions may match every document whose
+        signatures contain all of their terms.
+        :param document_representation: Signature file of the collection (see signatures.SignatureFile)
+        :param counters: Dictionary in which the candidates and times of the signature levels are added up, if given
+        :return: Boolean arrays over the documents: documents that may match, and documents that certainly match
+        """
+        kind = tree[0]
+        document_count = document_representation.document_count
+        if kind == 'term':
+            possible = np.ones(document_count, dtype=bool)
+            for term in query_compiler.operand_terms(tree[1]):
+                possible &= document_representation.matching_documents(
+                    self.hash_function(term, signatures.LEVEL_DOCUMENTS), self.hash_function(term), counters)
+            return possible, np.zeros(document_count, dtype=bool)
+        if kind == 'not':
+            possible, certain = self.evaluate(document_representation, tree[1], counters)
+            return ~certain, ~possible
+        child_results = [self.evaluate(document_representation, child, counters) for child in tree[1]]
+        if not child_results:
+            return np.zeros(document_count, dtype=bool), np.zeros(document_count, dtype=bool)
+        possible, certain = np.array([result[0] for result in child_results]), np.array([result[1] for result in
+                                                                                         child_results])
+        if kind == 'and':
+            return possible.all(axis=0), certain.all(axis=0)
+        return possible.any(axis=0), certain.any(axis=0)
+
+    def verify(self, terms: array, tree: tuple) -> bool:
+        """
+        Checks exactly whether a document matches a query tree, to rule out false drops of the signatures.
+        :param terms: Term IDs of the document
+        """
+        return evaluate_boolean(terms, tree)
 
     def __str__(self):
+        if self.organization == signatures.ORGANIZATION_BIT_SLICED:
+            return 'Boolean Model (Bit-Sliced Signatures)'
         return 'Boolean Model (Signatures)'
 
 
@@ -0,0 +1,101 @@
+# Contains the cost-based planner that evaluates Boolean queries on the inverted index.
+import indexing
+import postings
+import query_compiler
+
+# A posting list is probed with a cursor instead of being combined as a bitmap if it holds this many times more
+# postings than there are candidates left.
+PROBE_RATIO = 8
+
+
+def plan(tree: tuple, index) -> tuple:
+    """
+    Turns a query tree into an execution plan and estimates the number of matching documents of every node.
+    The operands of an AND are ordered by their estimate, and its negated operands are split off so that the AND is
+    executed as a difference instead of materializing complements. Plan nodes are ('term', operand, estimate),
+    ('and', positive children, negated children, estimate), ('or', children, estimate) and ('not', child, estimate).
+    :param tree: Query tree in term ID space (see term_dictionary.bind_query())
+    :param index: The inverted index (see indexing.IndexView)
+    :return: Root node of the plan
+    """
+    document_count = index.document_count()
+    kind = tree[0]
+    if kind == 'term':
+        return 'term', tree[1], min(index.document_frequency(term) for term in query_compiler.operand_terms(tree[1]))
+    if kind == 'not':
+        child = plan(tree[1], index)
+        return 'not', child, document_count - child[-1]
+    children = [plan(child, index) for child in tree[1]]
+    if kind == 'or':
+        return 'or', tuple(children), min(document_count, sum(child[-1] for child in children))
+    positives = sorted((child for child in children if child[0] != 'not'), key=lambda child: child[-1])
+    negatives = sorted((child[1] for child in children if child[0] == 'not'), key=lambda child: -child[-1])
+    estimate = positives[0][-1] if positives else document_count - sum(child[-1] for child in negatives)
+    return 'and', tuple(positives), tuple(negatives), max(estimate, 0)
+
+
+def as_bitmap(result) -> int:
+    return result if isinstance(result, int) else postings.to_bitmap(result)
+
+
+def as_list(result) -> list[int]:
+    return postings.from_bitmap(result) if isinstance(result, int) else result
+
+
+def result_size(result) -> int:
+    return bin(result).count('1') if isinstance(result, int) else len(result)
+
+
+def execute(node: tuple, index):
+    """
+    Executes a plan. Intermediate results are either sorted lists of document IDs or bitmaps. An AND starts with its
+    cheapest operand and stops as soon as no candidate is left; a long posting list is probed with a skip cursor for
+    the few remaining candidates (O(candidates * log(postings))) instead of being decoded into a bitmap.
+    :param node: Plan node (see plan())
+    :param index: The inverted index (see indexing.IndexView)
+    :return: Sorted list or bitmap of the matching document IDs
+    """
+    kind = node[0]
+    if kind == 'term':
+        operand = node[1]
+        if query_compiler.is_term(operand):
+            return index.bitmap(operand)
+        return list(indexing.operand_spans(operand, index.positions))
+    if kind == 'not':
+        return index.live_documents() & ~as_bitmap(execute(node[1], index))
+    if kind == 'or':
+        result = 0
+        for child in node[1]:
+            result |= as_bitmap(execute(child, index))
+        return result
+
+    positives, negatives = node[1], node[2]
+    if positives and positives[0][0] == 'term' and query_compiler.is_term(positives[0][1]):
+        candidates = index.get(positives[0][1], [])
+    elif positives:
+        candidates = execute(positives[0], index)
+    else:
+        candidates = index.live_documents()
+    for child, keep_matches in [(child, True) for child in positives[1:]] + [(child, False) for child in negatives]:
+        size = result_size(candidates)
+        if size == 0:
+            return []
+        if child[0] == 'term' and query_compiler.is_term(child[1]) and size * PROBE_RATIO < child[-1]:
+            with index.cursor(child[1]) as cursor:
+                candidates = [d for d in as_list(candidates) if (cursor.seek(d) == d) == keep_matches]
+        elif keep_matches:
+            candidates = as_bitmap(candidates) & as_bitmap(execute(child, index))
+        else:
+            candidates = as_bitmap(candidates) & ~as_bitmap(execute(child, index))
+    return candidates
+
+
+def evaluate(tree: tuple, index) -> list[int]:
+    """
+    Plans and executes a Boolean query on the inverted index.
+    :param tree: Query tree in term ID space (see term_dictionary.bind_query())
+    :param index: The inverted index (see indexing.IndexView)
+    :return: Sorted IDs of the matching documents
+    """
+    with index.lock:
+        return as_list(execute(plan(tree, index), index))
@@ -0,0 +1,433 @@
+# Contains the on-disk format of posting lists: delta-gap + variable-byte compressed segment files that are
+# memory-mapped and decoded lazily, one term at a time. Term positions are stored in a separate area of the file and
+# are only decoded for phrase and proximity queries. A skip table per term allows seeking in a posting list without
+# decoding all of it. Terms are identified by their IDs in the term dictionary (see term_dictionary.py).
+import bisect
+import mmap
+import struct
+from collections import OrderedDict
+
+SEGMENT_MAGIC = b'AIPS'
+SEGMENT_VERSION = 4
+
+# Header: magic, format version, number of terms.
+HEADER = struct.Struct('<4sHI')
+# Term table entry: term ID, document frequency, offset and length of the postings, offset and length of the positions,
+# offset and length of the skip table.
+TERM_ENTRY = struct.Struct('<IIIIIIII')
+# Offsets of the postings blob, the positions blob and the skip blob, stored after the header.
+BLOB_OFFSETS = struct.Struct('<III')
+# Number of postings per block of the skip table.
+SKIP_BLOCK_SIZE = 64
+
+
+def encode_vbyte(numbers: list[int]) -> bytes:
+    """
+    Encodes non-negative integers with variable-byte encoding. Each byte carries 7 bits of payload, the high bit marks
+    the last byte of a number.
+    :param numbers: Integers to encode
+    :return: Encoded bytes
+    """
+    encoded = bytearray()
+    for number in numbers:
+        while number >= 128:
+            encoded.append(number & 127)
+            number >>= 7
+        encoded.append(number | 128)
+    return bytes(encoded)
+
+
+def decode_vbyte(buffer, start: int = 0, end: int = None) -> list[int]:
+    """
+    Decodes variable-byte encoded integers.
+    :param buffer: Bytes-like object that holds the encoded integers
+    :param start: Offset of the first byte to decode
+    :param end: Offset after the last byte to decode
+    :return: Decoded integers
+    """
+    end = len(buffer) if end is None else end
+    numbers = []
+    number = 0
+    shift = 0
+    for byte in buffer[start:end]:
+        if byte & 128:
+            numbers.append(number | ((byte & 127) << shift))
+            number = 0
+            shift = 0
+        else:
+            number |= byte << shift
+            shift += 7
+    return numbers
+
+
+def encode_postings(document_ids: list[int]) -> bytes:
+    """
+    Encodes a sorted posting list as variable-byte encoded gaps between consecutive document IDs.
+    :param document_ids: Sorted document IDs
+    :return: Encoded posting list
+    """
+    gaps = []
+    previous = 0
+    for document_id in document_ids:
+        gaps.append(document_id - previous)
+        previous = document_id
+    return encode_vbyte(gaps)
+
+
+def decode_postings(buffer, start: int = 0, end: int = None) -> list[int]:
+    """
+    Decodes a posting list that was encoded with encode_postings().
+    :return: Sorted document IDs
+    """
+    document_ids = decode_vbyte(buffer, start, end)
+    for i in range(1, len(document_ids)):
+        document_ids[i] += document_ids[i - 1]
+    return document_ids
+
+
+def encode_skips(document_ids: list[int]) -> bytes:
+    """
+    Encodes the skip table of a posting list. The encoded posting list is split into blocks of SKIP_BLOCK_SIZE
+    postings; for every block the table holds the gap between its last document ID and the last ID of the previous
+    block, followed by the byte length of the block.
+    :param document_ids: Sorted document IDs
+    :return: Encoded skip table
+    """
+    numbers = []
+    previous = 0
+    for start in range(0, len(document_ids), SKIP_BLOCK_SIZE):
+        block = document_ids[start:start + SKIP_BLOCK_SIZE]
+        base = document_ids[start - 1] if start else 0
+        numbers.append(block[-1] - previous)
+        gaps = [block[0] - base] + [block[i] - block[i - 1] for i in range(1, len(block))]
+        numbers.append(len(encode_vbyte(gaps)))
+        previous = block[-1]
+    return encode_vbyte(numbers)
+
+
+def decode_skips(buffer, start: int = 0, end: int = None) -> tuple:
+    """
+    Decodes a skip table that was encoded with encode_skips().
+    :return: Last document ID of every block and byte offset (relative to the postings) of the end of every block
+    """
+    numbers = decode_vbyte(buffer, start, end)
+    last_ids = numbers[0::2]
+    ends = numbers[1::2]
+    for i in range(1, len(last_ids)):
+        last_ids[i] += last_ids[i - 1]
+        ends[i] += ends[i - 1]
+    return last_ids, ends
+
+
+class PostingCursor(object):
+    """
+    Forward-only cursor on a compressed posting list. seek() gallops over the skip table and only decodes the block
+    that can hold the target, so probing a long list for a few document IDs costs O(probes * log(blocks)).
+    """
+
+    def __init__(self, buffer, start: int, last_ids: list[int], ends: list[int]):
+        self._buffer = buffer
+        self._start = start
+        self._last_ids = last_ids
+        self._ends = ends
+        self._block = -1
+        self._block_ids = []
+
+    def _decode_block(self, block: int):
+        begin = self._start + (self._ends[block - 1] if block else 0)
+        base = self._last_ids[block - 1] if block else 0
+        self._block_ids = decode_vbyte(self._buffer, begin, self._start + self._ends[block])
+        self._block_ids[0] += base
+        for i in range(1, len(self._block_ids)):
+            self._block_ids[i] += self._block_ids[i - 1]
+        self._block = block
+
+    def seek(self, target: int):
+        """
+        Moves the cursor to the first document ID that is greater than or equal to the target.
+        :param target: Document ID to look for; must not be smaller than the target of the previous call
+        :return: The found document ID, or None if the list holds no such ID
+        """
+        low = max(self._block, 0)
+        if low >= len(self._last_ids):
+            return None
+        # Galloping search: double the step until a block ends at or after the target, then search binary.
+        step = 1
+        high = low
+        while high < len(self._last_ids) and self._last_ids[high] < target:
+            low = high + 1
+            high += step
+            step *= 2
+        block = bisect.bisect_left(self._last_ids, target, low, min(high + 1, len(self._last_ids)))
+        if block >= len(self._last_ids):
+            self._block = block
+            return None
+        if block != self._block:
+            self._decode_block(block)
+        return self._block_ids[bisect.bisect_left(self._block_ids, target)]
+
+
+def encode_positions(positional_postings: dict[int, list[int]]) -> bytes:
+    """
+    Encodes the positions of a term in all documents of its posting list. For every document, the number of positions
+    is followed by the gaps between the sorted positions.
+    :param positional_postings: Dictionary that maps document IDs (in posting order) to sorted positions
+    :return: Encoded positions
+    """
+    numbers = []
+    for positions in positional_postings.values():
+        numbers.append(len(positions))
+        previous = 0
+        for position in positions:
+            numbers.append(position - previous)
+            previous = position
+    return encode_vbyte(numbers)
+
+
+def decode_positions(document_ids: list[int], buffer, start: int = 0, end: int = None) -> dict[int, list[int]]:
+    """
+    Decodes positions that were encoded with encode_positions().
+    :param document_ids: Posting list the positions belong to
+    :return: Dictionary that maps document IDs to sorted positions
+    """
+    numbers = decode_vbyte(buffer, start, end)
+    positional_postings = {}
+    i = 0
+    for document_id in document_ids:
+        count = numbers[i]
+        positions = numbers[i + 1:i + 1 + count]
+        for j in range(1, count):
+            positions[j] += positions[j - 1]
+        positional_postings[document_id] = positions
+        i += count + 1
+    return positional_postings
+
+
+# Positions of the set bits of every byte value, used to unpack bitmaps a byte at a time.
+_BYTE_BITS = [[bit for bit in range(8) if value >> bit & 1] for value in range(256)]
+
+
+def to_bitmap(document_ids) -> int:
+    """
+    Packs document IDs into a bitmap. The bitmap is a Python integer in which bit i is set if document i is included,
+    so that AND, OR and NOT run word-parallel on the machine words of the integer.
+    :param document_ids: Document IDs to pack
+    :return: The bitmap
+    """
+    document_ids = list(document_ids)
+    if not document_ids:
+        return 0
+    packed = bytearray(max(document_ids) // 8 + 1)
+    for document_id in document_ids:
+        packed[document_id >> 3] |= 1 << (document_id & 7)
+    return int.from_bytes(packed, 'little')
+
+
+def from_bitmap(bitmap: int) -> list[int]:
+    """
+    Unpacks a bitmap into the sorted list of the document IDs it contains.
+    :param bitmap: Bitmap created with to_bitmap()
+    :return: Sorted document IDs
+    """
+    document_ids = []
+    for byte_index, value in enumerate(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')):
+        if value:
+            base = byte_index << 3
+            document_ids += [base + bit for bit in _BYTE_BITS[value]]
+    return document_ids
+
+
+def write_segment(inverted_list: dict[int, dict[int, list[int]]], file_path: str) -> None:
+    """
+    Writes a positional inverted list into a segment file. The file holds a header, a term table that is sorted by
+    term ID, the compressed posting lists, the compressed positions and the skip tables.
+    :param inverted_list: Dictionary that maps term IDs to dictionaries from sorted document IDs to term positions
+    :param file_path: Path of the segment file
+    """
+    terms = sorted(inverted_list)
+    term_table = bytearray()
+    postings_blob = bytearray()
+    positions_blob = bytearray()
+    skips_blob = bytearray()
+    for term in terms:
+        document_ids = list(inverted_list[term])
+        encoded_postings = encode_postings(document_ids)
+        encoded_positions = encode_positions(inverted_list[term])
+        encoded_skips = encode_skips(document_ids)
+        term_table += TERM_ENTRY.pack(term, len(document_ids),
+                                      len(postings_blob), len(encoded_postings),
+                                      len(positions_blob), len(encoded_positions),
+                                      len(skips_blob), len(encoded_skips))
+        postings_blob += encoded_postings
+        positions_blob += encoded_positions
+        skips_blob += encoded_skips
+
+    postings_blob_offset = HEADER.size + BLOB_OFFSETS.size + len(term_table)
+    positions_blob_offset = postings_blob_offset + len(postings_blob)
+    skips_blob_offset = positions_blob_offset + len(positions_blob)
+    with open(file_path, 'wb') as segment_file:
+        segment_file.write(HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, len(terms)))
+        segment_file.write(BLOB_OFFSETS.pack(postings_blob_offset, positions_blob_offset, skips_blob_offset))
+        segment_file.write(term_table)
+        segment_file.write(postings_blob)
+        segment_file.write(positions_blob)
+        segment_file.write(skips_blob)
+
+
+class Segment(object):
+    """
+    Read-only view of a segment file. The file is memory-mapped on opening; terms are found by binary search in the
+    term table and their posting lists are only decoded when they are requested.
+    """
+
+    def __init__(self, file_path: str, cache_size: int = 1024):
+        self.file_path = file_path
+        with open(file_path, 'rb') as segment_file:
+            self._buffer = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._term_count = HEADER.unpack_from(self._buffer, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            raise ValueError(f'{file_path} is not a segment file of version {SEGMENT_VERSION}.')
+        self._postings_blob_offset, self._positions_blob_offset, self._skips_blob_offset = BLOB_OFFSETS.unpack_from(
+            self._buffer, HEADER.size)
+        self._term_table_offset = HEADER.size + BLOB_OFFSETS.size
+        self._cache = OrderedDict()  # Recently decoded posting lists.
+        self._positions_cache = OrderedDict()  # Recently decoded term positions.
+        self._bitmap_cache = OrderedDict()  # Bitmaps of recently used posting lists.
+        self._skips_cache = OrderedDict()  # Recently decoded skip tables.
+        self._cache_size = cache_size
+
+    def __len__(self):
+        return self._term_count
+
+    def __contains__(self, term):
+        return self._find(term) is not None
+
+    def __getitem__(self, term):
+        postings = self.get(term)
+        if postings is None:
+            raise KeyError(term)
+        return postings
+
+    def _entry(self, index: int) -> tuple:
+        return TERM_ENTRY.unpack_from(self._buffer, self._term_table_offset + index * TERM_ENTRY.size)
+
+    def _find(self, term: int):
+        """
+        Binary search for a term ID in the term table.
+        :return: Term table entry of the term, or None if the term is not in the segment
+        """
+        low, high = 0, self._term_count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            if entry[0] == term:
+                return entry
+            if entry[0] < term:
+                low = middle + 1
+            else:
+                high = middle - 1
+        return None
+
+    def document_frequency(self, term: int) -> int:
+        entry = self._find(term)
+        return entry[1] if entry else 0
+
+    def _decode_postings(self, entry: tuple) -> list[int]:
+        start = self._postings_blob_offset + entry[2]
+        return decode_postings(self._buffer, start, start + entry[3])
+
+    def _decode_positions(self, entry: tuple, document_ids: list[int]) -> dict[int, list[int]]:
+        start = self._positions_blob_offset + entry[4]
+        return decode_positions(document_ids, self._buffer, start, start + entry[5])
+
+    def _remember(self, cache: OrderedDict, term: int, value):
+        cache[term] = value
+        if len(cache) > self._cache_size:
+            cache.popitem(last=False)
+
+    def get(self, term: int, default=None):
+        """
+        Returns the decoded posting list of a term.
+        :param term: ID of the term to look up
+        :param default: Returned if the term is not in the segment
+        :return: Sorted document IDs
+        """
+        if term in self._cache:
+            self._cache.move_to_end(term)
+            return self._cache[term]
+        entry = self._find(term)
+        if entry is None:
+            return default
+        postings = self._decode_postings(entry)
+        self._remember(self._cache, term, postings)
+        return postings
+
+    def bitmap(self, term: int) -> int:
+        """
+        Returns the posting list of a term as a bitmap (see to_bitmap()).
+        :param term: ID of the term to look up
+        :return: Bitmap of the documents that contain the term (0 if the term is not in the segment)
+        """
+        if term in self._bitmap_cache:
+            self._bitmap_cache.move_to_end(term)
+            return self._bitmap_cache[term]
+        bitmap = to_bitmap(self.get(term, []))
+        self._remember(self._bitmap_cache, term, bitmap)
+        return bitmap
+
+    def cursor(self, term: int):
+        """
+        Opens a cursor on the posting list of a term that seeks via the skip table (see PostingCursor).
+        :param term: ID of the term to look up
+        :return: The cursor, or None if the term is not in the segment
+        """
+        if term in self._skips_cache:
+            self._skips_cache.move_to_end(term)
+            entry, skips = self._skips_cache[term]
+        else:
+            entry = self._find(term)
+            if entry is None:
+                return None
+            start = self._skips_blob_offset + entry[6]
+            skips = decode_skips(self._buffer, start, start + entry[7])
+            self._remember(self._skips_cache, term, (entry, skips))
+        return PostingCursor(self._buffer, self._postings_blob_offset + entry[2], *skips)
+
+    def positions(self, term: int) -> dict[int, list[int]]:
+        """
+        Returns the positions of a term in all documents that contain it.
+        :param term: ID of the term to look up
+        :return: Dictionary that maps sorted document IDs to sorted positions (empty if the term is not in the segment)
+        """
+        if term in self._positions_cache:
+            self._positions_cache.move_to_end(term)
+            return self._positions_cache[term]
+        entry = self._find(term)
+        if entry is None:
+            return {}
+        positions = self._decode_positions(entry, self.get(term))
+        self._remember(self._positions_cache, term, positions)
+        return positions
+
+    def terms(self):
+        """
+        Iterates over the IDs of all terms of the segment in sorted order.
+        """
+        for index in range(self._term_count):
+            yield self._entry(index)[0]
+
+    def items(self):
+        """
+        Iterates over the IDs of all terms of the segment in sorted order, together with their positional posting
+        lists. The lists are decoded one by one and do not go through the cache.
+        """
+        for index in range(self._term_count):
+            entry = self._entry(index)
+            yield entry[0], self._decode_positions(entry, self._decode_postings(entry))
+
+    def close(self):
+        self._cache.clear()
+        self._positions_cache.clear()
+        self._bitmap_cache.clear()
+        self._skips_cache.clear()
+        self._buffer.close()
@@ -0,0 +1,84 @@
+# Contains static index pruning of the TF-IDF matrix.
+import numpy as np
+
+from catalog import StatisticsCatalog
+from tfidf import TfIdfMatrix
+
+# Pruning methods: a threshold relative to the k-th highest weight of each term, or one global weight threshold.
+PRUNING_TERM, PRUNING_GLOBAL = 'term', 'global'
+# Result depth k that the per-term method protects: the k highest-weight postings of a term are pruned last.
+PRUNING_DEPTH = 10
+
+
+class PrunedTfIdfMatrix(TfIdfMatrix):
+    """
+    TF-IDF matrix without its low-weight postings (static index pruning, Carmel et al.). Only a given fraction of the
+    postings (the budget) is kept. The per-term method keeps the postings whose weight is at least epsilon times the
+    PRUNING_DEPTH-th highest weight of their term, the global method the postings above one weight threshold; epsilon
+    and the threshold are chosen to meet the budget. Document norms and IDFs still come from the full statistics
+    catalog, so the kept postings have the same weights as in the unpruned matrix.
+    """
+
+    def __init__(self, statistics: StatisticsCatalog, budget: float, method: str = PRUNING_TERM):
+        """
+        Builds the pruned matrix.
+        :param statistics: Catalog of the term view to weight
+        :param budget: Fraction of the postings to keep, between 0 and 1
+        :param method: PRUNING_TERM or PRUNING_GLOBAL
+        """
+        super().__init__(statistics)
+        self.budget = budget
+        self.method = method
+        self.columns = {}  # Maps term IDs to the kept (rows, weights) of their columns.
+        self.prune()
+
+    def prune(self):
+        """
+        Selects the postings to keep from the current state of the catalog. Needs to be called again after documents
+        were added or deleted.
+        """
+        terms, rows, tfs = self.statistics.entries()
+        weights = tfs * self.statistics.idf(terms) / np.maximum(self.statistics.norms(rows), np.finfo(float).tiny)
+        if self.method == PRUNING_GLOBAL:
+            scores = weights
+        else:
+            # k-th highest weight of every term (its lowest weight if it occurs in fewer than k documents).
+            order = np.lexsort((-weights, terms))
+            term_starts = np.flatnonzero(np.r_[True, terms[order][1:] != terms[order][:-1]])
+            term_ends = np.r_[term_starts[1:], len(order)]
+            kth_weights = weights[order][np.minimum(term_starts + PRUNING_DEPTH, term_ends) - 1]
+            scores = np.empty(len(weights))
+            scores[order] = weights[order] / np.repeat(np.maximum(kth_weights, np.finfo(float).tiny),
+                                                       term_ends - term_starts)
+        keep_count = int(np.ceil(self.budget * len(weights)))
+        keep = np.zeros(len(weights), dtype=bool)
+        if keep_count:
+            keep[np.argpartition(-scores, keep_count - 1)[:keep_count]] = True
+        terms, rows, weights = terms[keep], rows[keep], weights[keep]
+
+        order = np.lexsort((rows, terms))
+        terms, rows, weights = terms[order], rows[order], weights[order]
+        starts = np.flatnonzero(np.r_[True, terms[1:] != terms[:-1]]) if len(terms) else np.zeros(0, dtype=np.int64)
+        ends = np.r_[starts[1:], len(terms)]
+        self.columns = {int(terms[start]): (rows[start:end], weights[start:end])
+                        for start, end in zip(starts.tolist(), ends.tolist())}
+        self._derived_columns = {}
+        self._derived_version = self.statistics.version
+
+    @property
+    def posting_count(self) -> int:
+        return sum(len(rows) for rows, _ in self.columns.values())
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory used by the kept postings.
+        """
+        return sum(rows.nbytes + weights.nbytes for rows, weights in self.columns.values())
+
+    def column(self, term: int) -> tuple:
+        if term not in self.columns:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        rows, weights = self.columns[term]
+        live = self.statistics.live[rows]
+        return rows[live], weights[live]
@@ -0,0 +1,232 @@
+# Contains the query compiler that all retrieval models and the evaluation share. A query string is compiled once into
+# an immutable query tree; compiled queries are cached by normalized query text and analysis mode.
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+import cleanup
+import porter
+import term_dictionary
+
+# Precedence of the binary operators. NEAR/k binds tighter than all of them and unary NOT ('-').
+BINARY_OPERATORS = {'|': 1, '&': 2}
+
+EMPTY = ('or', ())  # Query tree that matches no document.
+
+# Tokens: quoted phrases, NEAR/k, words, operators and parentheses. Everything else (e.g. spaces) separates tokens.
+TOKEN_PATTERN = re.compile(r'"[^"]*"?|near/\d+|[^\W_]+|[&|\-()]')
+
+
+class CompiledQuery(NamedTuple):
+    """
+    An immutable, compiled query.
+    text: Normalized query text
+    stemming: Whether the query terms were stemmed
+    tree: Canonical query tree. Nodes are ('term', operand), ('and', children), ('or', children) and ('not', child).
+          An operand is a term string, a phrase ('phrase', terms) or a proximity expression
+          ('near', distance, left operand, right operand).
+    terms: All query terms in the order of the query text, including repetitions
+    """
+    text: str
+    stemming: bool
+    tree: tuple
+    terms: tuple
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query string: lowercase and single spaces.
+    """
+    return ' '.join(query.lower().split())
+
+
+def compile_query(query, stemming: bool = False, stop_words: frozenset = None) -> CompiledQuery:
+    """
+    Compiles a query string, or returns it unchanged if it was already compiled.
+    :param query: Query string or CompiledQuery
+    :param stemming: Controls, whether the query terms are stemmed with the Porter algorithm
+    :param stop_words: If given, these stop words are removed from phrases with the filter of the collection (see
+    cleanup.remove_stop_words_from_term_list()), so that phrases match the positions of the stopword-filtered terms
+    :return: The compiled query
+    """
+    if isinstance(query, CompiledQuery):
+        return query
+    return _compile_normalized(normalize_query(query), stemming, stop_words)
+
+
+def compile_and_bind(query, stemming: bool = False, stop_words: frozenset = None) -> CompiledQuery:
+    """
+    Compiles a query and binds it to the global term dictionary (see term_dictionary.bind_query()), or returns it
+    unchanged if it was already bound. Like compiled queries, bound queries are cached; the cache key includes the size
+    of the vocabulary, since new terms can change the binding of a query.
+    :param query: Query string or CompiledQuery
+    :param stemming: Controls, whether the query terms are stemmed with the Porter algorithm
+    :param stop_words: If given, these stop words are removed from phrases (see compile_query())
+    :return: The compiled query in term ID space
+    """
+    if isinstance(query, CompiledQuery) and term_dictionary.is_bound(query):
+        return query
+    return _bind(compile_query(query, stemming, stop_words), len(term_dictionary.DICTIONARY))
+
+
+def clear_cache():
+    """
+    Drops all cached compiled and bound queries.
+    """
+    _compile_normalized.cache_clear()
+    _bind.cache_clear()
+
+
+@lru_cache(maxsize=512)
+def _bind(query: CompiledQuery, vocabulary_size: int) -> CompiledQuery:
+    return term_dictionary.bind_query(query)
+
+
+@lru_cache(maxsize=512)
+def _compile_normalized(text: str, stemming: bool, stop_words: frozenset = None) -> CompiledQuery:
+    tokens = TOKEN_PATTERN.findall(text)
+    analyze = porter.stem_term if stemming else (lambda term: term)
+    parser = _Parser(tokens, analyze, stop_words)
+    tree = canonicalize(parser.parse())
+    return CompiledQuery(text, stemming, tree, tuple(parser.terms))
+
+
+class _Parser(object):
+    """
+    Recursive descent parser for the Boolean query language:
+        expression := conjunction (('|' | <nothing>) conjunction)*
+        conjunction := negation ('&' negation)*
+        negation := '-' negation | proximity
+        proximity := primary ('near/k' primary)*
+        primary := term | '"' phrase '"' | '(' expression ')'
+    Operands that follow each other without an operator are combined with OR. Incomplete input (missing operands or
+    parentheses) is tolerated.
+    """
+
+    def __init__(self, tokens: list[str], analyze, stop_words: frozenset = None):
+        self.tokens = tokens
+        self.position = 0
+        self.analyze = analyze
+        self.stop_words = stop_words
+        self.terms = []
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self) -> tuple:
+        tree = EMPTY
+        while self.peek() is not None:
+            tree = ('or', (tree, self.expression())) if tree != EMPTY else self.expression()
+            if self.peek() == ')':
+                self.next()  # Unbalanced closing parenthesis.
+        return tree
+
+    def expression(self) -> tuple:
+        children = [self.conjunction()]
+        while self.peek() is not None and self.peek() != ')':
+            if self.peek() == '|':
+                self.next()
+            children.append(self.conjunction())
+        return ('or', tuple(children)) if len(children) > 1 else children[0]
+
+    def conjunction(self) -> tuple:
+        children = [self.negation()]
+        while self.peek() == '&':
+            self.next()
+            children.append(self.negation())
+        return ('and', tuple(children)) if len(children) > 1 else children[0]
+
+    def negation(self) -> tuple:
+        if self.peek() == '-':
+            self.next()
+            return 'not', self.negation()
+        return self.proximity()
+
+    def proximity(self) -> tuple:
+        left = self.primary()
+        while self.peek() is not None and self.peek().startswith('near/'):
+            distance = int(self.next()[len('near/'):])
+            right = self.primary()
+            if left[0] == 'term' and right[0] == 'term':
+                left = ('term', ('near', distance, left[1], right[1]))
+            else:
+                # NEAR/k only combines terms, phrases and proximity expressions; anything else falls back to AND.
+                left = ('and', (left, right))
+        return left
+
+    def primary(self) -> tuple:
+        token = self.peek()
+        if token is None or token in BINARY_OPERATORS or token == ')' or token.startswith('near/'):
+            return EMPTY  # Missing operand.
+        self.next()
+        if token == '(':
+            tree = self.expression()
+            if self.peek() == ')':
+                self.next()
+            return tree
+        if token == '-':
+            return 'not', self.primary()
+        if token.startswith('"'):
+            phrase = re.findall(r'[^\W_]+', token)
+            if self.stop_words is not None:
+                phrase = cleanup.remove_stop_words_from_term_list(phrase, self.stop_words)
+            phrase = tuple(self.analyze(term) for term in phrase)
+            self.terms += phrase
+            if not phrase:
+                return EMPTY
+            return 'term', (phrase[0] if len(phrase) == 1 else ('phrase', phrase))
+        term = self.analyze(token)
+        self.terms.append(term)
+        return 'term', term
+
+
+def canonicalize(tree: tuple) -> tuple:
+    """
+    Brings a query tree into canonical form: nested ANDs and ORs are flattened, their operands deduplicated and sorted,
+    single-operand ANDs and ORs are replaced by their operand and double negations are removed.
+    :param tree: Query tree
+    :return: Equivalent canonical query tree
+    """
+    kind = tree[0]
+    if kind == 'term':
+        return tree
+    if kind == 'not':
+        child = canonicalize(tree[1])
+        return child[1] if child[0] == 'not' else ('not', child)
+    children = set()
+    for child in tree[1]:
+        child = canonicalize(child)
+        if child[0] == kind:
+            children.update(child[1])
+        else:
+            children.add(child)
+    if kind == 'and' and EMPTY in children:
+        return EMPTY
+    children.discard(EMPTY)
+    if len(children) == 1:
+        return children.pop()
+    return kind, tuple(sorted(children, key=repr))
+
+
+def is_term(operand) -> bool:
+    """
+    Checks whether a query operand is a single term (a term string, or a term ID after binding, see
+    term_dictionary.bind_query()) rather than a phrase or proximity expression.
+    """
+    return not isinstance(operand, tuple)
+
+
+def operand_terms(operand) -> list:
+    """
+    Returns the terms of a term, phrase or proximity operand.
+    """
+    if is_term(operand):
+        return [operand]
+    if operand[0] == 'phrase':
+        return list(operand[1])
+    return operand_terms(operand[2]) + operand_terms(operand[3])
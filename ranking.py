@@ -0,0 +1,287 @@
+# Contains the top-k query evaluation algorithms of the ranked retrieval models.
+import heapq
+from bisect import bisect_left
+from itertools import accumulate
+
+import numpy as np
+
+# Number of postings per block for the block maxima of Block-Max WAND.
+BLOCK_SIZE = 64
+# Row of an exhausted posting cursor.
+END = float('inf')
+
+
+def buckley_lewit(matrix, query_term_weights: list[tuple], k: int) -> list[tuple]:
+    """
+    Term-at-a-time top-k evaluation by Buckley & Lewit. Query terms are processed in order of descending weight and
+    the postings of each term in impact order (see tfidf.TfIdfMatrix.impact_column()). A bounded min-heap holds the
+    k + 1 best accumulators; after each term, evaluation stops as soon as the remaining terms can not lift the
+    (k + 1)-th document above the k-th, i.e. the top-k set is final. The bound of the remaining terms is a suffix sum
+    of the query term upper bounds (query weight times the highest weight in the term's column). The scores of the k
+    documents are then completed from the columns of the terms that were not processed.
+    :param matrix: TF-IDF matrix of the collection (see tfidf.TfIdfMatrix)
+    :param query_term_weights: List of (term ID, weight) tuples, sorted by descending weight
+    :param k: Number of results
+    :return: List of (score, row) tuples of the top-k documents, sorted by descending score
+    """
+    if k <= 0:
+        return []
+    columns = [matrix.impact_column(term) for term, _ in query_term_weights]
+    upper_bounds = [weight * (float(weights[0]) if len(weights) else 0.0)
+                    for (_, weight), (_, weights) in zip(query_term_weights, columns)]
+    # remaining[i]: highest score the terms after term i can add to a document.
+    remaining = list(accumulate(reversed(upper_bounds), initial=0.0))[::-1][1:]
+
+    accumulators = {}
+    heap = []  # Min-heap of (score, row) with the k + 1 best accumulators.
+    processed_terms = 0
+    for (_, weight), (rows, weights), remaining_bound in zip(query_term_weights, columns, remaining):
+        processed_terms += 1
+        updated = set()
+        for row, document_weight in zip(rows.tolist(), weights.tolist()):
+            accumulators[row] = accumulators.get(row, 0.0) + document_weight * weight
+            updated.add(row)
+        # Only the documents that were in the heap or were just updated can be among the k + 1 best.
+        candidates = updated.union(row for _, row in heap)
+        heap = []
+        for row in candidates:
+            entry = (accumulators[row], row)
+            if len(heap) <= k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+        # heap[0] is the (k + 1)-th best document, the smaller of its children the k-th best.
+        if len(heap) > k and min(score for score, _ in heap[1:3]) > heap[0][0] + remaining_bound:
+            break
+    top_documents = sorted(heap, key=lambda x: (-x[0], x[1]))[:k]
+    if processed_terms == len(query_term_weights):
+        return top_documents
+    # The top-k set is final, but its scores lack the remaining terms; look the k documents up in their columns.
+    top_rows = np.array([row for _, row in top_documents])
+    scores = np.array([score for score, _ in top_documents])
+    for term, weight in query_term_weights[processed_terms:]:
+        rows, weights = matrix.column(term)
+        if len(rows):
+            positions = np.minimum(np.searchsorted(rows, top_rows), len(rows) - 1)
+            found = rows[positions] == top_rows
+            scores[found] += weights[positions[found]] * weight
+    return sorted(zip(scores.tolist(), top_rows.tolist()), key=lambda x: (-x[0], x[1]))
+
+
+def accumulate_top_k(rows: np.ndarray, values: np.ndarray, k: int) -> list[tuple]:
+    """
+    Adds up score contributions per document and selects the k highest sums. Only accumulators of the documents that
+    occur in rows are allocated.
+    :param rows: Rows of the contributions
+    :param values: Score contributions
+    :param k: Number of results
+    :return: List of (score, row) tuples, sorted by descending score
+    """
+    if k <= 0 or not len(rows):
+        return []
+    accumulator_rows, inverse = np.unique(rows, return_inverse=True)
+    accumulators = np.bincount(inverse, weights=values)
+    top = np.argpartition(-accumulators, min(k, len(accumulators)) - 1)[:k]
+    top_documents = [(float(accumulators[index]), int(accumulator_rows[index])) for index in top.tolist()]
+    return sorted(top_documents, key=lambda x: (-x[0], x[1]))
+
+
+def dense_top_k(scores: np.ndarray, k: int) -> list[tuple]:
+    """
+    Selects the k highest positive scores of a dense score vector.
+    :param scores: Score of every row
+    :param k: Number of results
+    :return: List of (score, row) tuples, sorted by descending score
+    """
+    if k <= 0 or not len(scores):
+        return []
+    top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+    top_documents = [(float(scores[row]), int(row)) for row in top.tolist() if scores[row] > 0]
+    return sorted(top_documents, key=lambda x: (-x[0], x[1]))
+
+
+class TermPostings(object):
+    """
+    Document-ordered postings of one term with the score upper bounds that dynamic pruning needs: the highest weight
+    of the whole list and of each block of BLOCK_SIZE postings. Models provide them per term, so WAND and Block-Max
+    WAND work for any ranked model whose score is a sum of per-term contributions (query weight * posting weight).
+    """
+
+    def __init__(self, rows, weights, block_size: int = None):
+        """
+        :param rows: Rows of the documents that contain the term, ascending
+        :param weights: Weights of the term in these documents
+        :param block_size: Number of postings per block, BLOCK_SIZE by default
+        """
+        block_size = block_size or BLOCK_SIZE
+        rows, weights = np.asarray(rows), np.asarray(weights, dtype=np.float64)
+        self.block_size = block_size
+        self.rows = rows.tolist()
+        self.weights = weights.tolist()
+        self.max_weight = float(weights.max()) if len(weights) else 0.0
+        block_starts = np.arange(0, len(rows), block_size)
+        self.block_last_rows = rows[np.minimum(block_starts + block_size, len(rows)) - 1].tolist()
+        self.block_max_weights = np.maximum.reduceat(weights, block_starts).tolist() if len(weights) else []
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class PostingCursor(object):
+    """
+    Position in the postings of one query term during document-at-a-time evaluation.
+    """
+
+    def __init__(self, postings: TermPostings, query_weight: float):
+        self.postings = postings
+        self.query_weight = query_weight
+        self.upper_bound = postings.max_weight * query_weight
+        self.position = 0
+
+    @property
+    def row(self) -> int:
+        """
+        Current row, or END when the postings are exhausted.
+        """
+        return self.postings.rows[self.position] if self.position < len(self.postings) else END
+
+    def score(self) -> float:
+        return self.postings.weights[self.position] * self.query_weight
+
+    def advance_to(self, row: int):
+        """
+        Moves the cursor to the first posting with a row >= row.
+        """
+        self.position = bisect_left(self.postings.rows, row, self.position)
+
+    def block_bound(self, row: int) -> tuple:
+        """
+        Looks up the block that holds the first posting with a row >= row.
+        :return: The block's highest score and the last row in the block (END if there is no such block)
+        """
+        block = bisect_left(self.postings.block_last_rows, row, self.position // self.postings.block_size)
+        if block == len(self.postings.block_last_rows):
+            return 0.0, END
+        return self.postings.block_max_weights[block] * self.query_weight, self.postings.block_last_rows[block]
+
+
+def wand(query_postings: list[tuple], k: int, block_max: bool = True) -> tuple[list[tuple], int]:
+    """
+    Document-at-a-time top-k evaluation with WAND (Broder et al.) or Block-Max WAND (Ding & Suel). The cursors are kept
+    sorted by their current rows; the pivot is the first cursor at which the sum of the upper bounds of all cursors
+    up to it exceeds the score of the current k-th document. Documents before the pivot can not enter the top-k and
+    are skipped. Block-Max WAND additionally checks the block maxima of the cursors up to the pivot and skips whole
+    blocks whose documents can not enter the top-k either. The result is the same as from scoring every document.
+    :param query_postings: List of (postings, query weight) tuples, one per query term (see TermPostings)
+    :param k: Number of results
+    :param block_max: Controls, whether Block-Max WAND or plain WAND is used
+    :return: List of (score, row) tuples of the top-k documents, sorted by descending score, and the number of
+    documents that were fully scored
+    """
+    cursors = [PostingCursor(postings, weight) for postings, weight in query_postings if len(postings) and weight > 0]
+    heap = []  # Min-heap of (score, row) with the k best documents.
+    scored_documents = 0
+    if k <= 0:
+        return [], 0
+    while True:
+        cursors = [cursor for cursor in cursors if cursor.row != END]
+        cursors.sort(key=lambda cursor: cursor.row)
+        threshold = heap[0][0] if len(heap) == k else 0.0
+
+        # Find the pivot.
+        upper_bound, pivot = 0.0, None
+        for index, cursor in enumerate(cursors):
+            upper_bound += cursor.upper_bound
+            if upper_bound > threshold:
+                pivot = index
+                break
+        if pivot is None:
+            break
+        pivot_row = cursors[pivot].row
+        # All cursors on the pivot row count for its score.
+        while pivot + 1 < len(cursors) and cursors[pivot + 1].row == pivot_row:
+            pivot += 1
+
+        if block_max:
+            block_bound, next_row = 0.0, END
+            for cursor in cursors[:pivot + 1]:
+                cursor_bound, last_row = cursor.block_bound(pivot_row)
+                block_bound += cursor_bound
+                next_row = min(next_row, last_row + 1)
+            if block_bound <= threshold:
+                # No document from the pivot row up to the end of the shortest of these blocks can enter the top-k.
+                if pivot + 1 < len(cursors):
+                    next_row = min(next_row, cursors[pivot + 1].row)
+                for cursor in cursors[:pivot + 1]:
+                    cursor.advance_to(next_row)
+                continue
+
+        if cursors[0].row == pivot_row:
+            score = 0.0
+            for cursor in cursors:
+                if cursor.row != pivot_row:
+                    break
+                score += cursor.score()
+                cursor.position += 1
+            scored_documents += 1
+            if len(heap) < k:
+                heapq.heappush(heap, (score, pivot_row))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, pivot_row))
+        else:
+            # Documents before the pivot row can not enter the top-k.
+            for cursor in cursors[:pivot]:
+                cursor.advance_to(pivot_row)
+    return sorted(heap, key=lambda x: (-x[0], x[1])), scored_documents
+
+
+def score_at_a_time(segments: list[tuple], k: int, live: np.ndarray, postings_budget: int = None) -> tuple:
+    """
+    Anytime score-at-a-time top-k evaluation over impact-ordered postings (Anh & Moffat, Lin & Trotman). The impact
+    segments of all query terms are processed in order of descending impact, so the postings that contribute most are
+    added to the accumulators first. Evaluation stops when all segments are processed or the postings budget is used
+    up; the cost of a query is thereby bounded by the budget instead of the lengths of its posting lists.
+    :param segments: List of (impact, rows) tuples of all query terms (see bm25.ImpactIndex.query_segments())
+    :param k: Number of results
+    :param live: Boolean array that marks the rows of live documents
+    :param postings_budget: Maximum number of postings to process, unlimited if None
+    :return: List of (score, row) tuples of the top-k documents, sorted by descending score, and the number of
+    processed postings
+    """
+    processed_rows, processed_impacts = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    processed = 0
+    for impact, rows in sorted(segments, key=lambda segment: -segment[0]):
+        if postings_budget is not None and processed + len(rows) > postings_budget:
+            rows = rows[:postings_budget - processed]
+        processed_rows.append(rows)
+        processed_impacts.append(np.full(len(rows), impact, dtype=np.int64))
+        processed += len(rows)
+        if postings_budget is not None and processed >= postings_budget:
+            break
+    rows, impacts = np.concatenate(processed_rows), np.concatenate(processed_impacts)
+    is_live = live[rows]
+    return accumulate_top_k(rows[is_live], impacts[is_live], k), processed
+
+
+def tiered(query_tiers: list[tuple], k: int) -> tuple:
+    """
+    Approximate top-k evaluation on a tiered index. The tier-1 postings (champion lists) of all query terms are
+    accumulated first; a lower tier is only read while the tiers so far hold fewer than k documents. The scores of the
+    returned documents only include the tiers that were read.
+    :param query_tiers: List of (tiers, query weight) tuples, one per query term (see tfidf.TfIdfMatrix.tiers())
+    :param k: Number of results
+    :return: List of (score, row) tuples of the top-k documents, sorted by descending score, and the number of tiers
+    that were read
+    """
+    rows, values = [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+    tier_count = max((len(tiers) for tiers, _ in query_tiers), default=0)
+    read_tiers = 0
+    for tier in range(tier_count):
+        for tiers, weight in query_tiers:
+            if tier < len(tiers):
+                rows.append(tiers[tier][0])
+                values.append(tiers[tier][1] * weight)
+        read_tiers += 1
+        if len(np.unique(np.concatenate(rows))) >= k:
+            break
+    return accumulate_top_k(np.concatenate(rows), np.concatenate(values), k), read_tiers
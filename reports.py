@@ -0,0 +1,312 @@
+# Contains the evaluation reports of the CLI, which compare fast or approximate search methods with exact search.
+import itertools
+import time
+
+import numpy as np
+
+import indexing
+import models
+import pruning
+import query_compiler
+import ranking
+import signatures
+import term_dictionary
+import tfidf
+
+# Sizes r of the champion lists compared in the champion list report.
+CHAMPION_LIST_SIZES = (1, 2, 5, 10, 20, 50)
+# Fractions of the postings kept in the static pruning report.
+PRUNING_BUDGETS = (0.75, 0.5, 0.25)
+# Collection sizes of the signature file report, as multiples of the collection (its documents repeated).
+SIGNATURE_SCALES = (1, 4, 16, 64, 256)
+# Number of random query terms that the signature tuning report replays, besides the ground truth terms.
+RANDOM_QUERY_COUNT = 200
+
+
+def benchmark_queries(ground_truth: dict) -> list[str]:
+    """
+    Builds the queries of the reports from the ground truth: every ground truth term and every pair of them.
+    :param ground_truth: Ground truth as returned by ir_system.load_ground_truth_inline()
+    :return: List of query strings
+    """
+    terms = sorted(ground_truth)
+    return terms + [f'{first} {second}' for first, second in itertools.combinations(terms, 2)]
+
+
+def timed(function, *args) -> tuple:
+    """
+    Calls a function and measures the time it takes.
+    :return: Return value of the function and the elapsed time in milliseconds
+    """
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start_time) * 1000
+
+
+def print_table(header: tuple, rows: list[tuple]):
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print('  '.join(str(value).rjust(width) for value, width in zip(row, widths)))
+
+
+def overlap(results: list[tuple], exact_results: list[tuple]) -> float:
+    """
+    Fraction of the exact top-k documents that a result list contains.
+    :param results: List of (score, row) tuples
+    :param exact_results: List of (score, row) tuples of the exact search
+    """
+    exact_rows = {row for _, row in exact_results}
+    return len(exact_rows & {row for _, row in results}) / len(exact_rows) if exact_rows else 1.0
+
+
+def champion_list_report(irs, queries: list[str], champion_list_sizes=CHAMPION_LIST_SIZES):
+    """
+    Compares the tiered index of the Vector Space Model for several champion list sizes r with exact top-k search
+    (Block-Max WAND) on the stopword-filtered collection: overlap of the top-k documents, tiers read and latency.
+    :param irs: The information retrieval system
+    :param queries: Query strings
+    :param champion_list_sizes: Values of r to compare
+    """
+    model = models.VectorSpaceModel()
+    matrix = irs.tfidf_matrix(indexing.VIEW_FILTERED)
+    k = irs.output_k
+    query_representations = [model.query_to_representation(query) for query in queries]
+
+    exact_results, exact_time = [], 0.0
+    for query_representation in query_representations:
+        (results, _), elapsed_time = timed(ranking.wand, model.query_postings(matrix, query_representation), k)
+        exact_results.append(results)
+        exact_time += elapsed_time
+
+    rows = [('exact', '1.000', '-', f'{exact_time / len(queries):.3f}')]
+    ranking.tiered(model.query_tiers(matrix, query_representations[0], 1), k)  # Warm-up, not measured.
+    for champion_list_size in champion_list_sizes:
+        total_overlap, total_tiers, total_time = 0.0, 0, 0.0
+        for query_representation, exact in zip(query_representations, exact_results):
+            (results, read_tiers), elapsed_time = timed(
+                ranking.tiered, model.query_tiers(matrix, query_representation, champion_list_size), k)
+            total_overlap += overlap(results, exact)
+            total_tiers += read_tiers
+            total_time += elapsed_time
+        rows.append((champion_list_size, f'{total_overlap / len(queries):.3f}', f'{total_tiers / len(queries):.2f}',
+                     f'{total_time / len(queries):.3f}'))
+    print(f'Tiered index vs. exact top-{k} search ({len(queries)} queries, averages per query):')
+    print_table(('r', f'overlap@{k}', 'tiers read', 'time [ms]'), rows)
+
+
+def mean(values: list[float]) -> float:
+    """
+    Mean of the defined values; precision and recall are -1 when they are undefined for a query.
+    """
+    values = [value for value in values if value >= 0]
+    return sum(values) / len(values) if values else -1.0
+
+
+def pruning_report(irs, queries: list[str], budgets=PRUNING_BUDGETS, methods=(pruning.PRUNING_TERM,
+                                                                             pruning.PRUNING_GLOBAL)):
+    """
+    Compares statically pruned TF-IDF matrices of the stopword-filtered collection with the unpruned matrix: memory
+    of the postings, latency of exact top-k search (Block-Max WAND), overlap with the unpruned top-k documents, and
+    precision and recall against the ground truth.
+    :param irs: The information retrieval system
+    :param queries: Query strings
+    :param budgets: Fractions of the postings to keep
+    :param methods: Pruning methods to compare (see pruning.py)
+    """
+    model = models.VectorSpaceModel()
+    statistics = irs.statistics[indexing.VIEW_FILTERED]
+    k = irs.output_k
+    query_representations = [model.query_to_representation(query) for query in queries]
+
+    def evaluate(matrix) -> tuple:
+        all_results, total_time = [], 0.0
+        ranking.wand(model.query_postings(matrix, query_representations[0]), k)  # Warm-up, not measured.
+        for query_representation in query_representations:
+            (results, _), elapsed_time = timed(ranking.wand, model.query_postings(matrix, query_representation), k)
+            all_results.append(results)
+            total_time += elapsed_time
+        return all_results, total_time / len(queries)
+
+    def quality(all_results: list) -> tuple:
+        result_lists = [[(score, int(statistics.document_ids[row])) for score, row in results]
+                        for results in all_results]
+        return (mean([irs.calculate_precision(query, results) for query, results in zip(queries, result_lists)]),
+                mean([irs.calculate_recall(query, results) for query, results in zip(queries, result_lists)]))
+
+    full_matrix = pruning.PrunedTfIdfMatrix(statistics, 1.0)
+    full_results, full_time = evaluate(full_matrix)
+    full_precision, full_recall = quality(full_results)
+    rows = [('-', '1.00', full_matrix.posting_count, f'{full_matrix.nbytes / 1024:.1f}', '-', f'{full_time:.3f}',
+             '-', '1.000', f'{full_precision:.3f}', f'{full_recall:.3f}')]
+    for method in methods:
+        for budget in budgets:
+            matrix = pruning.PrunedTfIdfMatrix(statistics, budget, method)
+            all_results, elapsed_time = evaluate(matrix)
+            precision, recall = quality(all_results)
+            rows.append((method, f'{budget:.2f}', matrix.posting_count, f'{matrix.nbytes / 1024:.1f}',
+                         f'{1 - matrix.nbytes / full_matrix.nbytes:.1%}', f'{elapsed_time:.3f}',
+                         f'{1 - elapsed_time / full_time:.1%}',
+                         f'{mean([overlap(results, full) for results, full in zip(all_results, full_results)]):.3f}',
+                         f'{precision - full_precision:+.3f}', f'{recall - full_recall:+.3f}'))
+    print(f'Static pruning vs. the unpruned index ({len(queries)} queries, top-{k}, averages per query):')
+    print('(First row: unpruned index with absolute precision and recall; other rows: changes.)')
+    print_table(('method', 'budget', 'postings', 'memory [KiB]', 'saved', 'time [ms]', 'faster', f'overlap@{k}',
+                 'precision', 'recall'), rows)
+
+
+def cluster_report(irs, queries: list[str]):
+    """
+    Benchmarks cluster-based search against exhaustive scoring with the Vector Space Model on the stopword-filtered
+    collection: latency and recall of the exact top-k documents (overlap) for increasing numbers of probed clusters.
+    :param irs: The information retrieval system
+    :param queries: Query strings
+    """
+    model = models.VectorSpaceModel()
+    statistics = irs.statistics[indexing.VIEW_FILTERED]
+    cluster_index = irs.cluster_indexes[indexing.VIEW_FILTERED]
+    matrix = tfidf.TfIdfMatrix(statistics)
+    k = irs.output_k
+    query_representations = [model.query_to_representation(query) for query in queries]
+
+    def exhaustive_top_k(batch: list) -> list[list[tuple]]:
+        # All queries are scored as one batch, with one sparse matrix-matrix product.
+        batch_scores = model.match_batch(matrix, batch) * statistics.live[:, None]
+        results = []
+        for scores in batch_scores.T:
+            top = np.argsort(-scores, kind='stable')[:k]
+            results.append([(float(scores[row]), int(row)) for row in top.tolist() if scores[row] > 0])
+        return results
+
+    exhaustive_top_k(query_representations[:1])  # Warm-up, not measured.
+    exact_results, exact_time = timed(exhaustive_top_k, query_representations)
+
+    cluster_count = len(cluster_index.centroids)
+    rows = [('exhaustive', statistics.document_count, '1.000', f'{exact_time / len(queries):.3f}')]
+    probe_counts = sorted({min(2 ** exponent, cluster_count) for exponent in range(cluster_count.bit_length() + 1)})
+    for probes in probe_counts:
+        total_overlap, total_documents, total_time = 0.0, 0, 0.0
+        for query_representation, exact in zip(query_representations, exact_results):
+            (results, probed_documents), elapsed_time = timed(
+                cluster_index.search, dict(model.query_term_weights(matrix, query_representation)), k, probes)
+            total_overlap += overlap(results, exact)
+            total_documents += probed_documents
+            total_time += elapsed_time
+        rows.append((probes, f'{total_documents / len(queries):.1f}', f'{total_overlap / len(queries):.3f}',
+                     f'{total_time / len(queries):.3f}'))
+    print(f'Cluster-based search with {cluster_count} clusters vs. exhaustive scoring ({len(queries)} queries, '
+          f'averages per query):')
+    print_table(('probes', 'documents', f'recall@{k}', 'time [ms]'), rows)
+
+
+def signature_report(irs, queries: list[str], scales=SIGNATURE_SCALES):
+    """
+    Compares the bit-sliced organization of the signature file with the sequential one on the stopword-filtered
+    collection, repeated to reach larger collection sizes: memory and query latency of both, and whether they return
+    the same documents. Latencies are measured for the block level alone (every block signature is matched against
+    the query terms) and for the two-level search (document signatures first, then the blocks of the candidates).
+    :param irs: The information retrieval system
+    :param queries: Query strings
+    :param scales: Collection sizes as multiples of the collection
+    """
+    model = models.SignatureBasedBooleanModel()
+    term_lists = irs.collection.term_arrays('filtered_term_ids')
+    query_representations = [model.query_to_representation(query_compiler.compile_query(query)) for query in queries]
+    trees = [query_representation.tree for query_representation in query_representations]
+    query_signatures = [[model.hash_function(term) for term in query_representation.terms]
+                        for query_representation in query_representations]
+
+    def match_blocks(signature_file, signatures_of_query: list[int]) -> list[np.ndarray]:
+        return [signature_file.contains(signatures.LEVEL_BLOCKS, signature) for signature in signatures_of_query]
+
+    def evaluate(signature_file, function, arguments: list) -> tuple:
+        all_results, total_time = [], 0.0
+        function(signature_file, arguments[0])  # Warm-up, not measured.
+        for argument in arguments:
+            results, elapsed_time = timed(function, signature_file, argument)
+            all_results.append(results)
+            total_time += elapsed_time
+        return all_results, total_time / len(queries)
+
+    rows = []
+    for scale in scales:
+        sequential_file = signatures.SignatureFile.build(term_lists * scale, model.hash_function, model.D, model.F,
+                                                         model.document_F)
+        bit_sliced_file = signatures.BitSlicedSignatureFile.transpose(sequential_file)
+        row = [sequential_file.document_count, len(sequential_file.block_documents),
+               f'{sequential_file.nbytes / 1024:.1f}', f'{bit_sliced_file.nbytes / 1024:.1f}']
+        same = True
+        for function, arguments in ((match_blocks, query_signatures), (model.evaluate, trees)):
+            sequential_results, sequential_time = evaluate(sequential_file, function, arguments)
+            bit_sliced_results, bit_sliced_time = evaluate(bit_sliced_file, function, arguments)
+            same = same and all(np.array_equal(np.asarray(first), np.asarray(second))
+                                for first, second in zip(sequential_results, bit_sliced_results))
+            row += [f'{sequential_time:.3f}', f'{bit_sliced_time:.3f}', f'{sequential_time / bit_sliced_time:.1f}x']
+        rows.append(tuple(row + ['yes' if same else 'no']))
+    print(f'Bit-sliced vs. sequential signature files (F={model.F}, m={model.m}, D={model.D}, document '
+          f'F={model.document_F}, document m={model.document_m}, {len(queries)} queries, averages per query):')
+    print_table(('documents', 'blocks', 'sequential [KiB]', 'bit-sliced [KiB]', 'blocks: sequential [ms]',
+                 'bit-sliced [ms]', 'speed-up', 'two-level: sequential [ms]', 'bit-sliced [ms]', 'speed-up',
+                 'same results'), rows)
+
+
+def signature_tuning_report(irs, column: str, queries: list[str], current: dict,
+                            target: float = signatures.TARGET_FALSE_DROP_RATE,
+                            random_query_count: int = RANDOM_QUERY_COUNT, seed: int = 0) -> dict:
+    """
+    Tunes the parameters of the signature file of a term column (see signatures.tune()) and validates them: the ground
+    truth terms and random terms of the collection are replayed on the signature files of the current and of the
+    tuned parameters, and the measured false-drop rates are compared with the expected ones. The target is a false-drop
+    budget: the tuned parameters may stay far below it when a higher false-drop rate saves less scanning than the
+    verification of the false drops costs (see signatures.FALSE_DROP_COST).
+    :param irs: The information retrieval system
+    :param column: Document term column (see ir_system.signature_column())
+    :param queries: Ground truth terms
+    :param current: Parameters in use (see signatures.PARAMETERS)
+    :param target: False-drop budget, the highest acceptable false-drop rate
+    :param random_query_count: Number of random terms
+    :param seed: Seed of the random terms
+    :return: The tuned parameters
+    """
+    model = models.SignatureBasedBooleanModel()
+    term_lists = irs.collection.term_arrays(column)
+    term_sets = [set(terms) for terms in term_lists]
+    lengths, distinct_counts = [len(terms) for terms in term_lists], [len(terms) for terms in term_sets]
+    tuned = signatures.tune(lengths, distinct_counts, target)
+
+    stemming = column == 'stemmed_term_ids'
+    ground_truth_terms = sorted({term for query in queries for term in
+                                 model.query_to_representation(query_compiler.compile_query(query, stemming)).terms
+                                 if term != term_dictionary.UNKNOWN_TERM})
+    vocabulary = sorted(set().union(*term_sets))
+    random_terms = np.random.RandomState(seed).choice(vocabulary, min(random_query_count, len(vocabulary)),
+                                                      replace=False).tolist() if vocabulary else []
+
+    def false_drop_rate(signature_file, terms: list[int]) -> tuple:
+        false_drops, non_matching, total_time = 0, 0, 0.0
+        for term in terms:
+            matches, elapsed_time = timed(signature_file.matching_documents,
+                                          model.hash_function(term, signatures.LEVEL_DOCUMENTS),
+                                          model.hash_function(term))
+            contained = np.array([term in terms_of_document for terms_of_document in term_sets], dtype=bool)
+            false_drops += int((matches & ~contained).sum())
+            non_matching += int((~contained).sum())
+            total_time += elapsed_time
+        return false_drops / non_matching if non_matching else 0.0, total_time / len(terms) if terms else 0.0
+
+    rows = []
+    for label, parameters in (('current', current), ('tuned', tuned)):
+        model.configure(parameters)
+        signature_file = model.signature_file(term_lists)
+        expected_rate, scanned_words, _ = signatures.expected_costs(parameters, lengths, distinct_counts)
+        ground_truth_rate, _ = false_drop_rate(signature_file, ground_truth_terms)
+        random_rate, random_time = false_drop_rate(signature_file, random_terms)
+        rows.append((label, *(parameters[name] for name in signatures.PARAMETERS),
+                     f'{signature_file.nbytes / 1024:.1f}', f'{scanned_words:.2f}',
+                     f'{scanned_words + signatures.FALSE_DROP_COST * expected_rate:.2f}', f'{expected_rate:.5f}',
+                     f'{ground_truth_rate:.5f}', f'{random_rate:.5f}', f'{random_time:.3f}'))
+    print(f'Signature parameters for {column} (false-drop budget {target}, a false drop costs '
+          f'{signatures.FALSE_DROP_COST} words, {len(ground_truth_terms)} ground truth terms, {len(random_terms)} '
+          f'random terms):')
+    print_table(('parameters', *signatures.PARAMETERS, 'size [KiB]', 'words read', 'expected cost', 'expected FD',
+                 'ground truth FD', 'random FD', 'ms per term'), rows)
+    return tuned
@@ -0,0 +1,396 @@
+# Contains the term signatures and the signature files that the signature-based Boolean model searches.
+import hashlib
+import math
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# Bits per machine word of a packed signature.
+WORD_BITS = 64
+WORD_MASK = (1 << WORD_BITS) - 1
+# Words per cache line: signatures are read from memory in whole cache lines of 64 bytes.
+CACHE_LINE_WORDS = 8
+# Maximum number of term signatures kept in the cache that indexing and querying share.
+SIGNATURE_CACHE_SIZE = 1 << 16
+# Personalization of the BLAKE2b hashes of term signatures; changing it changes all signatures.
+SIGNATURE_HASH_PERSON = b'term-signature'
+# Organizations of a signature file: one signature per block after another, or one bitmap per bit position.
+ORGANIZATION_SEQUENTIAL, ORGANIZATION_BIT_SLICED = 'sequential', 'bit-sliced'
+# Levels of a signature file: one superimposed signature per document, and one per block of a document.
+LEVEL_DOCUMENTS, LEVEL_BLOCKS = 'documents', 'blocks'
+# Parameters of a signature file, as stored with tuned configurations: block size, size and weight of the block
+# signatures, size and weight of the document signatures.
+PARAMETERS = ('D', 'F', 'm', 'document_F', 'document_m')
+# Search space of tune(): block sizes D, and signature sizes in whole words per level.
+TUNING_BLOCK_SIZES = (1, 2, 4, 8, 16, 32)
+TUNING_MAX_WORDS = 16
+TUNING_MAX_DOCUMENT_WORDS = 64
+# Highest weight m that tune() tries below the optimal weight of a signature size.
+TUNING_MAX_WEIGHT = 32
+# Default false-drop budget of tune(): the highest acceptable fraction of the documents without a query term that
+# the signatures still match.
+TARGET_FALSE_DROP_RATE = 0.01
+# Cost of a false drop in signature words read: verifying a document on its terms takes about as long as matching
+# 1,000 to 1,500 words of signatures (measured on the fables collection).
+FALSE_DROP_COST = 1000
+
+
+def word_count(signature_size: int) -> int:
+    """
+    Number of machine words of a packed signature of signature_size (F) bits.
+    """
+    return (signature_size + WORD_BITS - 1) // WORD_BITS
+
+
+@lru_cache(maxsize=SIGNATURE_CACHE_SIZE)
+def term_signature(term_id: int, signature_size: int, weight: int) -> int:
+    """
+    Computes the signature of a term: signature_size (F) bits, of which weight (m) are set. The bit positions are a
+    partial Fisher-Yates shuffle of the F positions, driven by BLAKE2b digests of the term ID. Signatures are the same
+    in every process and on every platform, and no global random state is used, so they can be computed from any
+    thread. Results are cached (bounded, least recently used first).
+    :param term_id: Term ID
+    :param signature_size: Bits F per signature
+    :param weight: Set bits m, at most F
+    :return: The signature, packed into a Python int (bit i is position i)
+    """
+    # Enough digest bits for the shuffle, with 64 bits to spare so that the positions are close to uniform.
+    needed_bits = weight * max(signature_size - 1, 1).bit_length() + 64
+    digests = b''.join(hashlib.blake2b(term_id.to_bytes(8, 'little', signed=True) + counter.to_bytes(4, 'little'),
+                                       person=SIGNATURE_HASH_PERSON).digest()
+                       for counter in range((needed_bits + 511) // 512))
+    randomness = int.from_bytes(digests, 'little')
+    positions = list(range(signature_size))
+    signature = 0
+    for i in range(weight):
+        randomness, offset = divmod(randomness, signature_size - i)
+        positions[i], positions[i + offset] = positions[i + offset], positions[i]
+        signature |= 1 << positions[i]
+    return signature
+
+
+def to_words(signature: int, signature_size: int) -> np.ndarray:
+    """
+    Splits a signature that is packed into a Python int into uint64 words (least significant word first).
+    """
+    return np.array([(signature >> (WORD_BITS * word)) & WORD_MASK for word in range(word_count(signature_size))],
+                    dtype=np.uint64)
+
+
+def document_block_starts(block_documents: np.ndarray, document_count: int) -> np.ndarray:
+    """
+    Computes the index of the first block of every document from the document of every block.
+    :return: Array of document_count + 1 offsets; the blocks of document i are starts[i] ... starts[i + 1] - 1
+    """
+    return np.r_[0, np.cumsum(np.bincount(block_documents, minlength=document_count))]
+
+
+def transpose(matrix: np.ndarray, signature_size: int) -> np.ndarray:
+    """
+    Transposes packed signatures of shape (rows, words) into packed slices of shape (F, ceil(rows / 64)), where bit r
+    of slice i is bit i of the signature of row r.
+    """
+    row_count, words = matrix.shape
+    bits = np.unpackbits(matrix.astype('<u8').view(np.uint8).reshape(row_count, words * 8),
+                         axis=1, bitorder='little')[:, :signature_size]
+    slice_bytes = np.packbits(bits.T, axis=1, bitorder='little')
+    padded = np.zeros((signature_size, word_count(row_count) * 8), dtype=np.uint8)
+    padded[:, :slice_bytes.shape[1]] = slice_bytes
+    return padded.view('<u8').astype(np.uint64)
+
+
+class SignatureFile(object):
+    """
+    Two-level signature file of a collection. Every block of D consecutive terms of a document has one F-bit
+    signature, the bitwise OR (superimposed coding) of the signatures of its terms, and every document has one larger
+    signature of all of its terms. Both levels are packed into uint64 arrays of shape (rows, words). A query term is
+    first matched against the document signatures, and only the blocks of the matching documents are checked with
+    (block & query) == query. Signatures never miss a document that contains a term, but may match documents that do
+    not (false drops).
+    """
+
+    def __init__(self, blocks: np.ndarray, documents: np.ndarray, block_documents: np.ndarray, signature_size: int,
+                 document_signature_size: int):
+        """
+        :param blocks: Packed block signatures, array of shape (blocks, words)
+        :param documents: Packed document signatures, array of shape (documents, document words)
+        :param block_documents: Row (index in the collection) of the document of every block
+        :param signature_size: Bits F per block signature
+        :param document_signature_size: Bits per document signature
+        """
+        self.blocks = blocks
+        self.documents = documents
+        self.block_documents = block_documents
+        self.document_count = len(documents)
+        self.signature_size = signature_size
+        self.document_signature_size = document_signature_size
+        self.block_starts = document_block_starts(block_documents, self.document_count)
+
+    @classmethod
+    def build(cls, term_lists, term_signature, block_size: int, signature_size: int, document_signature_size: int):
+        """
+        Computes the block and document signatures of a collection.
+        :param term_lists: Term ID arrays of the documents
+        :param term_signature: Function that returns the signature of a term ID on a level (LEVEL_DOCUMENTS or
+        LEVEL_BLOCKS) as a Python int
+        :param block_size: Terms D per block
+        :param signature_size: Bits F per block signature
+        :param document_signature_size: Bits per document signature
+        :return: The signature file
+        """
+        lengths = np.array([len(terms) for terms in term_lists], dtype=np.int64)
+        terms = np.concatenate([np.asarray(terms, dtype=np.int64) for terms in term_lists] or
+                               [np.zeros(0, dtype=np.int64)])
+        block_counts = (lengths + block_size - 1) // block_size
+        block_documents = np.repeat(np.arange(len(term_lists)), block_counts)
+        blocks = np.zeros((len(block_documents), word_count(signature_size)), dtype=np.uint64)
+        documents = np.zeros((len(term_lists), word_count(document_signature_size)), dtype=np.uint64)
+        if not len(terms):
+            return cls(blocks, documents, block_documents, signature_size, document_signature_size)
+
+        # Each distinct term is hashed once per level.
+        distinct_terms, inverse = np.unique(terms, return_inverse=True)
+        term_words = np.array([to_words(term_signature(term, LEVEL_BLOCKS), signature_size)
+                               for term in distinct_terms.tolist()], dtype=np.uint64)
+        document_term_words = np.array([to_words(term_signature(term, LEVEL_DOCUMENTS), document_signature_size)
+                                        for term in distinct_terms.tolist()], dtype=np.uint64)
+        # Position of every term within its document, and the first term position of every block.
+        document_starts = np.cumsum(lengths) - lengths
+        offsets = np.arange(len(terms)) - np.repeat(document_starts, lengths)
+        blocks = np.bitwise_or.reduceat(term_words[inverse], np.flatnonzero(offsets % block_size == 0), axis=0)
+        documents_with_terms = np.flatnonzero(lengths)
+        documents[documents_with_terms] = np.bitwise_or.reduceat(document_term_words[inverse],
+                                                                 document_starts[documents_with_terms], axis=0)
+        return cls(blocks, documents, block_documents, signature_size, document_signature_size)
+
+    @property
+    def nbytes(self) -> int:
+        return self.blocks.nbytes + self.documents.nbytes
+
+    def contains(self, level: str, signature: int, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Checks which signatures of a level contain all bits of a signature.
+        :param level: LEVEL_DOCUMENTS or LEVEL_BLOCKS
+        :param signature: Packed query signature
+        :param rows: Sorted indexes of the documents or blocks to check, all by default
+        :return: Boolean array over the checked rows
+        """
+        matrix = self.documents if level == LEVEL_DOCUMENTS else self.blocks
+        query_words = to_words(signature, self.signature_size if level == LEVEL_BLOCKS else
+                               self.document_signature_size)
+        result = np.ones(len(matrix) if rows is None else len(rows), dtype=bool)
+        # Only the words in which the query signature has bits are compared.
+        for word in np.flatnonzero(query_words).tolist():
+            column = matrix[:, word] if rows is None else matrix[rows, word]
+            result &= (column & query_words[word]) == query_words[word]
+        return result
+
+    def matching_documents(self, document_signature: int, signature: int, counters: dict = None) -> np.ndarray:
+        """
+        Finds the documents with at least one block whose signature contains all bits of a term's signature. Blocks
+        are only checked for documents whose document signature contains the term's document-level signature.
+        :param document_signature: Packed document-level signature of the query term
+        :param signature: Packed block-level signature of the query term
+        :param counters: Dictionary in which the candidates and the time of both levels are added up, if given
+        :return: Boolean array over the documents
+        """
+        start_time = time.perf_counter()
+        candidates = np.flatnonzero(self.contains(LEVEL_DOCUMENTS, document_signature))
+        document_time = time.perf_counter()
+        # Indexes of all blocks of the candidates.
+        block_counts = self.block_starts[candidates + 1] - self.block_starts[candidates]
+        block_offsets = np.cumsum(block_counts) - block_counts
+        candidate_blocks = (np.arange(block_counts.sum()) - np.repeat(block_offsets, block_counts) +
+                            np.repeat(self.block_starts[candidates], block_counts))
+        matches = np.zeros(self.document_count, dtype=bool)
+        matches[self.block_documents[candidate_blocks[self.contains(LEVEL_BLOCKS, signature, candidate_blocks)]]] = True
+        if counters is not None:
+            for name, value in (('document_candidates', len(candidates)), ('block_candidates', int(matches.sum())),
+                                ('document_time', document_time - start_time),
+                                ('block_time', time.perf_counter() - document_time)):
+                counters[name] = counters.get(name, 0) + value
+        return matches
+
+
+class BitSlicedSignatureFile(SignatureFile):
+    """
+    Bit-sliced organization of a signature file (Roberts; Faloutsos): the matrices of document and block signatures
+    are transposed, so that every one of the F bit positions has a slice per level, a bitmap over all documents or
+    blocks packed into uint64 words. A query signature with m set bits is matched by ANDing only its m slices instead
+    of reading every signature; on the block level, only the words that hold blocks of candidate documents are read.
+    """
+
+    def __init__(self, slices: np.ndarray, document_slices: np.ndarray, block_documents: np.ndarray,
+                 document_count: int, signature_size: int, document_signature_size: int):
+        """
+        :param slices: Packed block slices, array of shape (F, words), where bit b of a slice belongs to block b
+        :param document_slices: Packed document slices, array of shape (document signature bits, words)
+        :param block_documents: Row (index in the collection) of the document of every block
+        :param document_count: Number of documents
+        :param signature_size: Bits F per block signature
+        :param document_signature_size: Bits per document signature
+        """
+        self.slices = slices
+        self.document_slices = document_slices
+        self.block_documents = block_documents
+        self.document_count = document_count
+        self.signature_size = signature_size
+        self.document_signature_size = document_signature_size
+        self.block_starts = document_block_starts(block_documents, document_count)
+
+    @classmethod
+    def build(cls, term_lists, term_signature, block_size: int, signature_size: int, document_signature_size: int):
+        return cls.transpose(SignatureFile.build(term_lists, term_signature, block_size, signature_size,
+                                                 document_signature_size))
+
+    @classmethod
+    def transpose(cls, signature_file: SignatureFile):
+        """
+        Converts a block-sequential signature file into the bit-sliced organization.
+        """
+        return cls(transpose(signature_file.blocks, signature_file.signature_size),
+                   transpose(signature_file.documents, signature_file.document_signature_size),
+                   signature_file.block_documents, signature_file.document_count, signature_file.signature_size,
+                   signature_file.document_signature_size)
+
+    @property
+    def nbytes(self) -> int:
+        return self.slices.nbytes + self.document_slices.nbytes
+
+    def contains(self, level: str, signature: int, rows: np.ndarray = None) -> np.ndarray:
+        slices = self.document_slices if level == LEVEL_DOCUMENTS else self.slices
+        positions = [position for position in range(len(slices)) if signature >> position & 1]
+        if rows is None:
+            row_count = self.document_count if level == LEVEL_DOCUMENTS else len(self.block_documents)
+            if positions:
+                bitmap = np.bitwise_and.reduce(slices[positions], axis=0)
+            else:
+                bitmap = np.full(slices.shape[1], WORD_MASK, dtype=np.uint64)
+            return np.unpackbits(bitmap.astype('<u8').view(np.uint8), bitorder='little')[:row_count].view(bool)
+        if not positions or not len(rows):
+            return np.ones(len(rows), dtype=bool)
+        # Only the range of words that holds the checked rows (sorted) is read from the slices.
+        first_word, end_word = rows[0] // WORD_BITS, rows[-1] // WORD_BITS + 1
+        bitmap = np.bitwise_and.reduce(slices[positions, first_word:end_word], axis=0)
+        bits = np.unpackbits(bitmap.astype('<u8').view(np.uint8), bitorder='little').view(bool)
+        return bits[rows - first_word * WORD_BITS]
+
+
+def optimal_weight(signature_size: int, term_count: float) -> int:
+    """
+    Signature weight m that minimizes the false-drop probability of signatures with term_count superimposed terms:
+    F ln 2 / D, which sets about half of the bits.
+    """
+    return int(min(max(round(signature_size * math.log(2) / max(term_count, 1)), 1), signature_size))
+
+
+def false_drop_probability(signature_size: int, weight: int, term_count):
+    """
+    Probability that a signature of term_count superimposed terms contains all m bits of a term that it does not
+    hold: (1 - (1 - m / F)^D)^m (Faloutsos & Christodoulakis). Works on arrays of term counts.
+    """
+    return (1 - (1 - weight / signature_size) ** np.asarray(term_count, dtype=float)) ** weight
+
+
+def words_read(signature_size: int, weight: int) -> float:
+    """
+    Expected number of words of a signature that are read to match a query term: the words of the cache lines in
+    which the m bits of the query signature fall.
+    """
+    words = word_count(signature_size)
+    lines = -(-words // CACHE_LINE_WORDS)
+    return min(words, CACHE_LINE_WORDS * lines * (1 - (1 - 1 / lines) ** weight))
+
+
+def expected_costs(parameters: dict, lengths, distinct_counts, weights=None) -> tuple:
+    """
+    Estimates the false-drop rate and the scan cost of a two-level signature file for a query term, assuming that
+    the blocks hold D distinct terms and that both levels fail independently.
+    :param parameters: Dictionary with the PARAMETERS
+    :param lengths: Number of terms of every document
+    :param distinct_counts: Number of distinct terms of every document
+    :param weights: Number of documents of every entry, 1 by default
+    :return: Fraction of the documents without the term that both levels match, words read per document, and words
+    stored per document
+    """
+    lengths, distinct_counts = np.asarray(lengths, dtype=float), np.asarray(distinct_counts, dtype=float)
+    weights = np.ones(len(lengths)) if weights is None else np.asarray(weights, dtype=float)
+    block_size, signature_size, weight = parameters['D'], parameters['F'], parameters['m']
+    block_counts = np.ceil(lengths / block_size)
+    block_false_drops = 1 - (1 - false_drop_probability(signature_size, weight, np.minimum(lengths, block_size))) ** \
+        block_counts
+    document_false_drops = false_drop_probability(parameters['document_F'], parameters['document_m'], distinct_counts)
+    total = max(weights.sum(), 1)
+    false_drop_rate = (weights * document_false_drops * block_false_drops).sum() / total
+    scanned_words = words_read(parameters['document_F'], parameters['document_m']) + \
+        (weights * document_false_drops * block_counts).sum() / total * words_read(signature_size, weight)
+    stored_words = word_count(parameters['document_F']) + \
+        (weights * block_counts).sum() / total * word_count(signature_size)
+    return false_drop_rate, scanned_words, stored_words
+
+
+def candidate_weights(signature_size: int, term_count: float) -> list[int]:
+    """
+    Weights that tune() tries for a signature size: the optimal weight (see optimal_weight()) and all lower ones up
+    to TUNING_MAX_WEIGHT, which read fewer words at a higher false-drop probability.
+    """
+    weight = optimal_weight(signature_size, term_count)
+    return sorted(set(range(1, min(weight, TUNING_MAX_WEIGHT) + 1)) | {weight})
+
+
+def tune(lengths, distinct_counts, target: float = TARGET_FALSE_DROP_RATE) -> dict:
+    """
+    Chooses the parameters of a two-level signature file analytically from the document lengths of a collection.
+    Every block size D, signature size F (whole words) and weight m (see candidate_weights()) is combined with every
+    document signature size and weight. The target is a budget, not a goal: among the combinations whose expected
+    false-drop rate (see expected_costs()) is within it, the one with the lowest cost per query term and document
+    wins, i.e. the signature words read plus FALSE_DROP_COST words for every expected false drop, then the smallest
+    one. If no combination is within the budget, the one with the lowest false-drop rate wins.
+    :param lengths: Number of terms of every document
+    :param distinct_counts: Number of distinct terms of every document
+    :param target: False-drop budget, the highest acceptable fraction of the documents without a query term that the
+    signatures match
+    :return: Dictionary with the PARAMETERS
+    """
+    # Documents with the same length and number of distinct terms have the same costs.
+    documents, weights = np.unique(np.column_stack([np.asarray(lengths, dtype=np.int64),
+                                                    np.asarray(distinct_counts, dtype=np.int64)]).reshape(-1, 2),
+                                   axis=0, return_counts=True)
+    lengths, distinct_counts = documents[:, 0], documents[:, 1]
+    weights = weights / max(weights.sum(), 1)
+    mean_distinct_count = (weights * distinct_counts).sum()
+
+    # The costs of expected_costs() for all combinations at once: one row per block level configuration, one column
+    # per document level configuration.
+    block_levels = [(block_size, signature_size, weight) for block_size in TUNING_BLOCK_SIZES
+                    for signature_size in range(WORD_BITS, TUNING_MAX_WORDS * WORD_BITS + 1, WORD_BITS)
+                    for weight in candidate_weights(signature_size, block_size)]
+    document_levels = [(signature_size, weight)
+                       for signature_size in range(WORD_BITS, TUNING_MAX_DOCUMENT_WORDS * WORD_BITS + 1, WORD_BITS)
+                       for weight in candidate_weights(signature_size, mean_distinct_count)]
+    block_counts = np.array([np.ceil(lengths / block_size) for block_size, _, _ in block_levels])
+    block_false_drops = 1 - (1 - np.array([false_drop_probability(signature_size, weight,
+                                                                  np.minimum(lengths, block_size))
+                                           for block_size, signature_size, weight in block_levels])) ** block_counts
+    document_false_drops = np.array([false_drop_probability(signature_size, weight, distinct_counts)
+                                     for signature_size, weight in document_levels])
+    false_drop_rates = (block_false_drops * weights) @ document_false_drops.T
+    block_words = np.array([words_read(signature_size, weight) for _, signature_size, weight in block_levels])
+    scanned_words = (block_words[:, None] * ((block_counts * weights) @ document_false_drops.T) +
+                     np.array([words_read(signature_size, weight) for signature_size, weight in document_levels]))
+    stored_words = (np.array([word_count(signature_size) for _, signature_size, _ in block_levels]) *
+                    (block_counts * weights).sum(axis=1))[:, None] + \
+        np.array([word_count(signature_size) for signature_size, _ in document_levels])
+
+    within_budget = false_drop_rates <= target
+    if within_budget.any():
+        costs = np.where(within_budget, scanned_words + FALSE_DROP_COST * false_drop_rates, np.inf)
+        best = np.lexsort((stored_words.ravel(), costs.ravel()))[0]
+    else:
+        best = np.argmin(false_drop_rates)
+    block_level, document_level = np.unravel_index(best, false_drop_rates.shape)
+    (block_size, signature_size, weight), (document_signature_size, document_weight) = \
+        block_levels[block_level], document_levels[document_level]
+    return {'D': block_size, 'F': signature_size, 'm': weight, 'document_F': document_signature_size,
+            'document_m': document_weight}
@@ -0,0 +1,129 @@
+# Contains the global term dictionary that maps every term of the vocabulary to a dense integer ID. Documents, indexes
+# and retrieval models work with term IDs instead of strings.
+from array import array
+
+UNKNOWN_TERM = -1  # ID of query terms that do not occur in the vocabulary.
+
+
+class TermDictionary(object):
+    def __init__(self):
+        self.ids = {}  # Maps terms to their IDs.
+        self.terms = []  # Maps IDs to their terms.
+        self._saved_count = 0  # Number of terms that were already written to the vocabulary file.
+
+    def __len__(self):
+        return len(self.terms)
+
+    def add(self, term: str) -> int:
+        """
+        Returns the ID of a term, assigning the next free ID if the term is new.
+        """
+        term_id = self.ids.get(term)
+        if term_id is None:
+            term_id = len(self.terms)
+            self.ids[term] = term_id
+            self.terms.append(term)
+        return term_id
+
+    def lookup(self, term: str) -> int:
+        """
+        Returns the ID of a term without adding it, or UNKNOWN_TERM.
+        """
+        return self.ids.get(term, UNKNOWN_TERM)
+
+    def encode(self, terms: list[str]) -> array:
+        """
+        Converts a term sequence into an array of term IDs, adding new terms to the dictionary.
+        """
+        return array('I', [self.add(term) for term in terms])
+
+    def decode(self, term_ids) -> list[str]:
+        """
+        Converts a sequence of term IDs back into terms.
+        """
+        return [self.terms[term_id] for term_id in term_ids]
+
+    def load(self, file_path: str) -> None:
+        """
+        Loads the vocabulary from a text file with one term per line; the line number is the term ID. Terms that are
+        already in the dictionary keep their IDs, so the dictionary must be empty or a prefix of the file.
+        :param file_path: Path of the vocabulary file
+        """
+        try:
+            with open(file_path, 'r', encoding='utf-8') as vocabulary_file:
+                terms = vocabulary_file.read().split('\n')[:-1]
+        except FileNotFoundError:
+            return
+        if terms[:len(self.terms)] != self.terms:
+            raise ValueError(f'{file_path} does not continue the loaded vocabulary.')
+        for term in terms[len(self.terms):]:
+            self.add(term)
+        self._saved_count = len(terms)
+
+    def save(self, file_path: str) -> None:
+        """
+        Writes the whole vocabulary to a text file with one term per line.
+        :param file_path: Path of the vocabulary file
+        """
+        with open(file_path, 'w', encoding='utf-8') as vocabulary_file:
+            vocabulary_file.write(''.join(term + '\n' for term in self.terms))
+        self._saved_count = len(self.terms)
+
+    def append(self, file_path: str) -> None:
+        """
+        Appends the terms that were added since the last load or save to the vocabulary file, so that only the changes
+        are written.
+        :param file_path: Path of the vocabulary file
+        """
+        if self._saved_count < len(self.terms):
+            with open(file_path, 'a', encoding='utf-8') as vocabulary_file:
+                vocabulary_file.write(''.join(term + '\n' for term in self.terms[self._saved_count:]))
+            self._saved_count = len(self.terms)
+
+
+def bind_operand(operand, dictionary: TermDictionary):
+    """
+    Replaces the terms of a query operand (term, phrase or proximity expression) by their term IDs.
+    """
+    if isinstance(operand, str):
+        return dictionary.lookup(operand)
+    if operand[0] == 'phrase':
+        return 'phrase', tuple(dictionary.lookup(term) for term in operand[1])
+    return 'near', operand[1], bind_operand(operand[2], dictionary), bind_operand(operand[3], dictionary)
+
+
+def bind_tree(tree: tuple, dictionary: TermDictionary) -> tuple:
+    """
+    Replaces all terms of a query tree (see query_compiler.CompiledQuery) by their term IDs.
+    """
+    if tree[0] == 'term':
+        return 'term', bind_operand(tree[1], dictionary)
+    if tree[0] == 'not':
+        return 'not', bind_tree(tree[1], dictionary)
+    return tree[0], tuple(bind_tree(child, dictionary) for child in tree[1])
+
+
+def is_bound(query) -> bool:
+    """
+    Checks whether a compiled query is in term ID space (see bind_query()).
+    """
+    return not all(isinstance(term, str) for term in query.terms)
+
+
+def bind_query(query, dictionary: TermDictionary = None):
+    """
+    Converts a compiled query into term ID space: tree and term list refer to term IDs instead of strings. Queries that
+    are already bound are returned unchanged.
+    :param query: The compiled query
+    :param dictionary: Term dictionary to use, the global DICTIONARY by default
+    :return: Compiled query in term ID space
+    """
+    if is_bound(query):
+        return query
+    dictionary = DICTIONARY if dictionary is None else dictionary
+    return query._replace(tree=bind_tree(query.tree, dictionary),
+                          terms=tuple(dictionary.lookup(term) for term in query.terms))
+
+
+# The term dictionary shared by all documents.
+DICTIONARY = TermDictionary()
@@ -0,0 +1,578 @@
+# Contains consistency checks of the indexes and search algorithms on the fables collection. Run with python -m pytest.
+import bisect
+import functools
+import operator
+import os
+import random
+import shutil
+
+import numpy as np
+import pytest
+
+import bm25
+import catalog
+import cleanup
+import clustering
+import document_store
+import extraction
+import indexing
+import ir_system
+import lsi
+import minhash
+import models
+import porter
+import postings
+import pruning
+import query_compiler
+import ranking
+import reports
+import signatures
+import term_dictionary
+import tfidf
+
+RAW_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'raw_data')
+RAW_COLLECTION_PATH = os.path.join(RAW_DATA_PATH, 'aesopa10.txt')
+
+
+@pytest.fixture(scope='module')
+def collection():
+    """
+    The fables, with stopword-filtered and stemmed terms.
+    """
+    documents = extraction.extract_collection(RAW_COLLECTION_PATH)
+    cleanup.filter_collection(documents)
+    porter.stem_all_documents(documents)
+    return document_store.DocumentStore(documents)
+
+
+@pytest.fixture(scope='module')
+def inverted_index(collection, tmp_path_factory):
+    index = indexing.SegmentedIndex(str(tmp_path_factory.mktemp('index')))
+    index.rebuild(collection)
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def irs(collection, tmp_path, monkeypatch):
+    """
+    An information retrieval system with the fables, working in a temporary directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    shutil.copytree(RAW_DATA_PATH, ir_system.RAW_DATA_PATH)
+    system = ir_system.InformationRetrievalSystem()
+    system.collection.close()
+    system.collection = document_store.DocumentStore(collection)
+    extraction.save_collection_as_binary(system.collection, ir_system.COLLECTION_PATH)
+    system.build_inverted_index()
+    yield system
+    system.inverted_index.close()
+    system.collection.close()
+
+
+def boolean_search(system, model, query: str, stemming: bool, stop_word_filtering: bool) -> list:
+    """
+    Searches with a Boolean model the way the menu does and returns the IDs of the matching documents.
+    """
+    system.model = model
+    query = system.compile_query(query, stemming, stop_word_filtering)
+    if isinstance(model, models.InvertedListBooleanModel):
+        results = system.inverted_list_search(query, stemming, stop_word_filtering)
+    elif isinstance(model, models.SignatureBasedBooleanModel):
+        results = system.signature_search(query, stemming, stop_word_filtering)
+    else:
+        results = system.basic_query_search(query, stemming, stop_word_filtering)
+    return sorted(document_id for score, document_id in results if score > 0)
+
+
+def test_boolean_searches_agree_on_phrases_with_stop_words(irs):
+    boolean_models = [models.LinearBooleanModel(), models.InvertedListBooleanModel(),
+                      models.SignatureBasedBooleanModel()]
+    for query in ['"the fox said"', '"the king of the beasts" | -"said the lion"']:
+        for stemming, stop_word_filtering in [(False, True), (True, False), (True, True)]:
+            hits = [boolean_search(irs, model, query, stemming, stop_word_filtering) for model in boolean_models]
+            assert hits[0] and hits[0] == hits[1] == hits[2], (query, stemming, stop_word_filtering)
+
+
+def test_queries_are_compiled_and_bound_once(collection):
+    stop_words = frozenset(cleanup.load_filter_stop_words())
+    query = query_compiler.compile_and_bind('fox & "the lion" & qwertyfable', stop_words=stop_words)
+    assert term_dictionary.is_bound(query) and query.terms[-1] == term_dictionary.UNKNOWN_TERM
+    assert query_compiler.compile_and_bind(' Fox &  "the lion" & qwertyfable', stop_words=stop_words) is query
+    assert query_compiler.compile_and_bind(query) is query
+    # A new term in the vocabulary changes the binding.
+    term_id = term_dictionary.DICTIONARY.add('qwertyfable')
+    assert query_compiler.compile_and_bind(query.text, stop_words=stop_words).terms[-1] == term_id
+
+
+def test_ranked_models_weight_queries_alike(collection):
+    fox, lion = term_dictionary.DICTIONARY.lookup('fox'), term_dictionary.DICTIONARY.lookup('lion')
+    weights = models.VectorSpaceModel().query_to_representation('fox lion fox')
+    assert weights == {fox: 1.0, lion: 0.75}
+    assert models.LSIModel().query_to_representation('fox lion fox') == weights
+
+
+def test_phrase_with_stop_words_matches_filtered_positions(inverted_index):
+    model = models.InvertedListBooleanModel()
+    stop_words = frozenset(cleanup.load_filter_stop_words())
+    view = inverted_index.view(indexing.VIEW_FILTERED)
+
+    def search(query: str) -> list:
+        return model.match(view, query_compiler.compile_query(query, stop_words=stop_words))
+
+    assert search('"the fox said"')
+    assert len(search('"the king of the beasts"')) == 4
+    assert search('"beasts king"') == []
+
+
+@pytest.fixture
+def rng():
+    return random.Random(42)
+
+
+def random_posting_list(rng: random.Random, size: int, universe: int = 1 << 20) -> list[int]:
+    return sorted(rng.sample(range(universe), size))
+
+
+def test_vbyte_round_trip(rng):
+    numbers = [0, 1, 127, 128, 16383, 16384, (1 << 35) + 5] + [rng.randrange(1 << rng.randrange(1, 40))
+                                                              for _ in range(2000)]
+    encoded = postings.encode_vbyte(numbers)
+    assert postings.decode_vbyte(encoded) == numbers
+    assert postings.decode_vbyte(b'xx' + encoded + b'yy', 2, 2 + len(encoded)) == numbers
+    assert postings.encode_vbyte([127]) == bytes([255])
+    assert postings.encode_vbyte([]) == b'' and postings.decode_vbyte(b'') == []
+
+
+def test_gap_codec_round_trip(rng):
+    for size in [0, 1, 2, postings.SKIP_BLOCK_SIZE, postings.SKIP_BLOCK_SIZE + 1, 500]:
+        document_ids = random_posting_list(rng, size)
+        assert postings.decode_postings(postings.encode_postings(document_ids)) == document_ids
+    assert postings.decode_postings(postings.encode_postings([0, 1, 2])) == [0, 1, 2]
+
+
+def test_skip_table_and_cursor(rng):
+    document_ids = random_posting_list(rng, 1000, 50000)
+    encoded = postings.encode_postings(document_ids)
+    last_ids, ends = postings.decode_skips(postings.encode_skips(document_ids))
+    assert last_ids == document_ids[postings.SKIP_BLOCK_SIZE - 1::postings.SKIP_BLOCK_SIZE] + \
+        ([document_ids[-1]] if len(document_ids) % postings.SKIP_BLOCK_SIZE else [])
+    assert ends[-1] == len(encoded)
+    cursor = postings.PostingCursor(encoded, 0, last_ids, ends)
+    for target in sorted(rng.sample(range(52000), 300)):
+        i = bisect.bisect_left(document_ids, target)
+        assert cursor.seek(target) == (document_ids[i] if i < len(document_ids) else None)
+
+
+def test_positions_round_trip(rng):
+    document_ids = random_posting_list(rng, 200)
+    positional_postings = {document_id: sorted(rng.sample(range(1000), rng.randint(1, 20)))
+                           for document_id in document_ids}
+    encoded = postings.encode_positions(positional_postings)
+    assert postings.decode_positions(document_ids, encoded) == positional_postings
+
+
+def test_bitmap_round_trip(rng):
+    for size in [0, 1, 100]:
+        document_ids = random_posting_list(rng, size, 5000)
+        assert postings.from_bitmap(postings.to_bitmap(document_ids)) == document_ids
+    assert postings.to_bitmap([0, 3, 64]) == 1 | 8 | 1 << 64
+
+
+@pytest.fixture(scope='module')
+def tfidf_matrix(collection):
+    return tfidf.TfIdfMatrix(catalog.StatisticsCatalog(collection.document_ids,
+                                                       collection.term_arrays('filtered_term_ids')))
+
+
+def random_ranked_queries(rng: random.Random, statistics: catalog.StatisticsCatalog, count: int) -> list[dict]:
+    """
+    Draws queries of one to six terms of the collection with weights as the Vector Space Model assigns them.
+    """
+    terms = [term for term in range(len(statistics.document_frequencies)) if statistics.document_frequency(term)]
+    return [{term: rng.choice([0.5, 0.75, 1.0]) for term in rng.sample(terms, rng.randint(1, 6))}
+            for _ in range(count)]
+
+
+def assert_same_top_k(top_documents: list[tuple], scores, k: int):
+    """
+    Checks a top-k result against exhaustive scores. Rows may differ among documents with equal scores.
+    """
+    exhaustive = ranking.dense_top_k(scores, k)
+    assert [score for score, _ in top_documents] == pytest.approx([score for score, _ in exhaustive])
+    for score, row in top_documents:
+        assert score == pytest.approx(scores[row])
+
+
+def test_top_k_algorithms_match_exhaustive_scoring(tfidf_matrix):
+    rng = random.Random(7)
+    model = models.VectorSpaceModel()
+    for query_weights in random_ranked_queries(rng, tfidf_matrix.statistics, 600):
+        k = rng.choice([1, 5, 10, 50])
+        scores = tfidf_matrix.score(query_weights)
+        query_postings = model.query_postings(tfidf_matrix, query_weights)
+        assert_same_top_k(ranking.wand(query_postings, k, block_max=False)[0], scores, k)
+        assert_same_top_k(ranking.wand(query_postings, k, block_max=True)[0], scores, k)
+        assert_same_top_k(ranking.buckley_lewit(tfidf_matrix, model.query_term_weights(tfidf_matrix, query_weights),
+                                                k), scores, k)
+
+
+def test_tfidf_columns_are_cached_until_the_catalog_changes(collection):
+    rng = random.Random(8)
+    term_arrays = collection.term_arrays('filtered_term_ids')
+    statistics = catalog.StatisticsCatalog(collection.document_ids, term_arrays)
+    matrix = tfidf.TfIdfMatrix(statistics)
+    term = term_arrays[0][0]
+    assert matrix.column(term)[1] is matrix.column(term)[1]
+    rows, weights = matrix.column(term)
+    statistics.delete_document(collection.document_ids[0], term_arrays[0])
+    assert 0 not in matrix.column(term)[0] and len(matrix.column(term)[0]) == len(rows) - 1
+    assert np.array_equal(matrix.column(term)[1], tfidf.TfIdfMatrix(statistics).column(term)[1])
+
+    queries = random_ranked_queries(rng, statistics, 20)
+    batch_scores = models.VectorSpaceModel().match_batch(matrix, queries)
+    for query_weights, scores in zip(queries, batch_scores.T):
+        assert scores == pytest.approx(matrix.score(query_weights))
+
+
+def test_cluster_report_scores_exhaustive_batch(irs, capsys):
+    reports.cluster_report(irs, reports.benchmark_queries(ir_system.load_ground_truth_inline())[:50])
+    assert 'exhaustive' in capsys.readouterr().out
+
+
+def test_impact_index_round_trip_and_bm25_scores(irs):
+    view = indexing.VIEW_FILTERED
+    impact_index = irs.impact_indexes[view]
+    loaded = bm25.ImpactIndex.load(ir_system.impacts_path(view), irs.statistics[view])
+    assert loaded.is_index_of_catalog() and loaded.scale == impact_index.scale
+    assert loaded.segments.keys() == impact_index.segments.keys()
+    for term, segments in impact_index.segments.items():
+        assert [(impact, rows.tolist()) for impact, rows in loaded.segments[term]] == \
+            [(impact, rows.tolist()) for impact, rows in segments]
+
+    irs.model = models.BM25Model()
+    query = irs.compile_query('fox', False, True)
+    terms, rows, tfs = irs.statistics[view].entries()
+    term = query.terms[0]
+    exact = dict(zip(rows[terms == term].tolist(),
+                     impact_index.bm25(terms[terms == term], tfs[terms == term],
+                                       irs.statistics[view].document_lengths[rows[terms == term]]).tolist()))
+    results = irs.score_at_a_time_search(query, False, True)
+    assert results
+    for score, document_id in results:
+        assert exact[irs.statistics[view].row_of(document_id)] == pytest.approx(score, abs=1 / impact_index.scale)
+
+
+def test_stored_indexes_are_loaded_on_first_use(irs):
+    system = ir_system.InformationRetrievalSystem()
+    try:
+        assert not (system.statistics or system.impact_indexes or system.cluster_indexes or system.lsi_indexes or
+                    system.minhash_indexes or system.tfidf_matrices)
+        for search_system in [irs, system]:
+            search_system.model = models.BM25Model()
+        query = system.compile_query('fox', False, True)
+        assert system.score_at_a_time_search(query, False, True) == irs.score_at_a_time_search(query, False, True)
+        assert list(system.statistics) == list(system.impact_indexes) == [indexing.VIEW_FILTERED]
+        assert not system.cluster_indexes and not system.lsi_indexes
+
+        assert system.near_duplicates == irs.near_duplicates and system.near_duplicates_stored
+        system.load_derived_indexes()
+        for view in indexing.VIEWS:
+            assert np.array_equal(system.statistics[view].document_ids, irs.statistics[view].document_ids)
+            assert system.cluster_indexes[view].assignments == irs.cluster_indexes[view].assignments
+    finally:
+        system.inverted_index.close()
+        system.collection.close()
+
+
+def test_lsi_and_minhash_round_trip(irs, rng):
+    view = indexing.VIEW_FILTERED
+    statistics = irs.statistics[view]
+    irs.delete_document(int(statistics.document_ids[3]))
+    irs.save_statistics()
+
+    lsi_index = irs.lsi_indexes[view]
+    loaded = lsi.LatentSemanticIndex.load(ir_system.INDEX_PATH, view, statistics)
+    assert loaded.is_index_of_catalog()
+    for query_weights in random_ranked_queries(rng, statistics, 20):
+        scores = dict(zip(lsi_index.document_ids.tolist(), lsi_index.score(query_weights)))
+        assert loaded.score(query_weights) == pytest.approx([scores[document_id]
+                                                             for document_id in loaded.document_ids.tolist()], abs=1e-6)
+
+    minhash_index = irs.minhash_indexes[view]
+    loaded = minhash.MinHashIndex.load(ir_system.minhash_path(view))
+    assert loaded.is_index_of(irs.collection.document_ids)
+    for document_id in irs.collection.document_ids.tolist():
+        assert np.array_equal(loaded.sketches[document_id], minhash_index.sketches[document_id])
+        assert loaded.similar(document_id, irs.term_ids_of(view)) == \
+            minhash_index.similar(document_id, irs.term_ids_of(view))
+
+
+def test_added_and_deleted_documents_in_every_search(irs):
+    """
+    A document is added and deleted again; every search path and the similarity search see both changes.
+    """
+    original = irs.collection.get(int(irs.collection.document_ids[10]))
+    document_id = irs.add_document('The Zyxquorp', original.raw_text + ' zyxquorp').document_id
+    irs.output_k = 10
+    searches = [(models.LinearBooleanModel(), irs.basic_query_search),
+                (models.InvertedListBooleanModel(), irs.inverted_list_search),
+                (models.SignatureBasedBooleanModel(), irs.signature_search),
+                (models.VectorSpaceModel(), irs.buckley_lewit_search), (models.VectorSpaceModel(), irs.wand_search),
+                (models.VectorSpaceModel(), irs.tiered_search),
+                (models.VectorSpaceModel(), functools.partial(irs.cluster_search, probes=irs.output_k)),
+                (models.BM25Model(), irs.score_at_a_time_search)]
+
+    def hits(model, search, query: str, stemming: bool) -> list:
+        irs.model = model
+        return [hit for score, hit in search(irs.compile_query(query, stemming, True), stemming, True) if score > 0]
+
+    lsi_query = ' '.join(original.filtered_terms[:40])
+    for stemming in [False, True]:
+        for model, search in searches:
+            assert hits(model, search, 'zyxquorp', stemming) == [document_id], search
+        assert set(hits(models.LSIModel(), irs.lsi_search, lsi_query, stemming)[:2]) == {document_id,
+                                                                                          original.document_id}
+        assert original.document_id in dict(map(reversed, irs.similar_documents(document_id, stemming)))
+    assert irs.near_duplicates[document_id] == {original.document_id}
+
+    irs.delete_document(document_id)
+    for stemming in [False, True]:
+        for model, search in searches:
+            assert hits(model, search, 'zyxquorp', stemming) == [], search
+        assert document_id not in hits(models.LSIModel(), irs.lsi_search, lsi_query, stemming)
+        assert document_id not in dict(map(reversed, irs.similar_documents(original.document_id, stemming)))
+    assert document_id not in irs.near_duplicates.get(original.document_id, ())
+
+
+def test_sparse_centroids_match_dense_computation(collection, tmp_path):
+    statistics = catalog.StatisticsCatalog(collection.document_ids, collection.term_arrays('filtered_term_ids'))
+    terms, rows, tfs = statistics.entries()
+    weights = clustering.document_weights(statistics, terms, rows, tfs)
+    clusters = rows % 7
+    dense = np.zeros((7, int(terms.max()) + 1))
+    np.add.at(dense, (clusters, terms), weights)
+    dense /= np.linalg.norm(dense, axis=1, keepdims=True)
+
+    centroids = clustering.SparseCentroids.of_clusters(7, terms, clusters, weights, term_limit=len(terms))
+    sparse = np.zeros_like(dense)
+    sparse[centroids.clusters, centroids.terms] = centroids.weights
+    assert sparse == pytest.approx(dense)
+    similarities = np.zeros((statistics.row_count, 7))
+    np.add.at(similarities, rows, weights[:, None] * dense[:, terms].T)
+    assert centroids.similarities(terms, rows, weights, statistics.row_count) == pytest.approx(similarities)
+
+    # Truncated centroids keep the highest-weighted terms of each cluster.
+    truncated = clustering.SparseCentroids.of_clusters(7, terms, clusters, weights)
+    for cluster in range(7):
+        kept = truncated.terms[truncated.clusters == cluster]
+        assert len(kept) == clustering.CENTROID_TERMS
+        assert dense[cluster, kept].min() >= np.delete(dense[cluster], kept).max()
+
+    cluster_index = clustering.ClusterIndex.build(statistics)
+    cluster_index.save(str(tmp_path / 'clusters.npz'))
+    loaded = clustering.ClusterIndex.load(str(tmp_path / 'clusters.npz'), statistics)
+    assert loaded.assignments == cluster_index.assignments and len(loaded.centroids) == len(cluster_index.centroids)
+    assert loaded.centroid_similarities(terms[:20], weights[:20]) == \
+        pytest.approx(cluster_index.centroid_similarities(terms[:20], weights[:20]), abs=1e-6)
+
+
+def random_document(rng: random.Random, document_id: int, sources: list):
+    """
+    Creates a processed document from the shuffled words of two source documents.
+    """
+    words = [word for source in rng.sample(sources, 2) for word in source.terms]
+    rng.shuffle(words)
+    document = extraction.create_document(document_id, 'new fable', ' '.join(words))
+    document.filtered_terms = cleanup.remove_stop_words_from_term_list(document.terms)
+    porter.stem_all_documents([document])
+    return document
+
+
+@pytest.mark.filterwarnings('error::pytest.PytestUnhandledThreadExceptionWarning')
+def test_deletes_during_background_merge(collection, tmp_path):
+    rng = random.Random(5)
+    index = indexing.SegmentedIndex(str(tmp_path), merge_factor=2)
+    index.rebuild(collection)
+    try:
+        documents = list(collection)
+        for document_id in range(collection.next_document_id, collection.next_document_id + 32):
+            document = random_document(rng, document_id, documents)
+            documents.append(document)
+            index.add_documents([document])
+        index.merge_in_background()
+        deleted = set()
+        for document in rng.sample(documents, 40):
+            assert index.delete_document(document.document_id)
+            deleted.add(document.document_id)
+        index.wait_for_merges()
+        index.merge()
+        assert len(index.segments) < 8
+        assert index.document_count == len(documents) - len(deleted)
+        view = index.view(indexing.VIEW_FILTERED)
+        for term in {term for document in rng.sample(documents, 10) for term in document.filtered_term_ids}:
+            assert view.get(term, []) == sorted(d.document_id for d in documents
+                                                if d.document_id not in deleted and term in d.filtered_term_ids)
+    finally:
+        index.close()
+
+
+def test_cursor_keeps_merged_segments_open(collection, tmp_path):
+    rng = random.Random(6)
+    index = indexing.SegmentedIndex(str(tmp_path), merge_factor=2)
+    try:
+        documents = [random_document(rng, document_id, list(collection)) for document_id in range(8)]
+        for document in documents:
+            index.add_documents([document])
+        term = documents[-1].filtered_term_ids[0]
+        expected = [d.document_id for d in documents if term in d.filtered_term_ids]
+        view = index.view(indexing.VIEW_FILTERED)
+        with view.cursor(term) as cursor:
+            index.merge()
+            assert len(index.segments) == 1
+            # The retired segments are still open for the cursor.
+            assert [cursor.seek(document_id) for document_id in expected] == expected
+            assert len(os.listdir(tmp_path)) > 2 + len(indexing.VIEWS)
+        # Once released, the retired segment files are gone: only the manifest and the merged segment remain.
+        assert len(os.listdir(tmp_path)) == 2 + len(indexing.VIEWS)
+        with view.cursor(term) as cursor:
+            assert [cursor.seek(document_id) for document_id in expected] == expected
+    finally:
+        index.close()
+
+
+def random_boolean_query(rng: random.Random, documents: list, depth: int = 0) -> str:
+    """
+    Builds a random query of terms, phrases, NOT, AND and OR from the words of the given documents.
+    """
+    if depth >= 2 or rng.random() < 0.4:
+        document = rng.choice(documents)
+        if rng.random() < 0.15:
+            # Phrases of the unfiltered words, which may hold stop words.
+            start = rng.randrange(len(document.terms))
+            operand = f'"{" ".join(document.terms[start:start + rng.randint(2, 4)])}"'
+        else:
+            operand = rng.choice(document.filtered_terms)
+        return f'-{operand}' if rng.random() < 0.2 else operand
+    operator = rng.choice([' & ', ' | '])
+    children = [random_boolean_query(rng, documents, depth + 1) for _ in range(rng.randint(2, 3))]
+    query = f'({operator.join(children)})'
+    return f'-{query}' if rng.random() < 0.1 else query
+
+
+def test_boolean_models_agree_after_adds_and_deletes(collection, tmp_path):
+    rng = random.Random(11)
+    store = document_store.DocumentStore(collection)
+    index = indexing.SegmentedIndex(str(tmp_path))
+    index.rebuild(store)
+    inverted_model = models.InvertedListBooleanModel()
+    linear_model = models.LinearBooleanModel()
+    signature_model = models.SignatureBasedBooleanModel()
+    signature_model.F, signature_model.m, signature_model.document_F = 32, 4, 64  # Small signatures for false drops.
+    stop_words = frozenset(cleanup.load_filter_stop_words())
+    try:
+        for round_index in range(4):
+            for _ in range(5):
+                document = random_document(rng, store.next_document_id, list(store))
+                index.add_documents([document])
+                store.append(document)
+            for document_id in rng.sample(list(store.document_ids), 5):
+                index.delete_document(document_id)
+                store.delete(document_id)
+            if round_index % 2:
+                index.merge_in_background()
+                index.wait_for_merges()
+            signature_model.organization = [signatures.ORGANIZATION_SEQUENTIAL,
+                                            signatures.ORGANIZATION_BIT_SLICED][round_index % 2]
+
+            term_arrays = store.term_arrays('filtered_term_ids')
+            signature_file = signature_model.signature_file(term_arrays)
+            view = index.view(indexing.VIEW_FILTERED)
+            documents = list(store)
+            for _ in range(200):
+                query = term_dictionary.bind_query(query_compiler.compile_query(
+                    random_boolean_query(rng, documents), stop_words=stop_words))
+                linear = [document_id for document_id, terms in zip(store.document_ids, term_arrays)
+                          if linear_model.evaluate(terms, query.tree)]
+                possible, certain = signature_model.evaluate(signature_file, query.tree)
+                signature = [document_id for document_id, terms, may_match, must_match
+                             in zip(store.document_ids, term_arrays, possible.tolist(), certain.tolist())
+                             if must_match or may_match and signature_model.verify(terms, query.tree)]
+                assert inverted_model.match(view, query) == linear == signature, query.text
+    finally:
+        index.close()
+
+
+def from_words(words) -> int:
+    return sum(int(word) << (signatures.WORD_BITS * index) for index, word in enumerate(words))
+
+
+def test_term_signatures_and_packing(rng):
+    for signature_size, weight in [(16, 3), (64, 12), (100, 7), (512, 4)]:
+        for term in rng.sample(range(100000), 50):
+            signature = signatures.term_signature(term, signature_size, weight)
+            assert bin(signature).count('1') == weight and signature < 1 << signature_size
+            assert signature == signatures.term_signature(term, signature_size, weight)
+            words = signatures.to_words(signature, signature_size)
+            assert len(words) == signatures.word_count(signature_size) and from_words(words) == signature
+
+
+def test_signature_file_round_trip(rng):
+    model = models.SignatureBasedBooleanModel()
+    model.D, model.F, model.m, model.document_F, model.document_m = 3, 100, 7, 200, 3
+    term_lists = [[rng.randrange(500) for _ in range(rng.choice([0, 1, 5, 40]))] for _ in range(150)]
+    signature_file = signatures.SignatureFile.build(term_lists, model.hash_function, model.D, model.F,
+                                                    model.document_F)
+    blocks = [terms[start:start + model.D] for terms in term_lists for start in range(0, len(terms), model.D)]
+    assert [from_words(words) for words in signature_file.blocks] == [
+        functools.reduce(operator.or_, map(model.hash_function, block)) for block in blocks]
+    assert [from_words(words) for words in signature_file.documents] == [
+        functools.reduce(operator.or_, (model.hash_function(term, signatures.LEVEL_DOCUMENTS) for term in terms), 0)
+        for terms in term_lists]
+
+    bit_sliced_file = signatures.BitSlicedSignatureFile.transpose(signature_file)
+    for term in rng.sample(range(600), 100):
+        for level in [signatures.LEVEL_DOCUMENTS, signatures.LEVEL_BLOCKS]:
+            signature = model.hash_function(term, level)
+            row_count = len(signature_file.documents if level == signatures.LEVEL_DOCUMENTS else blocks)
+            rows = np.array(sorted(rng.sample(range(row_count), 20)))
+            assert np.array_equal(bit_sliced_file.contains(level, signature),
+                                  signature_file.contains(level, signature))
+            assert np.array_equal(bit_sliced_file.contains(level, signature, rows),
+                                  signature_file.contains(level, signature, rows))
+        matches = signature_file.matching_documents(model.hash_function(term, signatures.LEVEL_DOCUMENTS),
+                                                    model.hash_function(term))
+        assert np.array_equal(bit_sliced_file.matching_documents(
+            model.hash_function(term, signatures.LEVEL_DOCUMENTS), model.hash_function(term)), matches)
+        assert all(matches[row] for row, terms in enumerate(term_lists) if term in terms)
+
+
+@pytest.mark.parametrize('method', [pruning.PRUNING_TERM, pruning.PRUNING_GLOBAL])
+def test_pruning_keeps_budget_and_unpruned_weights(collection, method):
+    rng = random.Random(13)
+    term_arrays = collection.term_arrays('filtered_term_ids')
+    statistics = catalog.StatisticsCatalog(collection.document_ids, term_arrays)
+    # Changes to the catalog after pruning, which prune() picks up.
+    pruned_matrix = pruning.PrunedTfIdfMatrix(statistics, 0.3, method)
+    for row in rng.sample(range(len(collection)), 5):
+        statistics.delete_document(collection.document_ids[row], term_arrays[row])
+    statistics.add_documents([collection.next_document_id + i for i in range(5)], rng.sample(term_arrays, 5))
+    pruned_matrix.prune()
+
+    matrix = tfidf.TfIdfMatrix(statistics)
+    terms, _, _ = statistics.entries()
+    posting_count = len(terms)
+    assert pruned_matrix.posting_count == int(np.ceil(0.3 * posting_count))
+    for term in np.unique(terms).tolist():
+        rows, weights = matrix.column(term)
+        pruned_rows, pruned_weights = pruned_matrix.column(term)
+        positions = np.searchsorted(rows, pruned_rows)
+        assert np.array_equal(rows[positions], pruned_rows)
+        assert pruned_weights == pytest.approx(weights[positions])
+        # Both methods prune the lowest weights of a term first.
+        assert np.sort(pruned_weights) == pytest.approx(np.sort(weights)[len(weights) - len(pruned_weights):])
+
+    unpruned_matrix = pruning.PrunedTfIdfMatrix(statistics, 1.0, method)
+    assert unpruned_matrix.posting_count == posting_count
+    for query_weights in random_ranked_queries(rng, statistics, 50):
+        assert unpruned_matrix.score(query_weights) == pytest.approx(matrix.score(query_weights))
@@ -0,0 +1,144 @@
+# Contains the TF-IDF weighting of the term-document matrix that the Vector Space Model scores queries on.
+import numpy as np
+
+import ranking
+from catalog import StatisticsCatalog
+
+# Growth of the tiers of the tiered index: tier 1 holds the r highest-weight postings of a term (its champion list),
+# every further tier TIER_GROWTH times as many as the one before.
+TIER_GROWTH = 4
+
+
+class TfIdfMatrix(object):
+    """
+    Sparse term-document matrix of normalized TF-IDF weights: one column per term ID, one row per document of a
+    statistics catalog (see catalog.StatisticsCatalog). The weight of term t in document d is tf(t, d) * log(N / df(t)),
+    divided by the Euclidean norm of the weight vector of d. The weighted columns are derived from the catalog's term
+    frequencies, IDFs and norms once and kept until the catalog changes, so the matrix stays valid when documents are
+    added or deleted; scoring a query only touches the columns of its terms.
+    """
+
+    def __init__(self, statistics: StatisticsCatalog):
+        """
+        :param statistics: Catalog of the term view to weight
+        """
+        self.statistics = statistics
+        self._derived_columns = {}  # Weighted columns in all layouts, valid for one version of the catalog.
+        self._derived_version = statistics.version
+
+    @property
+    def document_ids(self) -> np.ndarray:
+        return self.statistics.document_ids
+
+    @property
+    def document_count(self) -> int:
+        """
+        Number of rows of the matrix. Rows of deleted documents are part of the matrix but have no entries.
+        """
+        return self.statistics.row_count
+
+    def column(self, term: int) -> tuple:
+        """
+        Returns the non-zero entries of a term's column. The weights are computed once per term and kept until the
+        catalog changes.
+        :param term: The term ID
+        :return: Rows of the documents that contain the term, and the term's weights in them
+        """
+        def weighted_column():
+            rows, tfs = self.statistics.column(term)
+            weights = tfs * self.term_weight(term)
+            norms = self.statistics.norms(rows)
+            return rows, np.divide(weights, norms, out=np.zeros_like(weights), where=norms > 0)
+        return self._derived_column('weights', term, weighted_column)
+
+    def impact_column(self, term: int) -> tuple:
+        """
+        Returns the non-zero entries of a term's column in impact order, i.e. sorted by descending weight. The order
+        is computed once per term and kept until the catalog changes.
+        :param term: The term ID
+        :return: Rows of the documents that contain the term, and the term's weights in them
+        """
+        def impact_order():
+            rows, weights = self.column(term)
+            order = np.argsort(-weights, kind='stable')
+            return rows[order], weights[order]
+        return self._derived_column('impact', term, impact_order)
+
+    def tiers(self, term: int, champion_list_size: int) -> list[tuple]:
+        """
+        Splits a term's impact-ordered column into the tiers of a tiered index. Tier 1 is the champion list of the
+        term, the champion_list_size postings with the highest weights; each lower tier holds TIER_GROWTH times as
+        many postings as the tier above.
+        :param term: The term ID
+        :param champion_list_size: Number of postings in tier 1 (r)
+        :return: List of (rows, weights) tuples, one per tier
+        """
+        rows, weights = self.impact_column(term)
+        tiers, start, size = [], 0, max(champion_list_size, 1)
+        while start < len(rows):
+            tiers.append((rows[start:start + size], weights[start:start + size]))
+            start, size = start + size, size * TIER_GROWTH
+        return tiers
+
+    def postings(self, term: int) -> ranking.TermPostings:
+        """
+        Returns a term's column as document-ordered postings with block maxima for WAND and Block-Max WAND (see
+        ranking.wand()). They are built once per term and kept until the catalog changes.
+        :param term: The term ID
+        """
+        return self._derived_column('postings', term, lambda: ranking.TermPostings(*self.column(term)))
+
+    def _derived_column(self, layout: str, term: int, build):
+        if self._derived_version != self.statistics.version:
+            self._derived_columns = {}
+            self._derived_version = self.statistics.version
+        if (layout, term) not in self._derived_columns:
+            self._derived_columns[layout, term] = build()
+        return self._derived_columns[layout, term]
+
+    def _gather(self, query_weights: dict[int, float]) -> tuple:
+        """
+        Gathers the columns of the query terms, multiplied by the query term weights and IDFs.
+        :return: Rows and weighted values of all gathered entries
+        """
+        rows, values = [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+        for term, weight in query_weights.items():
+            term_rows, term_data = self.column(term)
+            if len(term_rows):
+                rows.append(term_rows)
+                values.append(term_data * (weight * self.term_weight(term)))
+        return np.concatenate(rows), np.concatenate(values)
+
+    def score(self, query_weights: dict[int, float]) -> np.ndarray:
+        """
+        Scores all documents for one query with a single sparse gather and sum over the query's columns.
+        :param query_weights: Dictionary that maps query term IDs to their weights in the query (without IDF)
+        :return: Score of every document, in row order
+        """
+        rows, values = self._gather(query_weights)
+        return np.bincount(rows, weights=values, minlength=self.document_count)
+
+    def score_batch(self, queries: list[dict[int, float]]) -> np.ndarray:
+        """
+        Scores all documents for a batch of queries as one sparse matrix-matrix product of the document matrix and the
+        query matrix.
+        :param queries: Query term weights (see score()) of every query
+        :return: Array of shape (documents, queries) with the score of every document for every query
+        """
+        rows, values, query_columns = [], [], []
+        for query_index, query_weights in enumerate(queries):
+            query_rows, query_values = self._gather(query_weights)
+            rows.append(query_rows)
+            values.append(query_values)
+            query_columns.append(np.full(len(query_rows), query_index, dtype=np.int64))
+        if not queries:
+            return np.zeros((self.document_count, 0))
+        cells = np.concatenate(rows) * len(queries) + np.concatenate(query_columns)
+        scores = np.bincount(cells, weights=np.concatenate(values), minlength=self.document_count * len(queries))
+        return scores.reshape(self.document_count, len(queries))
+
+    def term_weight(self, term: int) -> float:
+        """
+        Returns the IDF of a term (0 for terms that occur in no document).
+        """
+        return float(self.statistics.idf([term])[0])